@@ -0,0 +1,87 @@
+"""
+create_team latency as the teams table grows
+
+Pre-fills the teams table in bulk and measures create_team at each size,
+showing that code allocation stays flat as the 6-digit space fills up.
+
+Usage (from the repository root):
+    python -m benchmarks.create_team --sizes 0 25000 50000 100000 150000
+Uses DATABASE_URL when set, otherwise a throwaway SQLite file.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+
+async def prefill(db, database, hackathon_id: int, leader_id: int, count: int) -> None:
+    """Insert ``count`` teams with distinct unused codes, bypassing create_team"""
+    if count <= 0:
+        return
+    codes = [f'{n:06d}' for n in random.sample(range(10 ** 6), count * 2)]
+    rows = [(hackathon_id, f'bench-{code}', code, leader_id) for code in codes]
+    
+    if database.USE_POSTGRES:
+        async with db.pool.acquire() as conn:
+            await conn.execute('CREATE TEMP TABLE bench_codes (hackathon_id INT, name TEXT, code TEXT, leader_id BIGINT)')
+            await conn.copy_records_to_table('bench_codes', records=rows)
+            await conn.execute(f'''
+                INSERT INTO teams (hackathon_id, name, code, leader_id)
+                SELECT b.hackathon_id, b.name, b.code, b.leader_id FROM bench_codes b
+                WHERE NOT EXISTS (SELECT 1 FROM teams t WHERE t.code = b.code)
+                LIMIT {count}
+                ON CONFLICT (code) DO NOTHING
+            ''')
+            await conn.execute('DROP TABLE bench_codes')
+    else:
+        async with db.sqlite.write() as conn:
+            async with conn.execute('SELECT code FROM teams') as cursor:
+                taken = {row[0] for row in await cursor.fetchall()}
+            fresh = [row for row in rows if row[2] not in taken][:count]
+            await conn.executemany(
+                'INSERT INTO teams (hackathon_id, name, code, leader_id) VALUES (?, ?, ?, ?)', fresh
+            )
+            await conn.commit()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[0, 25000, 50000, 100000, 150000])
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+    
+    if not os.getenv('DATABASE_URL'):
+        os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    
+    import database
+    
+    db = database.Database()
+    await db.connect()
+    await db.create_user(1, 'bench', 'Bench', 'Leader', None, None, None)
+    hackathon = await db.create_hackathon('Benchmark', '', None, None)
+    
+    current = await db.count_all_teams()
+    print(f"{'teams':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for size in sorted(args.sizes):
+        await prefill(db, database, hackathon['id'], 1, size - current)
+        
+        timings = []
+        for _ in range(args.samples):
+            started = time.perf_counter()
+            await db.create_team(hackathon['id'], 'bench', 1)
+            timings.append((time.perf_counter() - started) * 1000)
+        current = await db.count_all_teams()
+        
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{size:>8} {statistics.median(timings):>8.2f} {p95:>8.2f} {timings[-1]:>8.2f}")
+    
+    await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,367 @@
+"""
+Latency of every Database method against a synthetic dataset
+
+Loads a generated dataset (see benchmarks/dataset.py), then calls each
+Database method with arguments drawn from it and reports p50/p95/mean
+latency. Reads run first and writes afterwards, so reads see the dataset
+as generated; writes work on rows of their own where they would otherwise
+disturb it. Methods of Database without a case here are listed, so a new
+method can't quietly go unbenchmarked.
+
+--save writes the results to a JSON baseline (one entry per backend);
+--baseline compares against one and exits with status 1 when a method's
+p50 regressed by more than --tolerance.
+
+Usage (from the repository root):
+    python -m benchmarks.datalayer --backend both --save benchmarks/baseline.json
+    python -m benchmarks.datalayer --backend both --baseline benchmarks/baseline.json
+SQLite runs on a throwaway file; PostgreSQL uses DATABASE_URL, which should
+point at an empty database (or pass --reset to drop the bot's tables first).
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List
+
+from benchmarks import dataset
+
+# Lifecycle methods, not queries
+NOT_BENCHMARKED = {'connect', 'close'}
+
+# Regressions smaller than this are timer noise whatever the ratio
+MIN_REGRESSION_MS = 0.2
+
+
+class Case:
+    """One Database method and how to call it"""
+
+    def __init__(self, method: str, call: Callable[[], Awaitable[Any]], heavy: bool = False):
+        self.method = method
+        self.call = call
+        # Whole-table and whole-hackathon reads get fewer iterations
+        self.heavy = heavy
+
+
+def build_cases(db, data: dataset.Dataset, rng: random.Random) -> List[Case]:
+    """Every benchmarked method, reads first, with arguments from the dataset"""
+    today = date.today()
+    fresh_users: List[int] = []
+    members_added: List[tuple] = []
+    registered: List[tuple] = []
+    extra_stages: List[int] = []
+    next_user = [max(data.user_ids) + 1]
+    stage_number = [100]
+
+    def user() -> int:
+        return rng.choice(data.user_ids)
+
+    def hackathon() -> int:
+        return rng.choice(data.hackathon_ids)
+
+    def stage() -> int:
+        return rng.choice(data.stage_ids)
+
+    def team() -> int:
+        return rng.choice(data.team_ids)
+
+    def registration() -> tuple:
+        return rng.choice(data.registrations)
+
+    async def create_user():
+        user_id = next_user[0]
+        next_user[0] += 1
+        fresh_users.append(user_id)
+        await db.create_user(user_id, f'bench{user_id}', 'Bench', 'User', '2000-01-01',
+                             '+998901234567', '12345678901234')
+
+    async def add_team_member():
+        pair = (team(), rng.choice(fresh_users))
+        members_added.append(pair)
+        await db.add_team_member(*pair)
+
+    async def remove_team_member():
+        await db.remove_team_member(*members_added.pop())
+
+    async def register_user_for_hackathon():
+        row = (rng.choice(fresh_users), hackathon(), team())
+        registered.append(row)
+        await db.register_user_for_hackathon(*row)
+
+    async def remove_registration():
+        user_id, hackathon_id, _ = registered.pop()
+        await db.remove_registration(user_id, hackathon_id)
+
+    async def create_submission():
+        user_id, hackathon_id, _ = registration()
+        stage_id = rng.choice(data.stages_by_hackathon[hackathon_id])
+        await db.create_submission(user_id, stage_id, f'https://github.com/bench/{user_id}', 'bench')
+
+    async def set_submission_file():
+        user_id, hackathon_id, _ = registration()
+        stage_id = rng.choice(data.stages_by_hackathon[hackathon_id])
+        await db.set_submission_file(user_id, stage_id, 'bench-file', 'stored', 'ab' * 32, 1024)
+
+    async def record_stage_results():
+        hackathon_id = hackathon()
+        stage_id = rng.choice(data.stages_by_hackathon[hackathon_id])
+        teams = {team_id for _, registered, team_id in data.registrations if registered == hackathon_id}
+        await db.record_stage_results(stage_id, hackathon_id, set(rng.sample(sorted(teams), len(teams) // 2)))
+
+    async def create_stage():
+        stage_number[0] += 1
+        stage = await db.create_stage(hackathon(), stage_number[0], 'Bench stage', 'Bench task',
+                                      today.isoformat(), (today + timedelta(days=7)).isoformat())
+        extra_stages.append(stage['id'])
+
+    async def iter_hackathon_submissions():
+        async for _ in db.iter_hackathon_submissions(hackathon()):
+            pass
+
+    async def save_persistence_batch():
+        users = [user() for _ in range(20)]
+        await db.save_persistence_batch(
+            [('registration', json.dumps([user_id, user_id]), '1') for user_id in users[:10]],
+            [('registration', json.dumps([user_id, user_id])) for user_id in users[10:]],
+            [(user_id, json.dumps({'language': 'en'})) for user_id in users],
+            [],
+        )
+
+    return [
+        # ---- reads ----
+        Case('get_user', lambda: db.get_user(user())),
+        Case('count_users', lambda: db.count_users()),
+        Case('get_all_users', lambda: db.get_all_users(), heavy=True),
+        Case('get_hackathon', lambda: db.get_hackathon(hackathon())),
+        Case('get_active_hackathons', lambda: db.get_active_hackathons()),
+        Case('get_all_hackathons', lambda: db.get_all_hackathons()),
+        Case('get_team', lambda: db.get_team(team())),
+        Case('get_team_by_code', lambda: db.get_team_by_code(rng.choice(data.team_codes))),
+        Case('get_team_members', lambda: db.get_team_members(team())),
+        Case('get_team_roster', lambda: db.get_team_roster(team())),
+        Case('count_teams', lambda: db.count_teams(hackathon())),
+        Case('count_all_teams', lambda: db.count_all_teams()),
+        Case('get_user_hackathon_registration',
+             lambda: db.get_user_hackathon_registration(*registration()[:2])),
+        Case('get_my_hackathon_view', lambda: db.get_my_hackathon_view(*registration()[:2])),
+        Case('get_user_registrations', lambda: db.get_user_registrations(user())),
+        Case('get_user_registrations_detailed', lambda: db.get_user_registrations_detailed(user())),
+        Case('get_hackathon_participants', lambda: db.get_hackathon_participants(hackathon()), heavy=True),
+        Case('get_hackathon_recipients', lambda: db.get_hackathon_recipients(hackathon()), heavy=True),
+        Case('get_participants_without_submission',
+             lambda: db.get_participants_without_submission(*rng.choice(
+                 [(hackathon_id, stage_id) for hackathon_id, stage_ids in data.stages_by_hackathon.items()
+                  for stage_id in stage_ids])), heavy=True),
+        Case('get_stage', lambda: db.get_stage(stage())),
+        Case('get_hackathon_stages', lambda: db.get_hackathon_stages(hackathon())),
+        Case('get_submission', lambda: db.get_submission(registration()[0], stage())),
+        Case('get_stage_submissions', lambda: db.get_stage_submissions(stage()), heavy=True),
+        Case('iter_hackathon_submissions', iter_hackathon_submissions, heavy=True),
+        Case('load_conversation_states', lambda: db.load_conversation_states(), heavy=True),
+        Case('load_user_data', lambda: db.load_user_data(), heavy=True),
+        Case('get_pending_submission_files', lambda: db.get_pending_submission_files()),
+        Case('get_stage_team_scores', lambda: db.get_stage_team_scores(stage())),
+        Case('get_hackathon_team_scores', lambda: db.get_hackathon_team_scores(hackathon())),
+        Case('get_team_names', lambda: db.get_team_names(rng.sample(data.team_ids, 10))),
+        Case('get_job', lambda: db.get_job(rng.randint(1, 100))),
+        Case('get_recent_jobs', lambda: db.get_recent_jobs()),
+        # ---- writes ----
+        Case('create_user', create_user),
+        Case('update_user_language', lambda: db.update_user_language(user(), rng.choice(('en', 'ru', 'uz')))),
+        Case('update_user_field', lambda: db.update_user_field(user(), 'location', 'Samarkand')),
+        Case('create_team', lambda: db.create_team(hackathon(), 'Bench team', user())),
+        Case('add_team_member', add_team_member),
+        Case('remove_team_member', remove_team_member),
+        Case('register_user_for_hackathon', register_user_for_hackathon),
+        Case('remove_registration', remove_registration),
+        Case('create_submission', create_submission),
+        Case('set_submission_file', set_submission_file),
+        Case('set_submission_score', lambda: db.set_submission_score(
+            rng.randint(1, data.counts['submissions']), round(rng.uniform(0, 100), 2))),
+        Case('record_stage_results', record_stage_results, heavy=True),
+        Case('create_job', lambda: db.create_job('bench', 'Bench job', user(), user())),
+        Case('set_job_message', lambda: db.set_job_message(rng.randint(1, 100), rng.randrange(1, 10 ** 6))),
+        Case('start_job', lambda: db.start_job(rng.randint(1, 100))),
+        Case('update_job_progress', lambda: db.update_job_progress(rng.randint(1, 100), rng.randrange(1000), 1000)),
+        Case('finish_job', lambda: db.finish_job(rng.randint(1, 100), 'done', 1000, 1000, 'Sent: 1000')),
+        Case('interrupt_unfinished_jobs', lambda: db.interrupt_unfinished_jobs()),
+        Case('save_persistence_batch', save_persistence_batch),
+        # Catalog writes invalidate the cached hackathons and stages
+        Case('update_hackathon', lambda: db.update_hackathon(hackathon(), description='Updated')),
+        Case('create_hackathon', lambda: db.create_hackathon('Bench', 'Bench', today.isoformat(),
+                                                             (today + timedelta(days=30)).isoformat())),
+        Case('create_stage', create_stage),
+        Case('update_stage_active', lambda: db.update_stage_active(rng.choice(extra_stages), False)),
+    ]
+
+
+def uncovered(database, cases: List[Case]) -> List[str]:
+    """Public query methods of Database that have no case"""
+    methods = {
+        name for name, member in inspect.getmembers(database.Database)
+        if not name.startswith('_') and name not in NOT_BENCHMARKED
+        and (inspect.iscoroutinefunction(member) or inspect.isasyncgenfunction(member))
+    }
+    return sorted(methods - {case.method for case in cases})
+
+
+async def run_cases(cases: List[Case], iterations: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for case in cases:
+        count = max(5, iterations // 10) if case.heavy else iterations
+        await case.call()  # warm up
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            await case.call()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[case.method] = {
+            'calls': count,
+            'p50_ms': statistics.median(timings),
+            'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+            'mean_ms': statistics.fmean(timings),
+        }
+    return results
+
+
+async def run_backend(args) -> dict:
+    import database
+
+    backend = 'postgres' if database.USE_POSTGRES else 'sqlite'
+    if args.reset and database.USE_POSTGRES:
+        await dataset.drop_tables(database)
+
+    db = database.Database()
+    await db.connect()
+    started = time.perf_counter()
+    data = await dataset.generate(db, database, **dataset.sizes(args))
+    load_seconds = time.perf_counter() - started
+
+    cases = build_cases(db, data, random.Random(args.seed))
+    results = await run_cases(cases, args.iterations)
+    missing = uncovered(database, cases)
+    await db.close()
+
+    return {
+        'backend': backend,
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'iterations': args.iterations,
+        'dataset': dataset.sizes(args),
+        'rows': data.counts,
+        'load_seconds': load_seconds,
+        'uncovered': missing,
+        'results': results,
+    }
+
+
+def print_report(report: dict) -> None:
+    rows = report['rows']
+    print(f"\n{report['backend']}: {rows['users']} users, {rows['teams']} teams, "
+          f"{rows['registrations']} registrations, {rows['submissions']} submissions "
+          f"(loaded in {report['load_seconds']:.1f}s)")
+    print(f"{'method':<38} {'calls':>6} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for method, result in report['results'].items():
+        print(f"{method:<38} {result['calls']:>6} {result['p50_ms']:>8.2f} "
+              f"{result['p95_ms']:>8.2f} {result['mean_ms']:>8.2f}")
+    if report['uncovered']:
+        print(f"Not benchmarked: {', '.join(report['uncovered'])}")
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Methods whose p50 regressed against the baseline, as printable lines"""
+    if baseline.get('dataset') != report['dataset']:
+        print(f"warning: {report['backend']} baseline was recorded on a different dataset "
+              f"({baseline.get('dataset')})")
+    regressions = []
+    for method, result in report['results'].items():
+        before = baseline.get('results', {}).get(method)
+        if before is None:
+            continue
+        now, then = result['p50_ms'], before['p50_ms']
+        if now > then * (1 + tolerance) and now - then > MIN_REGRESSION_MS:
+            regressions.append(f"{report['backend']} {method}: p50 {then:.2f} -> {now:.2f} ms "
+                               f"(+{(now / then - 1) * 100:.0f}%)")
+    return regressions
+
+
+def load_baseline(path: str) -> dict:
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--backend', choices=['sqlite', 'postgres', 'both'], default='sqlite')
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='calls per method (a tenth of that for whole-table reads)')
+    parser.add_argument('--save', metavar='FILE', help='write the results into this JSON baseline')
+    parser.add_argument('--baseline', metavar='FILE', help='compare against this JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed p50 slowdown before failing (0.25 = 25%%)')
+    parser.add_argument('--reset', action='store_true',
+                        help="drop the bot's tables on PostgreSQL before loading the dataset")
+    dataset.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.backend == 'both':
+        # Each backend is chosen at import time, so run them in separate processes
+        status = 0
+        for backend in ('sqlite', 'postgres'):
+            command = [sys.executable, '-m', 'benchmarks.datalayer', '--backend', backend]
+            for flag in ('iterations', 'save', 'baseline', 'tolerance', 'users', 'hackathons',
+                         'registrations_per_user', 'team_size', 'stages', 'submission_rate', 'seed'):
+                value = getattr(args, flag)
+                if value is not None:
+                    command += [f"--{flag.replace('_', '-')}", str(value)]
+            if args.reset:
+                command.append('--reset')
+            status = max(status, subprocess.run(command).returncode)
+        sys.exit(status)
+
+    if args.backend == 'postgres':
+        if not os.getenv('DATABASE_URL', '').startswith('postgres'):
+            parser.error('--backend postgres needs DATABASE_URL')
+    else:
+        os.environ['DATABASE_URL'] = ''
+        os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'datalayer.db')
+
+    report = asyncio.run(run_backend(args))
+    print_report(report)
+
+    regressions = []
+    if args.baseline:
+        baseline = load_baseline(args.baseline).get(report['backend'])
+        if baseline is None:
+            print(f"No {report['backend']} entry in {args.baseline}")
+        else:
+            regressions = compare(report, baseline, args.tolerance)
+            for line in regressions:
+                print(f"REGRESSION {line}")
+            if not regressions:
+                print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+    if args.save:
+        saved = load_baseline(args.save)
+        saved[report['backend']] = report
+        with open(args.save, 'w') as f:
+            json.dump(saved, f, indent=2)
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
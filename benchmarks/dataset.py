@@ -0,0 +1,283 @@
+"""
+Synthetic dataset generator for the data layer benchmarks
+
+Bulk-loads users, hackathons with their stages, teams with members,
+registrations, scored submissions (and the leaderboard's team scores) and
+persistence rows, sized from the command line and reproducible from a
+seed. Rows are written straight to the tables (COPY on PostgreSQL,
+executemany on SQLite) so even large datasets load in seconds; ids
+continue after whatever the tables already hold.
+
+Usage (from the repository root):
+    python -m benchmarks.dataset --users 20000 --hackathons 5 --stages 3
+Uses DATABASE_URL when set, otherwise SQLITE_PATH (hackathon_bot.db).
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Tuple
+
+# First generated user id on an empty database, well clear of hand-made test users
+USER_ID_BASE = 1_000_000
+
+SERIAL_TABLES = ('hackathons', 'stages', 'teams', 'team_members', 'registrations', 'submissions')
+
+
+class Dataset:
+    """Ids of the generated rows, for picking benchmark arguments"""
+
+    def __init__(self):
+        self.user_ids: List[int] = []
+        self.hackathon_ids: List[int] = []
+        self.stage_ids: List[int] = []
+        self.stages_by_hackathon: Dict[int, List[int]] = {}
+        self.team_ids: List[int] = []
+        self.team_codes: List[str] = []
+        self.registrations: List[Tuple[int, int, int]] = []  # (user_id, hackathon_id, team_id)
+        self.counts: Dict[str, int] = {}
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Dataset size options, shared with the benchmark suite"""
+    group = parser.add_argument_group('dataset')
+    group.add_argument('--users', type=int, default=20000)
+    group.add_argument('--hackathons', type=int, default=5)
+    group.add_argument('--registrations-per-user', type=int, default=1,
+                       help='hackathons each user registers for')
+    group.add_argument('--team-size', type=int, default=4)
+    group.add_argument('--stages', type=int, default=3, help='stages per hackathon')
+    group.add_argument('--submission-rate', type=float, default=0.6,
+                       help='share of registrants submitting for each stage')
+    group.add_argument('--seed', type=int, default=1)
+
+
+def sizes(args: argparse.Namespace) -> Dict[str, Any]:
+    """The dataset options of parsed arguments, as recorded in a baseline"""
+    return {
+        'users': args.users,
+        'hackathons': args.hackathons,
+        'registrations_per_user': args.registrations_per_user,
+        'team_size': args.team_size,
+        'stages': args.stages,
+        'submission_rate': args.submission_rate,
+        'seed': args.seed,
+    }
+
+
+async def _fetchval(db, database, sql: str) -> Any:
+    if database.USE_POSTGRES:
+        async with db.pool.acquire() as conn:
+            return await conn.fetchval(sql)
+    async with db.sqlite.read() as conn:
+        async with conn.execute(sql) as cursor:
+            row = await cursor.fetchone()
+            return row[0]
+
+
+async def _insert(db, database, table: str, columns: Tuple[str, ...], rows: List[tuple]) -> None:
+    if not rows:
+        return
+    if database.USE_POSTGRES:
+        async with db.pool.acquire() as conn:
+            await conn.copy_records_to_table(table, records=rows, columns=list(columns))
+    else:
+        placeholders = ', '.join('?' for _ in columns)
+        async with db.sqlite.write() as conn:
+            await conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows
+            )
+            await conn.commit()
+
+
+async def generate(db, database, users: int = 20000, hackathons: int = 5,
+                   registrations_per_user: int = 1, team_size: int = 4, stages: int = 3,
+                   submission_rate: float = 0.6, seed: int = 1) -> Dataset:
+    """Load a synthetic dataset into a connected Database"""
+    rng = random.Random(seed)
+    postgres = database.USE_POSTGRES
+    data = Dataset()
+
+    def day(offset: int) -> Any:
+        value = date.today() + timedelta(days=offset)
+        return value if postgres else value.isoformat()
+
+    def flag(value: bool) -> Any:
+        return value if postgres else int(value)
+
+    async def next_id(table: str, column: str = 'id') -> int:
+        return (await _fetchval(db, database, f'SELECT COALESCE(MAX({column}), 0) FROM {table}')) + 1
+
+    # ---- users ----
+    first_user = max(USER_ID_BASE, await next_id('users', 'user_id'))
+    data.user_ids = list(range(first_user, first_user + users))
+    user_rows = [
+        (user_id, f'bench{user_id}', f'First{user_id % 997}', f'Last{user_id % 991}',
+         day(-365 * 20 - user_id % 3650), f'+99890{user_id % 10 ** 7:07d}',
+         f'{user_id:014d}', rng.choice(('male', 'female')), 'Tashkent', rng.choice(('en', 'ru', 'uz')))
+        for user_id in data.user_ids
+    ]
+    await _insert(db, database, 'users',
+                  ('user_id', 'username', 'first_name', 'last_name', 'birth_date', 'phone',
+                   'pinfl', 'gender', 'location', 'language'), user_rows)
+
+    # ---- hackathons and stages (the first stage of each is running) ----
+    first_hackathon = await next_id('hackathons')
+    data.hackathon_ids = list(range(first_hackathon, first_hackathon + hackathons))
+    await _insert(db, database, 'hackathons',
+                  ('id', 'name', 'description', 'start_date', 'end_date', 'prize_pool', 'is_active'),
+                  [(hackathon_id, f'Bench hackathon {hackathon_id}', 'Synthetic benchmark data',
+                    day(-7), day(7 * stages), '$10,000', flag(True))
+                   for hackathon_id in data.hackathon_ids])
+
+    stage_id = await next_id('stages')
+    stage_rows = []
+    for hackathon_id in data.hackathon_ids:
+        data.stages_by_hackathon[hackathon_id] = []
+        for number in range(1, stages + 1):
+            stage_rows.append((stage_id, hackathon_id, number, f'Stage {number}', 'Build something',
+                               day(7 * (number - 2)), day(7 * (number - 1)), flag(number == 1)))
+            data.stages_by_hackathon[hackathon_id].append(stage_id)
+            data.stage_ids.append(stage_id)
+            stage_id += 1
+    await _insert(db, database, 'stages',
+                  ('id', 'hackathon_id', 'number', 'name', 'task_description',
+                   'start_date', 'end_date', 'is_active'), stage_rows)
+
+    # ---- registrations, grouped into teams per hackathon ----
+    registrants: Dict[int, List[int]] = {hackathon_id: [] for hackathon_id in data.hackathon_ids}
+    per_user = min(registrations_per_user, hackathons)
+    for user_id in data.user_ids:
+        for hackathon_id in rng.sample(data.hackathon_ids, per_user):
+            registrants[hackathon_id].append(user_id)
+
+    taken = set()
+    if database.USE_POSTGRES:
+        async with db.pool.acquire() as conn:
+            taken = {row['code'] for row in await conn.fetch('SELECT code FROM teams')}
+    else:
+        async with db.sqlite.read() as conn:
+            async with conn.execute('SELECT code FROM teams') as cursor:
+                taken = {row[0] for row in await cursor.fetchall()}
+
+    team_id = await next_id('teams')
+    team_rows, member_rows, registration_rows = [], [], []
+    for hackathon_id, members in registrants.items():
+        rng.shuffle(members)
+        for start in range(0, len(members), team_size):
+            team = members[start:start + team_size]
+            code = f'{rng.randrange(10 ** 6):06d}'
+            while code in taken:
+                code = f'{rng.randrange(10 ** 6):06d}'
+            taken.add(code)
+            team_rows.append((team_id, hackathon_id, f'Team {team_id}', code, team[0]))
+            for position, user_id in enumerate(team):
+                member_rows.append((team_id, user_id, 'Team Lead' if position == 0 else 'Member'))
+                registration_rows.append((user_id, hackathon_id, team_id))
+            data.team_ids.append(team_id)
+            data.team_codes.append(code)
+            team_id += 1
+    data.registrations = registration_rows
+
+    await _insert(db, database, 'teams', ('id', 'hackathon_id', 'name', 'code', 'leader_id'), team_rows)
+    await _insert(db, database, 'team_members', ('team_id', 'user_id', 'role'), member_rows)
+    await _insert(db, database, 'registrations', ('user_id', 'hackathon_id', 'team_id'), registration_rows)
+
+    # ---- submissions, about half of them scored ----
+    submission_rows = []
+    for user_id, hackathon_id, team_id in registration_rows:
+        for stage_id in data.stages_by_hackathon[hackathon_id]:
+            if rng.random() < submission_rate:
+                score = round(rng.uniform(0, 100), 2) if rng.random() < 0.5 else None
+                submission_rows.append((user_id, stage_id, team_id,
+                                        f'https://github.com/bench/{user_id}-{stage_id}', score))
+    await _insert(db, database, 'submissions',
+                  ('user_id', 'stage_id', 'team_id', 'link', 'score'), submission_rows)
+
+    # The leaderboard's team_scores: each team's best score per stage
+    hackathon_of = {row[0]: row[1] for row in stage_rows}
+    best: Dict[Tuple[int, int], float] = {}
+    for _, stage_id, team_id, _, score in submission_rows:
+        if score is not None and score > best.get((stage_id, team_id), -1):
+            best[(stage_id, team_id)] = score
+    await _insert(db, database, 'team_scores', ('stage_id', 'team_id', 'hackathon_id', 'score'),
+                  [(stage_id, team_id, hackathon_of[stage_id], score)
+                   for (stage_id, team_id), score in best.items()])
+
+    # ---- persistence: user_data for everyone, an open conversation for some ----
+    await _insert(db, database, 'user_data', ('user_id', 'data'),
+                  [(user_id, json.dumps({'language': 'en'})) for user_id in data.user_ids])
+    await _insert(db, database, 'conversation_states', ('name', 'conv_key', 'state'),
+                  [('submission', json.dumps([user_id, user_id]), '0')
+                   for user_id in data.user_ids[::10]])
+
+    if postgres:
+        # Explicit ids leave the SERIAL sequences behind; fresh statistics keep
+        # the plans what autovacuum would give a production database
+        async with db.pool.acquire() as conn:
+            for table in SERIAL_TABLES:
+                await conn.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {table}), false)"
+                )
+            await conn.execute('ANALYZE')
+
+    db.invalidate_catalog()
+    db.user_cache.clear()
+
+    data.counts = {
+        'users': len(user_rows),
+        'hackathons': len(data.hackathon_ids),
+        'stages': len(stage_rows),
+        'teams': len(team_rows),
+        'team_members': len(member_rows),
+        'registrations': len(registration_rows),
+        'submissions': len(submission_rows),
+        'team_scores': len(best),
+    }
+    return data
+
+
+async def drop_tables(database) -> None:
+    """Drop every table the migrations create (PostgreSQL), for a clean run"""
+    import asyncpg
+    from migrations import MIGRATIONS
+
+    tables = ['schema_version']
+    for _, _, statements, _ in MIGRATIONS:
+        for sql in statements:
+            tables += re.findall(r'CREATE TABLE IF NOT EXISTS (\w+)', sql)
+
+    conn = await asyncpg.connect(database.DATABASE_URL)
+    try:
+        await conn.execute(f"DROP TABLE IF EXISTS {', '.join(dict.fromkeys(tables))} CASCADE")
+    finally:
+        await conn.close()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    import database
+
+    db = database.Database()
+    await db.connect()
+    started = time.perf_counter()
+    data = await generate(db, database, **sizes(args))
+    elapsed = time.perf_counter() - started
+    await db.close()
+
+    backend = 'postgres' if database.USE_POSTGRES else f'sqlite ({database.SQLITE_PATH})'
+    print(f"Loaded into {backend} in {elapsed:.1f}s:")
+    for table, count in data.counts.items():
+        print(f"  {table:<14} {count:>9}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,413 @@
+"""
+Load test: many concurrent users driving the real bot handlers
+
+Every simulated user registers, creates or joins a team, opens the stage
+list and a stage, and submits a link. Updates are synthetic Bot API
+payloads fed through the bot's update processor (so UPDATE_CONCURRENCY and
+per-user ordering apply as in production) to Application.process_update;
+the bot talks to a local fake Bot API server that records every call
+instead of Telegram.
+
+Reports throughput and p50/p95/p99 per-update latency for each flow.
+
+Usage (from the repository root):
+    python -m benchmarks.loadtest --users 1000 --concurrency 200
+    python -m benchmarks.loadtest --backend postgres      # needs DATABASE_URL
+    python -m benchmarks.loadtest --backend both
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+TOKEN = '123456:LOADTEST'
+FLOWS = ['registration', 'team_create', 'team_join', 'stages', 'submission']
+
+
+class FakeBotAPI:
+    """Answers Bot API calls like Telegram would and records them"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.last_text: Dict[int, str] = {}
+        self._message_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        self.port = 0
+
+    def _message(self, chat_id: int, text: str) -> dict:
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'Bot', 'username': 'loadtest_bot'},
+            'text': text,
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = dict(await request.post())
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        chat_id = int(params.get('chat_id', 0) or 0)
+        text = params.get('text') or params.get('caption') or ''
+        if chat_id and text:
+            self.last_text[chat_id] = text
+
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bot', 'username': 'loadtest_bot'}
+        elif method in ('sendMessage', 'sendPhoto', 'sendDocument', 'editMessageText'):
+            result = self._message(chat_id, text)
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        self.port = sock.getsockname()[1]
+        await web.SockSite(self._runner, sock).start()
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+
+
+# ============== SYNTHETIC UPDATES ==============
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': f'Load{user_id}', 'username': f'load{user_id}'}
+
+
+def message(user_id: int, text: str = None, contact: dict = None) -> dict:
+    msg = {
+        'message_id': next(_update_ids),
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': _user(user_id),
+    }
+    if contact:
+        msg['contact'] = contact
+    else:
+        msg['text'] = text
+        if text.startswith('/'):
+            msg['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': next(_update_ids), 'message': msg}
+
+
+def callback(user_id: int, data: str) -> dict:
+    return {
+        'update_id': next(_update_ids),
+        'callback_query': {
+            'id': str(next(_update_ids)),
+            'from': _user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': next(_update_ids),
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': 1, 'is_bot': True, 'first_name': 'Bot'},
+                'text': '…',
+            },
+        },
+    }
+
+
+# ============== APPLICATION ==============
+
+def build_application(bot, api: FakeBotAPI):
+    """The production handlers for the flows under test, wired like main() wires them"""
+    from telegram.ext import (
+        Application, CallbackQueryHandler, CommandHandler, ConversationHandler,
+        MessageHandler, filters,
+    )
+    from config import UPDATE_CONCURRENCY
+    from updates import UserOrderedUpdateProcessor
+    State = bot.State
+    text = filters.TEXT & ~filters.COMMAND
+
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(f'http://127.0.0.1:{api.port}/bot')
+        .base_file_url(f'http://127.0.0.1:{api.port}/file/bot')
+        .updater(None)
+        .persistence(bot.DatabasePersistence(bot.db))
+        .concurrent_updates(UserOrderedUpdateProcessor(UPDATE_CONCURRENCY))
+        .build()
+    )
+    application.add_handler(ConversationHandler(
+        entry_points=[CommandHandler('start', bot.start)],
+        states={
+            State.FIRST_NAME.value: [MessageHandler(text, bot.get_first_name)],
+            State.LAST_NAME.value: [MessageHandler(text, bot.get_last_name)],
+            State.BIRTH_DATE.value: [MessageHandler(text, bot.get_birth_date)],
+            State.PHONE.value: [MessageHandler(filters.CONTACT, bot.get_phone), MessageHandler(text, bot.get_phone)],
+            State.PINFL.value: [MessageHandler(text, bot.get_pinfl)],
+        },
+        fallbacks=[CommandHandler('cancel', bot.cancel)],
+        name='registration',
+        persistent=True,
+    ))
+    application.add_handler(ConversationHandler(
+        entry_points=[CallbackQueryHandler(bot.create_team_start, pattern=r'^create_team_\d+$')],
+        states={State.TEAM_NAME.value: [MessageHandler(text, bot.create_team_name)]},
+        fallbacks=[CommandHandler('cancel', bot.cancel)],
+        name='team_creation',
+        persistent=True,
+    ))
+    application.add_handler(ConversationHandler(
+        entry_points=[CallbackQueryHandler(bot.join_team_start, pattern=r'^join_team_\d+$')],
+        states={State.TEAM_CODE.value: [MessageHandler(text, bot.join_team_code)]},
+        fallbacks=[CommandHandler('cancel', bot.cancel)],
+        name='team_join',
+        persistent=True,
+    ))
+    application.add_handler(ConversationHandler(
+        entry_points=[CallbackQueryHandler(bot.submit_start, pattern=r'^submit_\d+$')],
+        states={State.SUBMIT_LINK.value: [
+            MessageHandler(filters.Document.ALL | filters.PHOTO | filters.VIDEO | filters.AUDIO,
+                           bot.handle_submission),
+            MessageHandler(text, bot.handle_submission),
+        ]},
+        fallbacks=[CommandHandler('cancel', bot.cancel)],
+        name='submission',
+        persistent=True,
+    ))
+    application.add_handler(CallbackQueryHandler(bot.show_hackathon_details, pattern=r'^hackathon_\d+$'))
+    application.add_handler(CallbackQueryHandler(bot.register_hackathon, pattern=r'^register_\d+$'))
+    application.add_handler(CallbackQueryHandler(bot.show_stages, pattern=r'^stages_\d+$'))
+    application.add_handler(CallbackQueryHandler(bot.show_stage_details, pattern=r'^stage_\d+$'))
+    return application
+
+
+# ============== SIMULATED USERS ==============
+
+class LoadTest:
+    def __init__(self, application, api: FakeBotAPI, hackathon_id: int, stage_id: int,
+                 users: int, team_size: int, user_base: int):
+        from telegram import Update
+        self.Update = Update
+        self.application = application
+        self.api = api
+        self.hackathon_id = hackathon_id
+        self.stage_id = stage_id
+        self.users = users
+        self.team_size = team_size
+        self.user_base = user_base
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.completed: Dict[str, int] = defaultdict(int)
+        self.errors = 0
+        self.team_codes: Dict[int, asyncio.Future] = {}
+
+    async def send(self, flow: str, payload: dict) -> None:
+        update = self.Update.de_json(payload, self.application.bot)
+        started = time.perf_counter()
+        await self.application.update_processor.process_update(
+            update, self.application.process_update(update))
+        self.latencies[flow].append(time.perf_counter() - started)
+
+    async def run_user(self, index: int) -> None:
+        user_id = self.user_base + index
+        h, s = self.hackathon_id, self.stage_id
+        team = index // self.team_size
+        code = self.team_codes.setdefault(team, asyncio.get_running_loop().create_future())
+
+        try:
+            await self.send('registration', message(user_id, '/start'))
+            await self.send('registration', message(user_id, 'Load'))
+            await self.send('registration', message(user_id, f'User{index}'))
+            await self.send('registration', message(user_id, '23.10.2000'))
+            await self.send('registration', message(user_id, contact={
+                'phone_number': f'+99890{index:07d}', 'first_name': 'Load', 'user_id': user_id}))
+            await self.send('registration', message(user_id, f'{index:014d}'))
+            self.completed['registration'] += 1
+
+            if index % self.team_size == 0:
+                await self.send('team_create', callback(user_id, f'hackathon_{h}'))
+                await self.send('team_create', callback(user_id, f'register_{h}'))
+                await self.send('team_create', callback(user_id, f'create_team_{h}'))
+                await self.send('team_create', message(user_id, f'Team {team}'))
+                found = re.search(r'Code: (\d+)', self.api.last_text.get(user_id, ''))
+                code.set_result(found.group(1) if found else None)
+                self.completed['team_create'] += 1
+            else:
+                team_code = await code
+                await self.send('team_join', callback(user_id, f'register_{h}'))
+                await self.send('team_join', callback(user_id, f'join_team_{h}'))
+                await self.send('team_join', message(user_id, team_code or '000000'))
+                self.completed['team_join'] += 1
+
+            await self.send('stages', callback(user_id, f'stages_{h}'))
+            await self.send('stages', callback(user_id, f'stage_{s}'))
+            self.completed['stages'] += 1
+
+            await self.send('submission', callback(user_id, f'submit_{s}'))
+            await self.send('submission', message(user_id, f'https://example.com/demo/{user_id}'))
+            self.completed['submission'] += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"user {user_id} failed: {e!r}", file=sys.stderr)
+            if not code.done():
+                code.set_result(None)
+
+    async def run(self, concurrency: int) -> float:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(index: int) -> None:
+            async with semaphore:
+                await self.run_user(index)
+
+        # Team leaders start first so members never wait on a leader stuck behind them
+        order = sorted(range(self.users), key=lambda i: i % self.team_size != 0)
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(i) for i in order))
+        return time.perf_counter() - started
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_backend(args) -> dict:
+    import bot
+    import database
+    from metrics import metrics
+
+    # bot.py logs every request at INFO; keep the report readable
+    for name in ('httpx', 'telegram', 'apscheduler', 'database', 'persistence'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    api = FakeBotAPI(args.api_latency / 1000)
+    await api.start()
+    await bot.db.connect()
+
+    today = time.strftime('%Y-%m-%d')
+    hackathon = await bot.db.create_hackathon('Load Test', 'load test', today, today)
+    stage = await bot.db.create_stage(hackathon['id'], 1, 'Stage 1', 'Build it', today, today)
+    await bot.db.update_stage_active(stage['id'], True)
+
+    application = build_application(bot, api)
+    await application.initialize()
+    await application.start()
+
+    test = LoadTest(application, api, hackathon['id'], stage['id'], args.users, args.team_size,
+                    args.user_base or (10 ** 9 + int(time.time() * 1000) % 10 ** 9))
+    elapsed = await test.run(args.concurrency)
+
+    await application.stop()
+    await application.shutdown()
+    await bot.db.close()
+    await api.stop()
+
+    updates = sum(len(samples) for samples in test.latencies.values())
+    return {
+        'backend': 'postgres' if database.USE_POSTGRES else 'sqlite',
+        'users': args.users,
+        'concurrency': args.concurrency,
+        'elapsed_s': elapsed,
+        'updates_per_s': updates / elapsed,
+        'update_slots': application.update_processor.max_concurrent_updates,
+        'update_wait_p95_ms': metrics.update_wait.quantile(0.95) * 1000,
+        'errors': test.errors,
+        'api_calls': dict(api.calls),
+        'flows': {
+            flow: {
+                'completed': test.completed[flow],
+                'per_s': test.completed[flow] / elapsed,
+                'updates': len(test.latencies[flow]),
+                'p50_ms': percentile(test.latencies[flow], 0.50) * 1000,
+                'p95_ms': percentile(test.latencies[flow], 0.95) * 1000,
+                'p99_ms': percentile(test.latencies[flow], 0.99) * 1000,
+                'mean_ms': statistics.fmean(test.latencies[flow]) * 1000,
+            }
+            for flow in FLOWS if test.latencies[flow]
+        },
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"\n{report['backend']}: {report['users']} users, concurrency {report['concurrency']}, "
+          f"{report['elapsed_s']:.1f}s, {report['updates_per_s']:.0f} updates/s, {report['errors']} failed users")
+    print(f"{'flow':<14} {'done':>6} {'per s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for flow, row in report['flows'].items():
+        print(f"{flow:<14} {row['completed']:>6} {row['per_s']:>8.1f} "
+              f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+    print(f"Update slots: {report['update_slots']}, p95 wait for a slot or the user's turn "
+          f"{report['update_wait_p95_ms']:.1f} ms")
+    print(f"Bot API calls: {report['api_calls']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Load test the bot handlers')
+    parser.add_argument('--backend', choices=['sqlite', 'postgres', 'both'], default='sqlite')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--team-size', type=int, default=4)
+    parser.add_argument('--api-latency', type=float, default=0.0,
+                        help='milliseconds the fake Bot API waits before answering')
+    parser.add_argument('--user-base', type=int, default=0,
+                        help='first simulated user id (default: derived from the clock)')
+    parser.add_argument('--json', help='also write the report(s) to this file')
+    args = parser.parse_args()
+
+    if args.backend == 'both':
+        # Each backend is chosen at import time, so run them in separate processes
+        reports = []
+        for backend in ('sqlite', 'postgres'):
+            with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as out:
+                path = out.name
+            command = [sys.executable, '-m', 'benchmarks.loadtest', '--backend', backend, '--json', path]
+            for flag in ('users', 'concurrency', 'team_size', 'api_latency', 'user_base'):
+                command += [f"--{flag.replace('_', '-')}", str(getattr(args, flag))]
+            subprocess.run(command, check=True)
+            with open(path) as f:
+                reports.extend(json.load(f))
+            os.unlink(path)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(reports, f, indent=2)
+        return
+
+    if args.backend == 'postgres':
+        if not os.getenv('DATABASE_URL', '').startswith('postgres'):
+            parser.error('--backend postgres needs DATABASE_URL')
+    else:
+        os.environ['DATABASE_URL'] = ''
+        os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'loadtest.db')
+    os.environ.setdefault('METRICS_PORT', '0')
+
+    report = asyncio.run(run_backend(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([report], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
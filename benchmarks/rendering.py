@@ -0,0 +1,80 @@
+"""
+Per-update rendering cost: translations and keyboards
+
+Renders what a typical update needs (a handful of get_text calls, one of
+them with format arguments, plus the main menu and profile keyboards) three
+ways: as before (the old str.format lookup, keyboards built per update and
+labelled through it), with the compiled catalog but still building the
+keyboards, and with the compiled catalog and the cached keyboards. The
+middle row isolates the template change from the keyboard cache.
+
+Usage (from the repository root):
+    python -m benchmarks.rendering --updates 20000
+"""
+
+import argparse
+import time
+from contextlib import contextmanager
+
+import bot
+from translations import LANGUAGES, TRANSLATIONS, get_text
+
+TEXT_KEYS = ['welcome_back', 'hackathons', 'my_hackathons', 'settings', 'help']
+
+
+def legacy_get_text(key: str, lang: str = 'en', **kwargs) -> str:
+    """get_text as it was before the catalog was compiled"""
+    text = TRANSLATIONS.get(key, {}).get(lang, TRANSLATIONS.get(key, {}).get('en', key))
+    if kwargs:
+        try:
+            text = text.format(**kwargs)
+        except KeyError:
+            pass
+    return text
+
+
+@contextmanager
+def keyboard_text(text):
+    """Label the keyboards built inside the block with ``text`` instead of get_text"""
+    bot.get_text = text
+    try:
+        yield
+    finally:
+        bot.get_text = get_text
+
+
+def render(lang: str, text, main_menu, user_data) -> None:
+    for key in TEXT_KEYS:
+        text(key, lang)
+    text('team_joined', lang, name='Bench')
+    main_menu(lang)
+    user_data(lang)
+
+
+def measure(updates: int, text, main_menu, user_data) -> float:
+    """Microseconds per rendered update"""
+    started = time.perf_counter()
+    for i in range(updates):
+        render(LANGUAGES[i % len(LANGUAGES)], text, main_menu, user_data)
+    return (time.perf_counter() - started) / updates * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--updates', type=int, default=20000)
+    args = parser.parse_args()
+
+    build_main_menu = bot.get_main_menu_keyboard.__wrapped__
+    build_user_data = bot.get_user_data_keyboard.__wrapped__
+    with keyboard_text(legacy_get_text):
+        before = measure(args.updates, legacy_get_text, build_main_menu, build_user_data)
+    uncached = measure(args.updates, get_text, build_main_menu, build_user_data)
+    cached = measure(args.updates, get_text, bot.get_main_menu_keyboard, bot.get_user_data_keyboard)
+
+    print(f"{'':>16} {'us/update':>10} {'speedup':>8}")
+    for name, result in (('before', before), ('after, uncached', uncached), ('after, cached', cached)):
+        print(f"{name:>16} {result:>10.2f} {before / result:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
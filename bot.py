@@ -12,7 +12,9 @@ Features:
 
 import asyncio
 import logging
+import os
 from datetime import datetime, date
+from functools import lru_cache
 from typing import Optional
 from enum import Enum
 
@@ -25,8 +27,20 @@ from telegram.ext import (
     ConversationHandler, filters, ContextTypes
 )
 
+from broadcast import get_broadcaster
 from database import Database
-from config import BOT_TOKEN, ADMIN_IDS, SUPPORT_EMAIL
+from export import export_submissions_csv
+from ingest import FileRejected, FileStore, IngestJob, IngestQueue, attachment_of, check_file, upload_limit
+from jobs import STATUS_ICONS, Job, JobRunner, delivery_progress
+from leaderboard import HACKATHON, STAGE, Leaderboard
+from metrics import MetricsServer, instrument_handlers, metrics
+from persistence import DatabasePersistence
+from schedular import NotificationScheduler
+from updates import UserOrderedUpdateProcessor
+from config import (
+    BOT_TOKEN, ADMIN_IDS, SUPPORT_EMAIL, WEBHOOK_URL, WEBHOOK_PORT, METRICS_HOST, METRICS_PORT,
+    LEADERBOARD_SIZE, UPDATE_CONCURRENCY,
+)
 from translations import get_text, LANGUAGES
 
 # Configure logging
@@ -62,8 +76,11 @@ class State(Enum):
 
 # Initialize database
 db = Database()
+leaderboard = Leaderboard(db)
 
 
+# Keyboards are immutable, so one instance per language is built and reused
+@lru_cache(maxsize=32)
 def get_main_menu_keyboard(lang: str = 'en') -> ReplyKeyboardMarkup:
     """Generate main menu keyboard"""
     keyboard = [
@@ -75,6 +92,7 @@ def get_main_menu_keyboard(lang: str = 'en') -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
 
+@lru_cache(maxsize=1)
 def get_language_keyboard() -> InlineKeyboardMarkup:
     """Generate language selection keyboard"""
     keyboard = [
@@ -87,6 +105,20 @@ def get_language_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(keyboard)
 
 
+@lru_cache(maxsize=32)
+def get_user_data_keyboard(lang: str = 'en') -> InlineKeyboardMarkup:
+    """Generate profile editing keyboard"""
+    keyboard = [
+        [InlineKeyboardButton(f"✏️ {get_text('change_first_name', lang)}", callback_data="edit_first_name")],
+        [InlineKeyboardButton(f"✏️ {get_text('change_last_name', lang)}", callback_data="edit_last_name")],
+        [InlineKeyboardButton(f"✏️ {get_text('birth_date', lang)}", callback_data="edit_birth_date")],
+        [InlineKeyboardButton(f"✏️ {get_text('gender', lang)}", callback_data="edit_gender")],
+        [InlineKeyboardButton(f"✏️ {get_text('location', lang)}", callback_data="edit_location")],
+        [InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Start command - begin registration or welcome back"""
     user_id = update.effective_user.id
@@ -446,7 +478,7 @@ async def show_my_hackathons(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user = await db.get_user(user_id)
     lang = user.get('language', 'en') if user else 'en'
     
-    registrations = await db.get_user_registrations(user_id)
+    registrations = await db.get_user_registrations_detailed(user_id)
     
     if not registrations:
         await update.message.reply_text(
@@ -459,12 +491,14 @@ async def show_my_hackathons(update: Update, context: ContextTypes.DEFAULT_TYPE)
     keyboard = []
     
     for reg in registrations:
-        hackathon = await db.get_hackathon(reg['hackathon_id'])
-        if hackathon:
-            keyboard.append([InlineKeyboardButton(
-                hackathon['name'],
-                callback_data=f"my_hackathon_{hackathon['id']}"
-            )])
+        text += f"🏆 {reg['hackathon_name']}\n📅 {reg['start_date'] or ''} — {reg['end_date'] or ''}\n"
+        if reg['team_name']:
+            text += f"👥 Team: {reg['team_name']}\n"
+        text += "\n"
+        keyboard.append([InlineKeyboardButton(
+            reg['hackathon_name'],
+            callback_data=f"my_hackathon_{reg['hackathon_id']}"
+        )])
     
     await update.message.reply_text(
         text,
@@ -479,23 +513,18 @@ async def show_my_hackathon_details(update: Update, context: ContextTypes.DEFAUL
     
     hackathon_id = int(query.data.split('_')[2])
     user_id = update.effective_user.id
-    user = await db.get_user(user_id)
     
-    hackathon = await db.get_hackathon(hackathon_id)
-    registration = await db.get_user_hackathon_registration(user_id, hackathon_id)
-    team = await db.get_team(registration['team_id']) if registration else None
+    view = await db.get_my_hackathon_view(user_id, hackathon_id)
+    team = view['team'] if view else None
     
     if not team:
         await query.edit_message_text("Team not found")
         return
     
-    members = await db.get_team_members(team['id'])
     members_text = ""
-    for i, member in enumerate(members, 1):
-        member_user = await db.get_user(member['user_id'])
-        if member_user:
-            role = "(TeamLead)" if member['user_id'] == team['leader_id'] else ""
-            members_text += f"{i}. {member_user['first_name']} {member_user['last_name']} - {member.get('role', 'Member')} {role}\n"
+    for i, member in enumerate(view['roster'], 1):
+        role = "(TeamLead)" if member['user_id'] == team['leader_id'] else ""
+        members_text += f"{i}. {member['first_name']} {member['last_name']} - {member.get('role', 'Member')} {role}\n"
     
     keyboard = [
         [InlineKeyboardButton("ℹ️ See details", callback_data=f"details_{hackathon_id}")],
@@ -540,14 +569,6 @@ async def change_language(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user = await db.get_user(user_id)
     
     # Show user data
-    keyboard = [
-        [InlineKeyboardButton(f"✏️ {get_text('change_first_name', new_lang)}", callback_data="edit_first_name")],
-        [InlineKeyboardButton(f"✏️ {get_text('change_last_name', new_lang)}", callback_data="edit_last_name")],
-        [InlineKeyboardButton(f"✏️ {get_text('birth_date', new_lang)}", callback_data="edit_birth_date")],
-        [InlineKeyboardButton(f"✏️ {get_text('gender', new_lang)}", callback_data="edit_gender")],
-        [InlineKeyboardButton(f"✏️ {get_text('location', new_lang)}", callback_data="edit_location")],
-        [InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")]
-    ]
     
     text = f"""👤 {get_text('your_data', new_lang)}:
 
@@ -557,7 +578,7 @@ async def change_language(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 • {get_text('gender', new_lang)}: {user.get('gender', 'Not set')}
 • {get_text('location', new_lang)}: {user.get('location', 'Not set')}"""
     
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await query.edit_message_text(text, reply_markup=get_user_data_keyboard(new_lang))
 
 
 async def show_user_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -569,15 +590,6 @@ async def show_user_data(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user = await db.get_user(user_id)
     lang = user.get('language', 'en') if user else 'en'
     
-    keyboard = [
-        [InlineKeyboardButton(f"✏️ {get_text('change_first_name', lang)}", callback_data="edit_first_name")],
-        [InlineKeyboardButton(f"✏️ {get_text('change_last_name', lang)}", callback_data="edit_last_name")],
-        [InlineKeyboardButton(f"✏️ {get_text('birth_date', lang)}", callback_data="edit_birth_date")],
-        [InlineKeyboardButton(f"✏️ {get_text('gender', lang)}", callback_data="edit_gender")],
-        [InlineKeyboardButton(f"✏️ {get_text('location', lang)}", callback_data="edit_location")],
-        [InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")]
-    ]
-    
     text = f"""👤 {get_text('your_data', lang)}:
 
 • {get_text('first_name', lang)}: {user.get('first_name', '')}
@@ -586,7 +598,7 @@ async def show_user_data(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 • {get_text('gender', lang)}: {user.get('gender', 'Not set')}
 • {get_text('location', lang)}: {user.get('location', 'Not set')}"""
     
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await query.edit_message_text(text, reply_markup=get_user_data_keyboard(lang))
 
 
 async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -660,6 +672,11 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         [InlineKeyboardButton("📢 Broadcast Message", callback_data="admin_broadcast")],
         [InlineKeyboardButton("📊 Statistics", callback_data="admin_stats")],
         [InlineKeyboardButton("🏆 Manage Stages", callback_data="admin_stages")],
+        [InlineKeyboardButton("📥 Export Submissions", callback_data="admin_export")],
+        [InlineKeyboardButton("🧰 Background Jobs", callback_data="admin_jobs")],
+        [InlineKeyboardButton("🏆 Leaderboards", callback_data="admin_leaderboards")],
+        [InlineKeyboardButton("📈 Handler Metrics", callback_data="admin_metrics")],
+        [InlineKeyboardButton("🗄 Database Profile", callback_data="admin_db_profile")],
     ]
     
     await update.message.reply_text(
@@ -767,30 +784,32 @@ async def admin_broadcast_select(update: Update, context: ContextTypes.DEFAULT_T
 
 
 async def admin_broadcast_send(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Send broadcast message"""
+    """Queue the broadcast as a background job"""
     message = update.message.text
     target = context.user_data.get('broadcast_target', 'all')
     
     if target == 'all':
-        users = await db.get_all_users()
+        audience = "all users"
     else:
-        users = await db.get_hackathon_participants(int(target))
-    
-    sent = 0
-    failed = 0
+        hackathon = await db.get_hackathon(int(target))
+        audience = hackathon['name'] if hackathon else f"hackathon {target}"
     
-    for user in users:
-        try:
-            await context.bot.send_message(chat_id=user['user_id'], text=message)
-            sent += 1
-        except Exception as e:
-            logger.error(f"Failed to send to {user['user_id']}: {e}")
-            failed += 1
+    async def run(job: Job) -> str:
+        if target == 'all':
+            users = await db.get_all_users()
+        else:
+            users = await db.get_hackathon_participants(int(target))
+        job.report(0, len(users))
+        
+        result = await get_broadcaster(context.bot).broadcast(
+            [(user['user_id'], message) for user in users],
+            delivery_progress(job), progress_interval=1.0
+        )
+        return f"Sent: {result.sent}\nFailed: {result.failed}"
     
-    await update.message.reply_text(
-        f"✅ Broadcast completed!\n"
-        f"Sent: {sent}\n"
-        f"Failed: {failed}"
+    await context.bot_data['jobs'].submit(
+        'broadcast', f"Broadcast to {audience}",
+        update.effective_chat.id, update.effective_user.id, run
     )
     return ConversationHandler.END
 
@@ -812,6 +831,306 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     )
 
 
+async def admin_metrics(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the busiest handlers with their latency and errors"""
+    query = update.callback_query
+    await query.answer()
+    
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    rows = metrics.summary()
+    if not rows:
+        await query.edit_message_text("📈 No handler calls recorded yet")
+        return
+    
+    updates = metrics.updates
+    lines = [
+        f"📥 Updates: {updates['running']} running, {updates['queued']} queued, "
+        f"{updates['waiting']} waiting for the same user "
+        f"(p95 wait {metrics.update_wait.quantile(0.95) * 1000:.1f} ms)\n",
+        "📈 Handler Metrics (busiest first)\n",
+    ]
+    for row in rows:
+        name = f"{row['handler']} [{row['state']}]" if row['state'] else row['handler']
+        lines.append(
+            f"• {name}\n"
+            f"  {row['calls']} calls, avg {row['avg_ms']:.1f} ms, "
+            f"p95 {row['p95_ms']:.1f} ms, {row['errors']} errors"
+        )
+    
+    await query.edit_message_text("\n".join(lines))
+
+
+async def admin_db_profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the query profiler report"""
+    query = update.callback_query
+    await query.answer()
+    
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    # Telegram messages are capped at 4096 characters
+    await query.edit_message_text(f"🗄 {db.profile_dump()}"[:4000])
+
+
+async def admin_export_submissions(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Choose a hackathon to export submissions for"""
+    query = update.callback_query
+    await query.answer()
+    
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    hackathons = await db.get_all_hackathons()
+    
+    if not hackathons:
+        await query.edit_message_text("No hackathons available")
+        return
+    
+    keyboard = []
+    for h in hackathons:
+        keyboard.append([InlineKeyboardButton(
+            h['name'],
+            callback_data=f"export_hackathon_{h['id']}"
+        )])
+    
+    await query.edit_message_text(
+        "📥 Select hackathon to export:",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+
+async def export_hackathon_submissions(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Export a hackathon's submissions as a CSV document, in a background job"""
+    query = update.callback_query
+    await query.answer()
+    
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    hackathon_id = int(query.data.split('_')[2])
+    hackathon = await db.get_hackathon(hackathon_id)
+    if not hackathon:
+        await query.edit_message_text("Hackathon not found")
+        return
+    
+    chat_id = update.effective_chat.id
+    
+    async def run(job: Job) -> str:
+        path, rows = await export_submissions_csv(
+            db, hackathon_id, progress=lambda written: job.report(written, detail="rows written")
+        )
+        try:
+            with open(path, 'rb') as f:
+                await context.bot.send_document(
+                    chat_id,
+                    document=f,
+                    filename=f"submissions_{hackathon_id}.csv",
+                    caption=f"📥 {hackathon['name']}: {rows} submissions"
+                )
+        finally:
+            os.unlink(path)
+        return f"{rows} submissions exported"
+    
+    job = await context.bot_data['jobs'].submit(
+        'export', f"Export of {hackathon['name']}", chat_id, update.effective_user.id, run
+    )
+    await query.edit_message_text(f"📥 Exporting submissions for {hackathon['name']} (job #{job.id})")
+
+
+async def admin_stage_results(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Announce stage results: /results <stage_id> <team_id> [team_id ...], or '-' if no team advanced"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ Access denied")
+        return
+    
+    try:
+        stage_id = int(context.args[0])
+        teams = context.args[1:]
+        if not teams:
+            raise ValueError
+        advanced = set() if teams == ['-'] else {int(team_id) for team_id in teams}
+    except (IndexError, ValueError):
+        await update.message.reply_text("Usage: /results <stage_id> <advanced team ids...> (or - for none)")
+        return
+    
+    stage = await db.get_stage(stage_id)
+    if not stage:
+        await update.message.reply_text("❌ Stage not found")
+        return
+    hackathon = await db.get_hackathon(stage['hackathon_id'])
+    scheduler = context.bot_data['scheduler']
+    
+    async def run(job: Job) -> str:
+        result = await scheduler.send_stage_results(
+            stage['hackathon_id'], stage['number'], advanced, progress=delivery_progress(job)
+        )
+        if result is None:
+            raise RuntimeError("the results could not be sent, see the log")
+        return f"Teams advanced: {len(advanced)}\nSent: {result.sent}\nFailed: {result.failed}"
+    
+    await context.bot_data['jobs'].submit(
+        'stage_results', f"Stage {stage['number']} results of {hackathon['name']}",
+        update.effective_chat.id, update.effective_user.id, run
+    )
+
+
+async def admin_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the latest background jobs, with cancel buttons for the running ones"""
+    query = update.callback_query
+    await query.answer()
+    
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    rows = await db.get_recent_jobs()
+    if not rows:
+        await query.edit_message_text("🧰 No background jobs yet")
+        return
+    
+    lines = ["🧰 Background Jobs\n"]
+    for row in rows:
+        progress = f"{row['processed']}/{row['total']}" if row['total'] else str(row['processed'])
+        lines.append(f"{STATUS_ICONS.get(row['status'], '•')} #{row['id']} {row['title']}: "
+                     f"{row['status']}, {progress}")
+    
+    keyboard = [
+        [InlineKeyboardButton(f"🚫 Cancel #{job.id}", callback_data=f"job_cancel_{job.id}")]
+        for job in context.bot_data['jobs'].active()
+    ]
+    await query.edit_message_text("\n".join(lines), reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+async def cancel_job(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Cancel a background job from its progress message"""
+    query = update.callback_query
+    
+    if update.effective_user.id not in ADMIN_IDS:
+        await query.answer("⛔ Access denied")
+        return
+    
+    job_id = int(query.data.split('_')[2])
+    if context.bot_data['jobs'].cancel(job_id):
+        await query.answer(f"Cancelling job #{job_id}")
+    else:
+        await query.answer(f"Job #{job_id} is not running")
+
+
+# ============== LEADERBOARD ==============
+
+MEDALS = {1: "🥇", 2: "🥈", 3: "🥉"}
+
+
+async def show_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the team leaderboard of a hackathon (leaderboard_<id>) or a stage (leaderboard_stage_<id>)"""
+    query = update.callback_query
+    await query.answer()
+    
+    parts = query.data.split('_')
+    keyboard = []
+    if parts[1] == 'stage':
+        stage = await db.get_stage(int(parts[2]))
+        if not stage:
+            await query.edit_message_text("Stage not found")
+            return
+        kind, scope_id, hackathon_id = STAGE, stage['id'], stage['hackathon_id']
+        title = f"🏆 Stage {stage['number']}: {stage['name']}"
+        keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data=f"leaderboard_{hackathon_id}")])
+    else:
+        hackathon_id = int(parts[1])
+        hackathon = await db.get_hackathon(hackathon_id)
+        if not hackathon:
+            await query.edit_message_text("Hackathon not found")
+            return
+        kind, scope_id = HACKATHON, hackathon_id
+        title = f"🏆 {hackathon['name']}"
+        for stage in await db.get_hackathon_stages(hackathon_id):
+            keyboard.append([InlineKeyboardButton(
+                f"Stage {stage['number']}: {stage['name']}",
+                callback_data=f"leaderboard_stage_{stage['id']}"
+            )])
+        keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data=f"stages_{hackathon_id}")])
+    
+    lines = [title, ""]
+    entries = await leaderboard.top(kind, scope_id, LEADERBOARD_SIZE)
+    if not entries:
+        lines.append("No scores yet.")
+    for entry in entries:
+        place = MEDALS.get(entry['rank'], f"{entry['rank']}.")
+        lines.append(f"{place} {entry['name']} — {entry['score']:g}")
+    
+    registration = await db.get_user_hackathon_registration(update.effective_user.id, hackathon_id)
+    if registration and registration.get('team_id'):
+        mine = await leaderboard.team_rank(kind, scope_id, registration['team_id'])
+        if mine:
+            lines.append(f"\nYour team: #{mine['rank']} of {mine['teams']} ({mine['score']:g} pts)")
+    
+    await query.edit_message_text('\n'.join(lines), reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+async def admin_leaderboards(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Choose a hackathon to show the leaderboard of"""
+    query = update.callback_query
+    await query.answer()
+    
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    hackathons = await db.get_all_hackathons()
+    
+    if not hackathons:
+        await query.edit_message_text("No hackathons available")
+        return
+    
+    keyboard = []
+    for h in hackathons:
+        keyboard.append([InlineKeyboardButton(
+            h['name'],
+            callback_data=f"leaderboard_{h['id']}"
+        )])
+    
+    await query.edit_message_text(
+        "🏆 Select hackathon:\n\n"
+        "Score a submission with /score <submission_id> <score> "
+        "(ids are in the submissions export; '-' clears a score)",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+
+async def admin_score(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Score a submission: /score <submission_id> <score>, or '-' to clear it"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ Access denied")
+        return
+    
+    try:
+        submission_id = int(context.args[0])
+        score = None if context.args[1] == '-' else float(context.args[1].replace(',', '.'))
+        if score is not None and not 0 <= score < 1000:
+            raise ValueError
+    except (IndexError, ValueError):
+        await update.message.reply_text("Usage: /score <submission_id> <score 0-999.99 or ->")
+        return
+    
+    change = await db.set_submission_score(submission_id, score)
+    if change is None:
+        await update.message.reply_text("❌ Submission not found")
+        return
+    if change['team_id'] is None:
+        await update.message.reply_text("✅ Score saved. The submission has no team, so it isn't ranked.")
+        return
+    
+    rank = await leaderboard.team_rank(STAGE, change['stage_id'], change['team_id'])
+    if rank:
+        await update.message.reply_text(
+            f"✅ Score saved.\n"
+            f"Team's stage score: {rank['score']:g} (#{rank['rank']} of {rank['teams']})"
+        )
+    else:
+        await update.message.reply_text("✅ Score cleared. The team has no score for this stage.")
+
+
 # ============== STAGE MANAGEMENT ==============
 
 async def show_stages(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -833,6 +1152,7 @@ async def show_stages(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             f"{status} Stage {stage['number']}: {stage['name']}",
             callback_data=f"stage_{stage['id']}"
         )])
+    keyboard.append([InlineKeyboardButton("🏆 Leaderboard", callback_data=f"leaderboard_{hackathon_id}")])
     
     await query.edit_message_text(
         "📋 Hackathon Stages:",
@@ -855,8 +1175,11 @@ async def show_stage_details(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user_id = update.effective_user.id
     submission = await db.get_submission(user_id, stage_id)
     
+    # A file that could not be stored can be submitted again
+    can_submit = not submission or submission.get('file_status') == 'failed'
+    
     keyboard = []
-    if stage.get('is_active') and not submission:
+    if stage.get('is_active') and can_submit:
         keyboard.append([InlineKeyboardButton(
             "📤 Submit", callback_data=f"submit_{stage_id}"
         )])
@@ -864,8 +1187,11 @@ async def show_stage_details(update: Update, context: ContextTypes.DEFAULT_TYPE)
     keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data=f"details_{stage['hackathon_id']}")])
     
     status_text = ""
-    if submission:
-        status_text = f"\n\n✅ Your submission: {submission.get('link', 'Submitted')}"
+    if submission and submission.get('file_status') == 'failed':
+        status_text = f"\n\n❌ Your file {submission.get('file_name')} could not be saved, please submit again"
+    elif submission:
+        submitted = submission.get('link') or submission.get('file_name') or 'Submitted'
+        status_text = f"\n\n✅ Your submission: {submitted}"
     elif not stage.get('is_active'):
         status_text = "\n\n⏰ Stage deadline has already passed :("
     
@@ -892,11 +1218,57 @@ async def submit_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     
     await query.edit_message_text(
         "📤 Submit your work\n\n"
-        "Send the link to your live demo website:"
+        "Send the link to your live demo website, or upload a file:"
     )
     return State.SUBMIT_LINK.value
 
 
+async def handle_submission(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Handle a submission: a link, or a document, photo, video or audio file
+    
+    Files are only checked and queued here; the ingestion queue downloads
+    and stores them in the background and tells the user when it's done.
+    """
+    message = update.message
+    if message.text:
+        return await submit_link(update, context)
+    
+    stage_id = context.user_data.get('submit_stage')
+    user_id = update.effective_user.id
+    
+    attachment, file_name = attachment_of(message)
+    try:
+        check_file(file_name, attachment.file_size, upload_limit(context.bot))
+    except FileRejected as e:
+        await message.reply_text(f"❌ This file can't be accepted: {e}.\n\nSend another file or a link:")
+        return State.SUBMIT_LINK.value
+    
+    ingest = context.bot_data.get('ingest')
+    if ingest is None or ingest.full():
+        await message.reply_text("⏳ Too many uploads right now. Please send the file again in a minute:")
+        return State.SUBMIT_LINK.value
+    
+    user = await db.get_user(user_id)
+    lang = user.get('language', 'en') if user else 'en'
+    
+    await db.create_submission(user_id, stage_id, None, submission_type='file',
+                               file_name=file_name, file_id=attachment.file_id)
+    if not ingest.submit(IngestJob(user_id, stage_id, attachment.file_id, file_name)):
+        # Filled up while the submission was being saved
+        await db.set_submission_file(user_id, stage_id, attachment.file_id, 'failed')
+        await message.reply_text("⏳ Too many uploads right now. Please send the file again in a minute:")
+        return State.SUBMIT_LINK.value
+    
+    await message.reply_text(
+        f"✅ Submission received!\n\n"
+        f"File: {file_name}\n"
+        "We'll let you know once it's saved.\n\n"
+        "Good luck! 🍀",
+        reply_markup=get_main_menu_keyboard(lang)
+    )
+    return ConversationHandler.END
+
+
 async def submit_link(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle submission link"""
     link = update.message.text.strip()
@@ -931,9 +1303,70 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
+class HackathonApplication(Application):
+    """Application that opens the database before persistence is loaded from it"""
+    
+    async def initialize(self) -> None:
+        # Runs on the loop that serves the bot (polling or webhook), so the
+        # pool and its listener belong to that loop
+        await db.connect()
+        await super().initialize()
+
+
+async def on_startup(application: Application) -> None:
+    """Plan notifications, start file ingestion and background jobs, serve metrics"""
+    scheduler = NotificationScheduler(application.bot, db)
+    scheduler.start()
+    application.bot_data['scheduler'] = scheduler
+    
+    ingest = IngestQueue(application.bot, db, FileStore())
+    await ingest.start()
+    application.bot_data['ingest'] = ingest
+    
+    jobs = JobRunner(application.bot, db)
+    await jobs.start()
+    application.bot_data['jobs'] = jobs
+    
+    if METRICS_PORT:
+        metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT)
+        try:
+            await metrics_server.start()
+        except OSError as e:
+            # Diagnostics only: a busy port (another replica, an exporter) must not stop the bot
+            logger.warning(f"Metrics endpoint not started on {METRICS_HOST}:{METRICS_PORT}: {e}")
+        else:
+            application.bot_data['metrics_server'] = metrics_server
+
+
+async def on_shutdown(application: Application) -> None:
+    """Stop background jobs, the scheduler, file ingestion and metrics endpoint, release database connections"""
+    jobs = application.bot_data.pop('jobs', None)
+    if jobs:
+        await jobs.stop()
+    scheduler = application.bot_data.pop('scheduler', None)
+    if scheduler:
+        scheduler.stop()
+    ingest = application.bot_data.pop('ingest', None)
+    if ingest:
+        await ingest.stop()
+    metrics_server = application.bot_data.pop('metrics_server', None)
+    if metrics_server:
+        await metrics_server.stop()
+    await db.close()
+
+
 def main() -> None:
     """Start the bot"""
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .application_class(HackathonApplication)
+        .token(BOT_TOKEN)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .persistence(DatabasePersistence(db))
+        .concurrent_updates(UserOrderedUpdateProcessor(UPDATE_CONCURRENCY))
+        .build()
+    )
     
     # Registration conversation
     registration_handler = ConversationHandler(
@@ -949,6 +1382,8 @@ def main() -> None:
             State.PINFL.value: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_pinfl)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="registration",
+        persistent=True,
     )
     
     # Team creation conversation
@@ -958,6 +1393,8 @@ def main() -> None:
             State.TEAM_NAME.value: [MessageHandler(filters.TEXT & ~filters.COMMAND, create_team_name)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="team_creation",
+        persistent=True,
     )
     
     # Team join conversation
@@ -967,6 +1404,8 @@ def main() -> None:
             State.TEAM_CODE.value: [MessageHandler(filters.TEXT & ~filters.COMMAND, join_team_code)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="team_join",
+        persistent=True,
     )
     
     # Submission conversation
@@ -982,6 +1421,8 @@ def main() -> None:
             ],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="submission",
+        persistent=True,
     )
     
     # Admin hackathon creation conversation
@@ -994,6 +1435,8 @@ def main() -> None:
             State.ADMIN_HACKATHON_PRIZE.value: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_hackathon_prize)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="admin_hackathon",
+        persistent=True,
     )
     
     # Admin stage creation conversation
@@ -1005,6 +1448,8 @@ def main() -> None:
             State.ADMIN_STAGE_TASK.value: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_stage_task)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="admin_stage",
+        persistent=True,
     )
     
     # Admin broadcast conversation
@@ -1014,6 +1459,8 @@ def main() -> None:
             State.ADMIN_BROADCAST.value: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_broadcast_send)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="admin_broadcast",
+        persistent=True,
     )
     
     # Add handlers in order
@@ -1028,6 +1475,8 @@ def main() -> None:
     # Command handlers
     application.add_handler(CommandHandler("admin", admin_panel))
     application.add_handler(CommandHandler("help", show_help))
+    application.add_handler(CommandHandler("score", admin_score))
+    application.add_handler(CommandHandler("results", admin_stage_results))
     
     # Callback handlers
     application.add_handler(CallbackQueryHandler(show_hackathons, pattern=r"^show_hackathons$"))
@@ -1037,6 +1486,7 @@ def main() -> None:
     application.add_handler(CallbackQueryHandler(leave_team, pattern=r"^leave_team_\d+$"))
     application.add_handler(CallbackQueryHandler(show_stages, pattern=r"^stages_\d+$"))
     application.add_handler(CallbackQueryHandler(show_stage_details, pattern=r"^stage_\d+$"))
+    application.add_handler(CallbackQueryHandler(show_leaderboard, pattern=r"^leaderboard_(stage_)?\d+$"))
     application.add_handler(CallbackQueryHandler(change_language, pattern=r"^lang_"))
     application.add_handler(CallbackQueryHandler(edit_gender, pattern=r"^edit_gender$"))
     application.add_handler(CallbackQueryHandler(set_gender, pattern=r"^set_gender_"))
@@ -1047,6 +1497,11 @@ def main() -> None:
     application.add_handler(CallbackQueryHandler(admin_stats, pattern=r"^admin_stats$"))
     application.add_handler(CallbackQueryHandler(admin_broadcast_start, pattern=r"^admin_broadcast$"))
     application.add_handler(CallbackQueryHandler(admin_export_submissions, pattern=r"^admin_export$"))
+    application.add_handler(CallbackQueryHandler(admin_jobs, pattern=r"^admin_jobs$"))
+    application.add_handler(CallbackQueryHandler(cancel_job, pattern=r"^job_cancel_\d+$"))
+    application.add_handler(CallbackQueryHandler(admin_metrics, pattern=r"^admin_metrics$"))
+    application.add_handler(CallbackQueryHandler(admin_db_profile, pattern=r"^admin_db_profile$"))
+    application.add_handler(CallbackQueryHandler(admin_leaderboards, pattern=r"^admin_leaderboards$"))
     application.add_handler(CallbackQueryHandler(export_hackathon_submissions, pattern=r"^export_hackathon_\d+$"))
     application.add_handler(CallbackQueryHandler(admin_manage_stages, pattern=r"^admin_stages_list$"))
     application.add_handler(CallbackQueryHandler(admin_hackathon_stages, pattern=r"^admin_stages_\d+$"))
@@ -1059,80 +1514,18 @@ def main() -> None:
         handle_menu_buttons
     ))
     
+    # Latency, error and in-flight metrics for every handler above
+    instrument_handlers(application, {state.value: state.name for state in State})
+    
     # Run the bot
     print("🚀 Kod va G'oyalar Hackathons Bot is starting...")
     print("Press Ctrl+C to stop")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        import webhook
+        webhook.run(application, WEBHOOK_URL, WEBHOOK_PORT)
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
-if __name__ == "__main__":
-    main()points=[CallbackQueryHandler(join_team_start, pattern=r"^join_team_\d+$")],
-        states={
-            State.TEAM_CODE.value: [MessageHandler(filters.TEXT & ~filters.COMMAND, join_team_code)],
-        },
-        fallbacks=[CommandHandler("cancel", cancel)],
-    )
-    
-    # Submission conversation
-    submission_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(submit_start, pattern=r"^submit_\d+$")],
-        states={
-            State.SUBMIT_LINK.value: [MessageHandler(filters.TEXT & ~filters.COMMAND, submit_link)],
-        },
-        fallbacks=[CommandHandler("cancel", cancel)],
-    )
-    
-    # Admin hackathon creation conversation
-    admin_hackathon_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(admin_create_hackathon_start, pattern=r"^admin_create_hackathon$")],
-        states={
-            State.ADMIN_HACKATHON_NAME.value: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_hackathon_name)],
-            State.ADMIN_HACKATHON_DESC.value: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_hackathon_desc)],
-            State.ADMIN_HACKATHON_DATES.value: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_hackathon_dates)],
-        },
-        fallbacks=[CommandHandler("cancel", cancel)],
-    )
-    
-    # Admin broadcast conversation
-    admin_broadcast_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(admin_broadcast_select, pattern=r"^broadcast_to_")],
-        states={
-            State.ADMIN_BROADCAST.value: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_broadcast_send)],
-        },
-        fallbacks=[CommandHandler("cancel", cancel)],
-    )
-    
-    # Add handlers
-    application.add_handler(registration_handler)
-    application.add_handler(team_creation_handler)
-    application.add_handler(team_join_handler)
-    application.add_handler(submission_handler)
-    application.add_handler(admin_hackathon_handler)
-    application.add_handler(admin_broadcast_handler)
-    
-    # Command handlers
-    application.add_handler(CommandHandler("admin", admin_panel))
-    
-    # Callback handlers
-    application.add_handler(CallbackQueryHandler(show_hackathons, pattern=r"^show_hackathons$"))
-    application.add_handler(CallbackQueryHandler(show_hackathon_details, pattern=r"^hackathon_\d+$"))
-    application.add_handler(CallbackQueryHandler(register_hackathon, pattern=r"^register_\d+$"))
-    application.add_handler(CallbackQueryHandler(show_my_hackathon_details, pattern=r"^my_hackathon_\d+$"))
-    application.add_handler(CallbackQueryHandler(change_language, pattern=r"^lang_"))
-    application.add_handler(CallbackQueryHandler(show_user_data, pattern=r"^settings$"))
-    application.add_handler(CallbackQueryHandler(show_stages, pattern=r"^stages_\d+$"))
-    application.add_handler(CallbackQueryHandler(show_stage_details, pattern=r"^stage_\d+$"))
-    application.add_handler(CallbackQueryHandler(admin_broadcast_start, pattern=r"^admin_broadcast$"))
-    application.add_handler(CallbackQueryHandler(admin_stats, pattern=r"^admin_stats$"))
-    
-    # Menu button handler
-    application.add_handler(MessageHandler(
-        filters.TEXT & ~filters.COMMAND,
-        handle_menu_buttons
-    ))
-    
-    # Run the bot
-    print("🚀 Bot is starting...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
 if __name__ == "__main__":
     main()
@@ -0,0 +1,197 @@
+"""
+Broadcast engine for ITCom Hackathons Bot
+Delivers messages to many chats within Telegram's rate limits
+"""
+
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Sequence, Tuple, Union
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from config import BROADCAST_RATE, BROADCAST_PER_CHAT_RATE, BROADCAST_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket limiter shared by every sender of a bot"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for a while (used on 429 responses)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class BroadcastResult:
+    """Counters of a running or finished broadcast"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.started_at = time.monotonic()
+        self.finished = False
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def __repr__(self) -> str:
+        return (f"BroadcastResult(sent={self.sent}, failed={self.failed}, "
+                f"retried={self.retried}, total={self.total})")
+
+
+ProgressCallback = Callable[[BroadcastResult], Awaitable[None]]
+
+
+def _seconds(value: Union[int, float, timedelta]) -> float:
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class Broadcaster:
+    """Concurrent, rate-limited message sender.
+
+    A global token bucket keeps the bot under Telegram's bulk limit, a
+    per-chat interval keeps each chat under its own limit, and a fixed
+    number of workers bounds the requests in flight. RetryAfter pauses the
+    global bucket for the time Telegram asks for and retries the message.
+    """
+
+    def __init__(self, bot, rate: float = BROADCAST_RATE,
+                 per_chat_rate: float = BROADCAST_PER_CHAT_RATE,
+                 concurrency: int = BROADCAST_CONCURRENCY, max_retries: int = 3):
+        self.bot = bot
+        self.bucket = TokenBucket(rate)
+        self.per_chat_interval = 1 / per_chat_rate
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self._chat_ready: Dict[int, float] = {}
+
+    async def _wait_for_chat(self, chat_id: int) -> None:
+        now = time.monotonic()
+        ready = self._chat_ready.get(chat_id, 0.0)
+        self._chat_ready[chat_id] = max(now, ready) + self.per_chat_interval
+
+        if len(self._chat_ready) > 50000:
+            self._chat_ready = {k: v for k, v in self._chat_ready.items() if v > now}
+
+        if ready > now:
+            await asyncio.sleep(ready - now)
+
+    async def _deliver(self, chat_id: int, text: str, result: BroadcastResult, **kwargs) -> None:
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_chat(chat_id)
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                result.sent += 1
+                return
+            except RetryAfter as e:
+                delay = _seconds(e.retry_after)
+                logger.warning(f"Flood limit hit, pausing broadcast for {delay}s")
+                self.bucket.pause(delay)
+                result.retried += 1
+                await asyncio.sleep(delay)
+            except (Forbidden, BadRequest) as e:
+                # Blocked the bot, deleted account, bad chat id: retrying won't help
+                logger.warning(f"Failed to send to {chat_id}: {e}")
+                break
+            except NetworkError as e:
+                logger.warning(f"Network error sending to {chat_id} (attempt {attempt + 1}): {e}")
+                result.retried += 1
+                await asyncio.sleep(0.5 * 2 ** attempt)
+            except Exception as e:
+                logger.error(f"Failed to send to {chat_id}: {e}")
+                break
+
+        result.failed += 1
+
+    async def broadcast(self, messages: Sequence[Tuple[int, str]],
+                        progress: Optional[ProgressCallback] = None,
+                        progress_interval: float = 5.0, **kwargs) -> BroadcastResult:
+        """Send (chat_id, text) pairs and return the delivery counters.
+
+        ``progress`` is awaited every ``progress_interval`` seconds while the
+        broadcast runs and once more when it has finished.
+        """
+        result = BroadcastResult(len(messages))
+        pending = iter(messages)
+
+        async def worker():
+            for chat_id, text in pending:
+                await self._deliver(chat_id, text, result, **kwargs)
+
+        async def report():
+            while True:
+                await asyncio.sleep(progress_interval)
+                await self._report(progress, result)
+
+        reporter = asyncio.create_task(report()) if progress else None
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(messages)))))
+        finally:
+            if reporter:
+                reporter.cancel()
+
+        result.finished = True
+        if progress:
+            await self._report(progress, result)
+
+        logger.info(f"Broadcast finished in {result.elapsed:.1f}s: {result}")
+        return result
+
+    async def send(self, chat_ids: Iterable[int], text: str,
+                   progress: Optional[ProgressCallback] = None, **kwargs) -> BroadcastResult:
+        """Send the same text to every chat"""
+        return await self.broadcast([(chat_id, text) for chat_id in chat_ids], progress, **kwargs)
+
+    @staticmethod
+    async def _report(progress: ProgressCallback, result: BroadcastResult) -> None:
+        try:
+            await progress(result)
+        except Exception as e:
+            logger.warning(f"Broadcast progress callback failed: {e}")
+
+
+_broadcasters: Dict[str, Broadcaster] = {}
+
+
+def get_broadcaster(bot) -> Broadcaster:
+    """Return the broadcaster shared by everything that sends through ``bot``"""
+    broadcaster = _broadcasters.get(bot.token)
+    if broadcaster is None:
+        broadcaster = _broadcasters[bot.token] = Broadcaster(bot)
+    return broadcaster
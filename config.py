@@ -35,8 +35,12 @@ FAQ_URL = os.getenv('FAQ_URL', 'https://drive.google.com/file/d/1rhwoJX6gzIdoQTa
 TIMEZONE = os.getenv('TIMEZONE', 'Asia/Tashkent')
 
 # Webhook settings (for production)
+# Setting WEBHOOK_URL switches from polling to webhook mode; the webhook listens on
+# WEBHOOK_PORT, or on the PORT the host assigns to web processes (Heroku, Railway)
 WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
-WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT') or os.getenv('PORT') or '8443')
+# Secret Telegram sends back in every webhook request (derived from BOT_TOKEN if empty)
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
 
 # Logging level
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -47,6 +51,16 @@ MAX_TEAM_SIZE = int(os.getenv('MAX_TEAM_SIZE', '5'))
 # File upload settings
 MAX_FILE_SIZE_MB = int(os.getenv('MAX_FILE_SIZE_MB', '50'))
 
+# Submission files are stored here, one copy per distinct content (named by SHA-256)
+SUBMISSIONS_DIR = os.getenv('SUBMISSIONS_DIR', 'submissions')
+# Background downloads running at once, uploads waiting for one, and read size
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '4'))
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', '1000'))
+INGEST_CHUNK_SIZE = int(os.getenv('INGEST_CHUNK_SIZE', str(256 * 1024)))
+# Seconds a whole download may take, and at most between two chunks of it
+INGEST_DOWNLOAD_TIMEOUT = float(os.getenv('INGEST_DOWNLOAD_TIMEOUT', '600'))
+INGEST_READ_TIMEOUT = float(os.getenv('INGEST_READ_TIMEOUT', '60'))
+
 # Allowed file extensions for submissions
 ALLOWED_EXTENSIONS = [
     '.pdf', '.doc', '.docx', '.pptx', '.ppt',
@@ -56,3 +70,29 @@ ALLOWED_EXTENSIONS = [
     '.zip', '.rar', '.7z',
     '.txt', '.md', '.html', '.css', '.js', '.py'
 ]
+
+# Teams listed on a leaderboard
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', '10'))
+
+# Broadcast limits (Telegram allows ~30 messages/second in bulk, ~1/second per chat)
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))
+BROADCAST_PER_CHAT_RATE = float(os.getenv('BROADCAST_PER_CHAT_RATE', '1'))
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '20'))
+
+# Updates handled at once; a user's own updates always run one at a time, in
+# order (1 processes every update sequentially)
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '32'))
+
+# Background admin jobs (broadcasts, exports, stage results): how many run at
+# once, and how often (seconds) their progress message is edited
+JOB_CONCURRENCY = int(os.getenv('JOB_CONCURRENCY', '2'))
+JOB_PROGRESS_INTERVAL = float(os.getenv('JOB_PROGRESS_INTERVAL', '3'))
+
+# Conversation persistence: how often (seconds) changed conversation states and
+# user_data are written to the database in one batch
+PERSISTENCE_INTERVAL = float(os.getenv('PERSISTENCE_INTERVAL', '5'))
+
+# Handler metrics in the Prometheus text format on http://METRICS_HOST:METRICS_PORT/metrics
+# (METRICS_PORT=0 disables the endpoint; if the port is taken the bot starts without it)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
@@ -4,383 +4,599 @@ Supports PostgreSQL (production) and SQLite (development)
 """
 
 import asyncio
+import json
+import logging
 import os
 import random
+import re
 import string
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import Optional, List, Dict, Any, AsyncIterator, Awaitable, Callable, Iterator, Set
 
 import asyncpg
 import aiosqlite
 
+from migrations import migrate_postgres, migrate_sqlite
+from profiler import QueryProfiler, TimedPool
+from statements import (
+    EXPORT_SUBMISSIONS_SQL, HACKATHON_FIELDS, MY_HACKATHON_VIEW_SQL, STATEMENTS,
+    PreparedConnection, StatementRegistry,
+)
+
+logger = logging.getLogger(__name__)
+
 # Check if we're using PostgreSQL or SQLite
 DATABASE_URL = os.getenv('DATABASE_URL', '')
 USE_POSTGRES = DATABASE_URL.startswith('postgres')
 
+# PostgreSQL pool size
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '5'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '20'))
+
+# SQLite settings (development backend)
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'hackathon_bot.db')
+SQLITE_READERS = int(os.getenv('SQLITE_READERS', '4'))
+
+# In-process hackathon/stage catalog; the TTL only bounds staleness if a
+# change notification is missed
+CATALOG_TTL = float(os.getenv('CATALOG_TTL', '300'))
+CATALOG_CHANNEL = 'catalog_changed'
+
+# Score changes made by other replicas, so their leaderboards are reloaded
+SCORES_CHANNEL = 'scores_changed'
+
+# Reconnect delays (seconds, doubling) when the LISTEN connection drops
+LISTENER_RETRY_MIN = float(os.getenv('LISTENER_RETRY_MIN', '1'))
+LISTENER_RETRY_MAX = float(os.getenv('LISTENER_RETRY_MAX', '60'))
+
+# In-process user cache
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '300'))
+
+# Query profiler (off by default): per-method timings, and calls slower than
+# SLOW_QUERY_MS go to the 'slow_queries' log with PINFL/phone redacted
+DB_PROFILE = os.getenv('DB_PROFILE', '').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+
 
 def generate_team_code(length: int = 6) -> str:
     """Generate a random team code"""
     return ''.join(random.choices(string.digits, k=length))
 
 
+def team_code_candidates(length: int = 6, attempts_per_length: int = 8,
+                         max_length: int = 10) -> Iterator[str]:
+    """Random team codes to try in turn
+    
+    If a whole round of attempts collides the code space is getting full, so
+    the next round uses one more digit (up to the column's 10 characters).
+    """
+    for size in range(length, max_length + 1):
+        for _ in range(attempts_per_length):
+            yield generate_team_code(size)
+    raise RuntimeError("Could not allocate a free team code")
+
+
+# Hot lookups run once per SQLite reader at startup so they sit in its
+# statement cache (PostgreSQL connections prepare every statement instead)
+WARMUP_QUERIES = [
+    (STATEMENTS['get_user'], (0,)),
+    (STATEMENTS['get_user_hackathon_registration'], (0, 0)),
+    (STATEMENTS['get_submission'], (0, 0)),
+    (STATEMENTS['get_team'], (0,)),
+    (STATEMENTS['get_team_by_code'], ('',)),
+]
+
+
+def to_date(value: Any) -> Any:
+    """ISO date strings as date objects: asyncpg won't bind a str to a DATE column"""
+    if isinstance(value, str) and value:
+        return date.fromisoformat(value)
+    return value
+
+
+def to_sqlite(sql: str) -> str:
+    """Rewrite numbered PostgreSQL placeholders ($1, $2...) as SQLite '?'"""
+    return re.sub(r'\$\d+', '?', sql)
+
+
+class SQLitePool:
+    """Long-lived SQLite connections: one serialized writer and N readers.
+
+    WAL journaling lets the readers run concurrently with the writer, so
+    lookups never wait behind an INSERT and no method pays for opening the
+    file (and spawning an aiosqlite thread) on every call.
+    """
+
+    PRAGMAS = (
+        'PRAGMA journal_mode = WAL',
+        'PRAGMA synchronous = NORMAL',
+        'PRAGMA busy_timeout = 5000',
+        'PRAGMA temp_store = MEMORY',
+        'PRAGMA cache_size = -16000',
+        'PRAGMA mmap_size = 134217728',
+    )
+
+    def __init__(self, path: str, readers: int = 4,
+                 on_wait: Optional[Callable[[float], None]] = None):
+        self.path = path
+        self.size = max(1, readers)
+        self.on_wait = on_wait
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._readers: asyncio.Queue = asyncio.Queue()
+        self.readers: List[aiosqlite.Connection] = []
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.path)
+        conn.row_factory = aiosqlite.Row
+        for pragma in self.PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+    async def open(self) -> None:
+        """Open the writer first (it switches the file to WAL), then the readers"""
+        self._writer = await self._connect()
+        for _ in range(self.size):
+            conn = await self._connect()
+            self.readers.append(conn)
+            self._readers.put_nowait(conn)
+
+    async def close(self) -> None:
+        """Close every connection held by the pool"""
+        for conn in self.readers:
+            await conn.close()
+        self.readers.clear()
+        self._readers = asyncio.Queue()
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+
+    @asynccontextmanager
+    async def read(self):
+        """Borrow a reader connection"""
+        started = time.perf_counter()
+        conn = await self._readers.get()
+        if self.on_wait:
+            self.on_wait(time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def write(self):
+        """Hold the writer connection; uncommitted work is rolled back on error"""
+        started = time.perf_counter()
+        async with self._write_lock:
+            if self.on_wait:
+                self.on_wait(time.perf_counter() - started)
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+
+class UserCache:
+    """LRU cache of user rows with a per-entry time-to-live
+
+    generation counts invalidations: a row read from the database is only
+    stored if no invalidation happened since the read started, the way the
+    catalog drops a snapshot that a concurrent write made stale.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return dict(entry[1])
+
+    def put(self, user_id: int, user: Dict[str, Any], generation: Optional[int] = None) -> None:
+        """Store a row; pass the generation from before it was read"""
+        if self.max_size <= 0 or (generation is not None and generation != self.generation):
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl, dict(user))
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        self.generation += 1
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+class Catalog:
+    """Snapshot of the hackathons and stages tables"""
+
+    def __init__(self, hackathons: List[Dict[str, Any]], stages: List[Dict[str, Any]]):
+        self.hackathons = {row['id']: row for row in hackathons}
+        self.stages = {row['id']: row for row in stages}
+        self.loaded_at = time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() - self.loaded_at > CATALOG_TTL
+
+
 class Database:
     def __init__(self):
         self.pool = None
-        self.sqlite_path = 'hackathon_bot.db'
+        self.sqlite = None
+        self.sqlite_path = SQLITE_PATH
+        self.user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+        self.catalog: Optional[Catalog] = None
+        self._catalog_version = 0
+        self._catalog_lock = asyncio.Lock()
+        self._listener = None
+        self._listener_task: Optional[asyncio.Task] = None
+        self._stage_listeners: List[Callable[[int], Awaitable[None]]] = []
+        self._score_listeners: List[Callable[[Dict[str, Any]], Awaitable[None]]] = []
+        # Tells this process's own score notifications apart from other replicas'
+        self.instance_id = os.urandom(6).hex()
+        self.statements = StatementRegistry()
+        self.schema_version = 0
+        self._init_lock = asyncio.Lock()
         self._initialized = False
+        
+        self.profiler: Optional[QueryProfiler] = None
+        if DB_PROFILE:
+            self.profiler = QueryProfiler(SLOW_QUERY_MS)
+            self.profiler.attach(self)
     
-    async def _ensure_initialized(self):
-        """Ensure database is initialized"""
+    async def connect(self) -> None:
+        """Create the connection pool, apply migrations and load the catalog
+        
+        Called once from the application's startup hook; concurrent callers
+        wait for the first one instead of creating pools of their own.
+        """
         if self._initialized:
             return
         
-        if USE_POSTGRES:
-            await self._init_postgres()
-        else:
-            await self._init_sqlite()
-        
-        self._initialized = True
+        async with self._init_lock:
+            if self._initialized:
+                return
+            
+            if USE_POSTGRES:
+                await self._init_postgres()
+            else:
+                await self._init_sqlite()
+            
+            self._initialized = True
+            await self._get_catalog()
+    
+    async def close(self) -> None:
+        """Close the connection pool"""
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            self._listener_task = None
+        if self._listener is not None:
+            self._listener.remove_termination_listener(self._on_listener_lost)
+            await self._listener.close()
+            self._listener = None
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+        if self.sqlite is not None:
+            await self.sqlite.close()
+            self.sqlite = None
+        self.user_cache.clear()
+        self.catalog = None
+        self._initialized = False
     
     async def _init_postgres(self):
-        """Initialize PostgreSQL connection pool"""
-        self.pool = await asyncpg.create_pool(DATABASE_URL)
+        """Apply migrations, then create the PostgreSQL connection pool"""
+        # Migrate on a standalone connection so pooled connections prepare
+        # their statements against the final schema
+        conn = await asyncpg.connect(DATABASE_URL)
+        try:
+            self.schema_version = await migrate_postgres(conn)
+        finally:
+            await conn.close()
         
-        async with self.pool.acquire() as conn:
-            # Create tables
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id BIGINT PRIMARY KEY,
-                    username VARCHAR(255),
-                    first_name VARCHAR(255),
-                    last_name VARCHAR(255),
-                    birth_date DATE,
-                    phone VARCHAR(50),
-                    pinfl VARCHAR(20),
-                    gender VARCHAR(20),
-                    location VARCHAR(255),
-                    language VARCHAR(5) DEFAULT 'en',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS hackathons (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    description TEXT,
-                    start_date DATE,
-                    end_date DATE,
-                    prize_pool VARCHAR(100),
-                    image_url TEXT,
-                    is_active BOOLEAN DEFAULT TRUE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS teams (
-                    id SERIAL PRIMARY KEY,
-                    hackathon_id INTEGER REFERENCES hackathons(id),
-                    name VARCHAR(255) NOT NULL,
-                    code VARCHAR(10) UNIQUE NOT NULL,
-                    leader_id BIGINT REFERENCES users(user_id),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS team_members (
-                    id SERIAL PRIMARY KEY,
-                    team_id INTEGER REFERENCES teams(id),
-                    user_id BIGINT REFERENCES users(user_id),
-                    role VARCHAR(100) DEFAULT 'Member',
-                    joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(team_id, user_id)
-                )
-            ''')
-            
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS registrations (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT REFERENCES users(user_id),
-                    hackathon_id INTEGER REFERENCES hackathons(id),
-                    team_id INTEGER REFERENCES teams(id),
-                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id, hackathon_id)
-                )
-            ''')
-            
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS stages (
-                    id SERIAL PRIMARY KEY,
-                    hackathon_id INTEGER REFERENCES hackathons(id),
-                    number INTEGER NOT NULL,
-                    name VARCHAR(255) NOT NULL,
-                    task_description TEXT,
-                    start_date DATE,
-                    end_date DATE,
-                    is_active BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS submissions (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT REFERENCES users(user_id),
-                    stage_id INTEGER REFERENCES stages(id),
-                    team_id INTEGER REFERENCES teams(id),
-                    link TEXT,
-                    notes TEXT,
-                    submission_type VARCHAR(50) DEFAULT 'link',
-                    file_name VARCHAR(255),
-                    submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    score DECIMAL(5,2),
-                    UNIQUE(user_id, stage_id)
-                )
-            ''')
-            
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS announcements (
-                    id SERIAL PRIMARY KEY,
-                    hackathon_id INTEGER REFERENCES hackathons(id),
-                    title VARCHAR(255),
-                    content TEXT NOT NULL,
-                    sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+        self.pool = await asyncpg.create_pool(
+            DATABASE_URL,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            connection_class=PreparedConnection,
+            statement_cache_size=self.statements.cache_size,
+            init=self.statements.prepare_all,
+        )
+        if self.profiler:
+            self.pool = TimedPool(self.pool, self.profiler.record_wait)
+        
+        await self._listen()
+    
+    async def _listen(self) -> None:
+        """Open the connection that receives catalog and score notifications"""
+        # Dedicated connection: pooled connections drop their listeners on release
+        listener = await asyncpg.connect(DATABASE_URL)
+        try:
+            await listener.add_listener(CATALOG_CHANNEL, self._on_catalog_notify)
+            await listener.add_listener(SCORES_CHANNEL, self._on_scores_notify)
+        except BaseException:
+            await listener.close()
+            raise
+        listener.add_termination_listener(self._on_listener_lost)
+        self._listener = listener
     
     async def _init_sqlite(self):
-        """Initialize SQLite database"""
-        async with aiosqlite.connect(self.sqlite_path) as db:
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    birth_date TEXT,
-                    phone TEXT,
-                    pinfl TEXT,
-                    gender TEXT,
-                    location TEXT,
-                    language TEXT DEFAULT 'en',
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS hackathons (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    description TEXT,
-                    start_date TEXT,
-                    end_date TEXT,
-                    prize_pool TEXT,
-                    image_url TEXT,
-                    is_active INTEGER DEFAULT 1,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS teams (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    hackathon_id INTEGER,
-                    name TEXT NOT NULL,
-                    code TEXT UNIQUE NOT NULL,
-                    leader_id INTEGER,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (hackathon_id) REFERENCES hackathons(id),
-                    FOREIGN KEY (leader_id) REFERENCES users(user_id)
-                )
-            ''')
-            
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS team_members (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    team_id INTEGER,
-                    user_id INTEGER,
-                    role TEXT DEFAULT 'Member',
-                    joined_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (team_id) REFERENCES teams(id),
-                    FOREIGN KEY (user_id) REFERENCES users(user_id),
-                    UNIQUE(team_id, user_id)
-                )
-            ''')
-            
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS registrations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    hackathon_id INTEGER,
-                    team_id INTEGER,
-                    registered_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id),
-                    FOREIGN KEY (hackathon_id) REFERENCES hackathons(id),
-                    FOREIGN KEY (team_id) REFERENCES teams(id),
-                    UNIQUE(user_id, hackathon_id)
-                )
-            ''')
-            
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS stages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    hackathon_id INTEGER,
-                    number INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    task_description TEXT,
-                    start_date TEXT,
-                    end_date TEXT,
-                    is_active INTEGER DEFAULT 0,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (hackathon_id) REFERENCES hackathons(id)
-                )
-            ''')
-            
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS submissions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    stage_id INTEGER,
-                    team_id INTEGER,
-                    link TEXT,
-                    notes TEXT,
-                    submission_type TEXT DEFAULT 'link',
-                    file_name TEXT,
-                    submitted_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    score REAL,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id),
-                    FOREIGN KEY (stage_id) REFERENCES stages(id),
-                    FOREIGN KEY (team_id) REFERENCES teams(id),
-                    UNIQUE(user_id, stage_id)
-                )
-            ''')
+        """Initialize SQLite connection pool and apply migrations"""
+        self.sqlite = SQLitePool(self.sqlite_path, SQLITE_READERS,
+                                 on_wait=self.profiler.record_wait if self.profiler else None)
+        await self.sqlite.open()
+        
+        async with self.sqlite.write() as db:
+            self.schema_version = await migrate_sqlite(db)
+        
+        for conn in self.sqlite.readers:
+            await self._warm_up_sqlite(conn)
+    
+    @staticmethod
+    async def _warm_up_sqlite(db) -> None:
+        """Run the hot lookups once so they sit in the connection's statement cache"""
+        for sql, args in WARMUP_QUERIES:
+            async with db.execute(to_sqlite(sql), args) as cursor:
+                await cursor.fetchall()
+    
+    # ============== CATALOG CACHE ==============
+    
+    async def _get_catalog(self) -> Catalog:
+        """Return the cached catalog, loading it if missing or expired"""
+        catalog = self.catalog
+        if catalog is not None and not catalog.expired:
+            return catalog
+        
+        async with self._catalog_lock:
+            if self.catalog is not None and not self.catalog.expired:
+                return self.catalog
             
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS announcements (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    hackathon_id INTEGER,
-                    title TEXT,
-                    content TEXT NOT NULL,
-                    sent_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (hackathon_id) REFERENCES hackathons(id)
-                )
-            ''')
+            version = self._catalog_version
+            if USE_POSTGRES:
+                async with self.pool.acquire() as conn:
+                    hackathons = [dict(row) for row in await self.statements.fetch(conn, 'catalog_hackathons')]
+                    stages = [dict(row) for row in await self.statements.fetch(conn, 'catalog_stages')]
+            else:
+                async with self.sqlite.read() as db:
+                    async with db.execute('SELECT * FROM hackathons') as cursor:
+                        hackathons = [dict(row) for row in await cursor.fetchall()]
+                    async with db.execute('SELECT * FROM stages') as cursor:
+                        stages = [dict(row) for row in await cursor.fetchall()]
             
-            await db.commit()
+            catalog = Catalog(hackathons, stages)
+            # Don't publish a snapshot that a concurrent write already made stale
+            if version == self._catalog_version:
+                self.catalog = catalog
+            return catalog
+    
+    def invalidate_catalog(self) -> None:
+        """Drop the cached hackathons and stages"""
+        self._catalog_version += 1
+        self.catalog = None
+    
+    async def _catalog_changed(self, conn=None) -> None:
+        """Invalidate the catalog here and, on PostgreSQL, in every other replica"""
+        self.invalidate_catalog()
+        if conn is not None:
+            await self.statements.execute(conn, 'notify', CATALOG_CHANNEL, '')
+    
+    def _on_catalog_notify(self, connection, pid, channel, payload) -> None:
+        self.invalidate_catalog()
+    
+    def _on_listener_lost(self, connection) -> None:
+        # Until it is back, the TTL is the only bound on catalog staleness
+        logger.warning("Notification listener connection lost; reconnecting")
+        self._listener = None
+        self.invalidate_catalog()
+        if self._initialized and self._listener_task is None:
+            self._listener_task = asyncio.get_running_loop().create_task(self._relisten())
+    
+    async def _relisten(self) -> None:
+        """Reopen the listener connection, backing off between attempts"""
+        delay = LISTENER_RETRY_MIN
+        try:
+            while True:
+                try:
+                    await self._listen()
+                    break
+                except Exception as e:
+                    logger.warning(f"Notification listener reconnect failed ({e}); retrying in {delay:g}s")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, LISTENER_RETRY_MAX)
+        finally:
+            self._listener_task = None
+        
+        # Notifications sent while disconnected are lost: drop everything they could have changed
+        logger.info("Notification listener reconnected")
+        self.invalidate_catalog()
+        await self._scores_changed({'stage_id': None, 'hackathon_id': None, 'team_id': None, 'remote': True})
+    
+    def add_stage_listener(self, callback: Callable[[int], Awaitable[None]]) -> None:
+        """Await ``callback(stage_id)`` whenever a stage is created or changed"""
+        self._stage_listeners.append(callback)
+    
+    def remove_stage_listener(self, callback: Callable[[int], Awaitable[None]]) -> None:
+        if callback in self._stage_listeners:
+            self._stage_listeners.remove(callback)
+    
+    async def _stage_changed(self, stage_id: int) -> None:
+        for callback in list(self._stage_listeners):
+            try:
+                await callback(stage_id)
+            except Exception as e:
+                logger.error(f"Stage listener failed for stage {stage_id}: {e}")
+    
+    def add_score_listener(self, callback: Callable[[Dict[str, Any]], Awaitable[None]]) -> None:
+        """Await ``callback(change)`` whenever a team's stage score changes
+        
+        change has stage_id, hackathon_id and team_id, plus the team's
+        previous and new best score ('previous', 'score'; None when it had
+        or has none). Changes made by another replica carry remote=True and
+        no scores; a remote change with stage_id None means any score may
+        have changed (notifications were missed while reconnecting).
+        """
+        self._score_listeners.append(callback)
+    
+    def remove_score_listener(self, callback: Callable[[Dict[str, Any]], Awaitable[None]]) -> None:
+        if callback in self._score_listeners:
+            self._score_listeners.remove(callback)
+    
+    async def _scores_changed(self, change: Dict[str, Any]) -> None:
+        for callback in list(self._score_listeners):
+            try:
+                await callback(change)
+            except Exception as e:
+                logger.error(f"Score listener failed for stage {change['stage_id']}: {e}")
+    
+    def _on_scores_notify(self, connection, pid, channel, payload) -> None:
+        instance_id, stage_id, hackathon_id, team_id = payload.split(':')
+        if instance_id == self.instance_id:
+            return
+        change = {'stage_id': int(stage_id), 'hackathon_id': int(hackathon_id),
+                  'team_id': int(team_id), 'remote': True}
+        asyncio.get_running_loop().create_task(self._scores_changed(change))
     
     # ============== USER METHODS ==============
     
     async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Get user by ID"""
-        await self._ensure_initialized()
+        """Get user by ID (served from the user cache when possible)"""
+        cached = self.user_cache.get(user_id)
+        if cached is not None:
+            return cached
         
+        generation = self.user_cache.generation
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                row = await conn.fetchrow(
-                    'SELECT * FROM users WHERE user_id = $1', user_id
-                )
-                return dict(row) if row else None
+                row = await self.statements.fetchrow(conn, 'get_user', user_id)
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                db.row_factory = aiosqlite.Row
+            async with self.sqlite.read() as db:
                 async with db.execute(
                     'SELECT * FROM users WHERE user_id = ?', (user_id,)
                 ) as cursor:
                     row = await cursor.fetchone()
-                    return dict(row) if row else None
+        
+        if not row:
+            return None
+        user = dict(row)
+        self.user_cache.put(user_id, user, generation)
+        return user
+    
+    def statement_stats(self) -> List[Dict[str, Any]]:
+        """Execution counters of the prepared PostgreSQL statements"""
+        return self.statements.stats()
+    
+    def profile_dump(self) -> str:
+        """Report of the query profiler (DB_PROFILE=1)"""
+        if not self.profiler:
+            return "Query profiling is off; start the bot with DB_PROFILE=1"
+        return self.profiler.dump()
+    
+    def user_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the user cache"""
+        return self.user_cache.stats()
     
     async def create_user(self, user_id: int, username: str, first_name: str,
                          last_name: str, birth_date: str, phone: str, pinfl: str) -> Dict[str, Any]:
         """Create a new user"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                await conn.execute('''
-                    INSERT INTO users (user_id, username, first_name, last_name, birth_date, phone, pinfl)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7)
-                    ON CONFLICT (user_id) DO UPDATE SET
-                        username = $2, first_name = $3, last_name = $4,
-                        birth_date = $5, phone = $6, pinfl = $7, updated_at = CURRENT_TIMESTAMP
-                ''', user_id, username, first_name, last_name, birth_date, phone, pinfl)
+                await self.statements.execute(conn, 'create_user', user_id, username, first_name,
+                                              last_name, to_date(birth_date), phone, pinfl)
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
+            async with self.sqlite.write() as db:
                 await db.execute('''
                     INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, birth_date, phone, pinfl)
                     VALUES (?, ?, ?, ?, ?, ?, ?)
                 ''', (user_id, username, first_name, last_name, birth_date, phone, pinfl))
                 await db.commit()
         
+        self.user_cache.invalidate(user_id)
         return await self.get_user(user_id)
     
     async def update_user_language(self, user_id: int, language: str) -> None:
         """Update user's language preference"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                await conn.execute(
-                    'UPDATE users SET language = $1, updated_at = CURRENT_TIMESTAMP WHERE user_id = $2',
-                    language, user_id
-                )
+                await self.statements.execute(conn, 'update_user_language', language, user_id)
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
+            async with self.sqlite.write() as db:
                 await db.execute(
                     'UPDATE users SET language = ? WHERE user_id = ?',
                     (language, user_id)
                 )
                 await db.commit()
+        
+        self.user_cache.invalidate(user_id)
     
     async def update_user_field(self, user_id: int, field: str, value: str) -> None:
         """Update a specific user field"""
-        await self._ensure_initialized()
-        
         allowed_fields = ['first_name', 'last_name', 'birth_date', 'gender', 'location']
         if field not in allowed_fields:
             raise ValueError(f"Field {field} is not allowed to be updated")
         
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                await conn.execute(
-                    f'UPDATE users SET {field} = $1, updated_at = CURRENT_TIMESTAMP WHERE user_id = $2',
-                    value, user_id
-                )
+                if field == 'birth_date':
+                    value = to_date(value)
+                await self.statements.execute(conn, f'update_user_{field}', value, user_id)
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
+            async with self.sqlite.write() as db:
                 await db.execute(
                     f'UPDATE users SET {field} = ? WHERE user_id = ?',
                     (value, user_id)
                 )
                 await db.commit()
+        
+        self.user_cache.invalidate(user_id)
     
     async def get_all_users(self) -> List[Dict[str, Any]]:
         """Get all users"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                rows = await conn.fetch('SELECT * FROM users')
+                rows = await self.statements.fetch(conn, 'get_all_users')
                 return [dict(row) for row in rows]
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                db.row_factory = aiosqlite.Row
+            async with self.sqlite.read() as db:
                 async with db.execute('SELECT * FROM users') as cursor:
                     rows = await cursor.fetchall()
                     return [dict(row) for row in rows]
     
     async def count_users(self) -> int:
         """Count total users"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                return await conn.fetchval('SELECT COUNT(*) FROM users')
+                return await self.statements.fetchval(conn, 'count_users')
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
+            async with self.sqlite.read() as db:
                 async with db.execute('SELECT COUNT(*) FROM users') as cursor:
                     row = await cursor.fetchone()
                     return row[0]
@@ -389,170 +605,128 @@ class Database:
     
     async def get_hackathon(self, hackathon_id: int) -> Optional[Dict[str, Any]]:
         """Get hackathon by ID"""
-        await self._ensure_initialized()
-        
-        if USE_POSTGRES:
-            async with self.pool.acquire() as conn:
-                row = await conn.fetchrow(
-                    'SELECT * FROM hackathons WHERE id = $1', hackathon_id
-                )
-                return dict(row) if row else None
-        else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                db.row_factory = aiosqlite.Row
-                async with db.execute(
-                    'SELECT * FROM hackathons WHERE id = ?', (hackathon_id,)
-                ) as cursor:
-                    row = await cursor.fetchone()
-                    return dict(row) if row else None
+        catalog = await self._get_catalog()
+        row = catalog.hackathons.get(hackathon_id)
+        return dict(row) if row else None
     
     async def get_active_hackathons(self) -> List[Dict[str, Any]]:
         """Get all active hackathons"""
-        await self._ensure_initialized()
-        
-        if USE_POSTGRES:
-            async with self.pool.acquire() as conn:
-                rows = await conn.fetch(
-                    'SELECT * FROM hackathons WHERE is_active = TRUE ORDER BY start_date'
-                )
-                return [dict(row) for row in rows]
-        else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                db.row_factory = aiosqlite.Row
-                async with db.execute(
-                    'SELECT * FROM hackathons WHERE is_active = 1 ORDER BY start_date'
-                ) as cursor:
-                    rows = await cursor.fetchall()
-                    return [dict(row) for row in rows]
+        catalog = await self._get_catalog()
+        rows = [row for row in catalog.hackathons.values() if row['is_active']]
+        rows.sort(key=lambda row: (row['start_date'] is None, row['start_date'] or ''))
+        return [dict(row) for row in rows]
     
     async def get_all_hackathons(self) -> List[Dict[str, Any]]:
         """Get all hackathons"""
-        await self._ensure_initialized()
-        
-        if USE_POSTGRES:
-            async with self.pool.acquire() as conn:
-                rows = await conn.fetch('SELECT * FROM hackathons ORDER BY created_at DESC')
-                return [dict(row) for row in rows]
-        else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                db.row_factory = aiosqlite.Row
-                async with db.execute('SELECT * FROM hackathons ORDER BY created_at DESC') as cursor:
-                    rows = await cursor.fetchall()
-                    return [dict(row) for row in rows]
+        catalog = await self._get_catalog()
+        rows = sorted(catalog.hackathons.values(), key=lambda row: row['id'], reverse=True)
+        return [dict(row) for row in rows]
     
     async def create_hackathon(self, name: str, description: str, start_date: str,
                                end_date: str, prize_pool: str = None, image_url: str = None) -> Dict[str, Any]:
         """Create a new hackathon"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                row = await conn.fetchrow('''
-                    INSERT INTO hackathons (name, description, start_date, end_date, prize_pool, image_url)
-                    VALUES ($1, $2, $3, $4, $5, $6)
-                    RETURNING *
-                ''', name, description, start_date, end_date, prize_pool, image_url)
+                row = await self.statements.fetchrow(conn, 'create_hackathon', name, description,
+                                                     to_date(start_date), to_date(end_date),
+                                                     prize_pool, image_url)
+                await self._catalog_changed(conn)
                 return dict(row)
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
+            async with self.sqlite.write() as db:
                 cursor = await db.execute('''
                     INSERT INTO hackathons (name, description, start_date, end_date, prize_pool, image_url)
                     VALUES (?, ?, ?, ?, ?, ?)
                 ''', (name, description, start_date, end_date, prize_pool, image_url))
                 await db.commit()
+                await self._catalog_changed()
                 return await self.get_hackathon(cursor.lastrowid)
     
     async def update_hackathon(self, hackathon_id: int, **kwargs) -> None:
-        """Update hackathon fields"""
-        await self._ensure_initialized()
-        
-        allowed_fields = ['name', 'description', 'start_date', 'end_date', 'prize_pool', 'image_url', 'is_active']
-        updates = {k: v for k, v in kwargs.items() if k in allowed_fields}
-        
+        """Update hackathon fields (name, description, start_date, end_date, prize_pool, image_url, is_active)"""
+        updates = kwargs
+        for key in updates:
+            if key not in HACKATHON_FIELDS:
+                raise ValueError(f"Field {key} is not allowed to be updated")
         if not updates:
             return
         
         if USE_POSTGRES:
-            set_clause = ', '.join(f'{k} = ${i+2}' for i, k in enumerate(updates.keys()))
-            values = [hackathon_id] + list(updates.values())
             async with self.pool.acquire() as conn:
-                await conn.execute(
-                    f'UPDATE hackathons SET {set_clause} WHERE id = $1',
-                    *values
-                )
+                async with conn.transaction():
+                    for key, value in updates.items():
+                        if key in ('start_date', 'end_date'):
+                            value = to_date(value)
+                        await self.statements.execute(conn, f'update_hackathon_{key}', value, hackathon_id)
+                # After the commit, so no reload caches the old values
+                await self._catalog_changed(conn)
         else:
             set_clause = ', '.join(f'{k} = ?' for k in updates.keys())
             values = list(updates.values()) + [hackathon_id]
-            async with aiosqlite.connect(self.sqlite_path) as db:
+            async with self.sqlite.write() as db:
                 await db.execute(
                     f'UPDATE hackathons SET {set_clause} WHERE id = ?',
                     values
                 )
                 await db.commit()
+            await self._catalog_changed()
     
     # ============== TEAM METHODS ==============
     
     async def get_team(self, team_id: int) -> Optional[Dict[str, Any]]:
         """Get team by ID"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                row = await conn.fetchrow('SELECT * FROM teams WHERE id = $1', team_id)
+                row = await self.statements.fetchrow(conn, 'get_team', team_id)
                 return dict(row) if row else None
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                db.row_factory = aiosqlite.Row
+            async with self.sqlite.read() as db:
                 async with db.execute('SELECT * FROM teams WHERE id = ?', (team_id,)) as cursor:
                     row = await cursor.fetchone()
                     return dict(row) if row else None
     
     async def get_team_by_code(self, code: str) -> Optional[Dict[str, Any]]:
         """Get team by code"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                row = await conn.fetchrow('SELECT * FROM teams WHERE code = $1', code)
+                row = await self.statements.fetchrow(conn, 'get_team_by_code', code)
                 return dict(row) if row else None
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                db.row_factory = aiosqlite.Row
+            async with self.sqlite.read() as db:
                 async with db.execute('SELECT * FROM teams WHERE code = ?', (code,)) as cursor:
                     row = await cursor.fetchone()
                     return dict(row) if row else None
     
     async def create_team(self, hackathon_id: int, name: str, leader_id: int) -> Dict[str, Any]:
-        """Create a new team"""
-        await self._ensure_initialized()
-        
-        # Generate unique code
-        code = generate_team_code()
-        while await self.get_team_by_code(code):
-            code = generate_team_code()
+        """Create a new team
         
+        The code is reserved by the INSERT itself (ON CONFLICT DO NOTHING):
+        a taken code just means another attempt inside the same transaction,
+        without a lookup beforehand and without racing concurrent creates.
+        """
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                row = await conn.fetchrow('''
-                    INSERT INTO teams (hackathon_id, name, code, leader_id)
-                    VALUES ($1, $2, $3, $4)
-                    RETURNING *
-                ''', hackathon_id, name, code, leader_id)
-                team = dict(row)
-                
-                # Add leader as team member
-                await conn.execute('''
-                    INSERT INTO team_members (team_id, user_id, role)
-                    VALUES ($1, $2, $3)
-                ''', team['id'], leader_id, 'Team Lead')
-                
-                return team
+                async with conn.transaction():
+                    for code in team_code_candidates():
+                        row = await self.statements.fetchrow(conn, 'create_team', hackathon_id, name, code, leader_id)
+                        if row:
+                            break
+                    team = dict(row)
+                    
+                    # Add leader as team member
+                    await self.statements.execute(conn, 'add_team_leader', team['id'], leader_id, 'Team Lead')
+                    
+                    return team
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                cursor = await db.execute('''
-                    INSERT INTO teams (hackathon_id, name, code, leader_id)
-                    VALUES (?, ?, ?, ?)
-                ''', (hackathon_id, name, code, leader_id))
+            async with self.sqlite.write() as db:
+                for code in team_code_candidates():
+                    cursor = await db.execute('''
+                        INSERT INTO teams (hackathon_id, name, code, leader_id)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT (code) DO NOTHING
+                    ''', (hackathon_id, name, code, leader_id))
+                    if cursor.rowcount:
+                        break
                 team_id = cursor.lastrowid
                 
                 # Add leader as team member
@@ -566,17 +740,11 @@ class Database:
     
     async def add_team_member(self, team_id: int, user_id: int, role: str = 'Member') -> None:
         """Add a member to a team"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                await conn.execute('''
-                    INSERT INTO team_members (team_id, user_id, role)
-                    VALUES ($1, $2, $3)
-                    ON CONFLICT (team_id, user_id) DO NOTHING
-                ''', team_id, user_id, role)
+                await self.statements.execute(conn, 'add_team_member', team_id, user_id, role)
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
+            async with self.sqlite.write() as db:
                 await db.execute('''
                     INSERT OR IGNORE INTO team_members (team_id, user_id, role)
                     VALUES (?, ?, ?)
@@ -585,16 +753,11 @@ class Database:
     
     async def remove_team_member(self, team_id: int, user_id: int) -> None:
         """Remove a member from a team"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                await conn.execute(
-                    'DELETE FROM team_members WHERE team_id = $1 AND user_id = $2',
-                    team_id, user_id
-                )
+                await self.statements.execute(conn, 'remove_team_member', team_id, user_id)
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
+            async with self.sqlite.write() as db:
                 await db.execute(
                     'DELETE FROM team_members WHERE team_id = ? AND user_id = ?',
                     (team_id, user_id)
@@ -603,34 +766,43 @@ class Database:
     
     async def get_team_members(self, team_id: int) -> List[Dict[str, Any]]:
         """Get all members of a team"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                rows = await conn.fetch(
-                    'SELECT * FROM team_members WHERE team_id = $1', team_id
-                )
+                rows = await self.statements.fetch(conn, 'get_team_members', team_id)
                 return [dict(row) for row in rows]
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                db.row_factory = aiosqlite.Row
+            async with self.sqlite.read() as db:
                 async with db.execute(
                     'SELECT * FROM team_members WHERE team_id = ?', (team_id,)
                 ) as cursor:
                     rows = await cursor.fetchall()
                     return [dict(row) for row in rows]
     
+    async def get_team_roster(self, team_id: int) -> List[Dict[str, Any]]:
+        """Get team members joined with their user profiles"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                rows = await self.statements.fetch(conn, 'get_team_roster', team_id)
+                return [dict(row) for row in rows]
+        else:
+            async with self.sqlite.read() as db:
+                async with db.execute('''
+                    SELECT tm.*, u.username, u.first_name, u.last_name, u.language
+                    FROM team_members tm
+                    JOIN users u ON u.user_id = tm.user_id
+                    WHERE tm.team_id = ?
+                    ORDER BY tm.id
+                ''', (team_id,)) as cursor:
+                    rows = await cursor.fetchall()
+                    return [dict(row) for row in rows]
+    
     async def count_teams(self, hackathon_id: int) -> int:
         """Count teams in a hackathon"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                return await conn.fetchval(
-                    'SELECT COUNT(*) FROM teams WHERE hackathon_id = $1', hackathon_id
-                )
+                return await self.statements.fetchval(conn, 'count_teams', hackathon_id)
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
+            async with self.sqlite.read() as db:
                 async with db.execute(
                     'SELECT COUNT(*) FROM teams WHERE hackathon_id = ?', (hackathon_id,)
                 ) as cursor:
@@ -639,13 +811,11 @@ class Database:
     
     async def count_all_teams(self) -> int:
         """Count all teams"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                return await conn.fetchval('SELECT COUNT(*) FROM teams')
+                return await self.statements.fetchval(conn, 'count_all_teams')
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
+            async with self.sqlite.read() as db:
                 async with db.execute('SELECT COUNT(*) FROM teams') as cursor:
                     row = await cursor.fetchone()
                     return row[0]
@@ -654,17 +824,11 @@ class Database:
     
     async def register_user_for_hackathon(self, user_id: int, hackathon_id: int, team_id: int) -> None:
         """Register a user for a hackathon"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                await conn.execute('''
-                    INSERT INTO registrations (user_id, hackathon_id, team_id)
-                    VALUES ($1, $2, $3)
-                    ON CONFLICT (user_id, hackathon_id) DO UPDATE SET team_id = $3
-                ''', user_id, hackathon_id, team_id)
+                await self.statements.execute(conn, 'register_user_for_hackathon', user_id, hackathon_id, team_id)
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
+            async with self.sqlite.write() as db:
                 await db.execute('''
                     INSERT OR REPLACE INTO registrations (user_id, hackathon_id, team_id)
                     VALUES (?, ?, ?)
@@ -673,59 +837,125 @@ class Database:
     
     async def get_user_hackathon_registration(self, user_id: int, hackathon_id: int) -> Optional[Dict[str, Any]]:
         """Get user's registration for a specific hackathon"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                row = await conn.fetchrow('''
-                    SELECT * FROM registrations 
-                    WHERE user_id = $1 AND hackathon_id = $2
-                ''', user_id, hackathon_id)
+                row = await self.statements.fetchrow(conn, 'get_user_hackathon_registration', user_id, hackathon_id)
                 return dict(row) if row else None
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                db.row_factory = aiosqlite.Row
-                async with db.execute('''
-                    SELECT * FROM registrations 
-                    WHERE user_id = ? AND hackathon_id = ?
-                ''', (user_id, hackathon_id)) as cursor:
+            async with self.sqlite.read() as db:
+                async with db.execute(
+                    'SELECT * FROM registrations WHERE user_id = ? AND hackathon_id = ?',
+                    (user_id, hackathon_id)
+                ) as cursor:
                     row = await cursor.fetchone()
                     return dict(row) if row else None
     
+    async def get_my_hackathon_view(self, user_id: int, hackathon_id: int) -> Optional[Dict[str, Any]]:
+        """Get hackathon, user's registration, team and team roster in one query
+        
+        Returns None if the hackathon doesn't exist; 'registration' and 'team'
+        are None when the user isn't registered or has no team.
+        """
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                rows = await self.statements.fetch(conn, 'get_my_hackathon_view', hackathon_id, user_id)
+        else:
+            async with self.sqlite.read() as db:
+                # Positional: the user id placeholder comes first in the text
+                async with db.execute(MY_HACKATHON_VIEW_SQL.format(p1='?', p2='?'),
+                                      (user_id, hackathon_id)
+                ) as cursor:
+                    rows = await cursor.fetchall()
+        
+        if not rows:
+            return None
+        
+        first = rows[0]
+        view = {
+            'hackathon': {
+                'id': first['h_id'],
+                'name': first['h_name'],
+                'description': first['h_description'],
+                'start_date': first['h_start_date'],
+                'end_date': first['h_end_date'],
+                'prize_pool': first['h_prize_pool'],
+                'is_active': first['h_is_active'],
+            },
+            'registration': None,
+            'team': None,
+            'roster': [],
+        }
+        if first['r_id'] is not None:
+            view['registration'] = {
+                'id': first['r_id'],
+                'user_id': user_id,
+                'hackathon_id': hackathon_id,
+                'team_id': first['r_team_id'],
+                'registered_at': first['r_registered_at'],
+            }
+        if first['t_id'] is not None:
+            view['team'] = {
+                'id': first['t_id'],
+                'hackathon_id': hackathon_id,
+                'name': first['t_name'],
+                'code': first['t_code'],
+                'leader_id': first['t_leader_id'],
+            }
+            view['roster'] = [
+                {
+                    'team_id': first['t_id'],
+                    'user_id': row['m_user_id'],
+                    'role': row['m_role'],
+                    'username': row['u_username'],
+                    'first_name': row['u_first_name'],
+                    'last_name': row['u_last_name'],
+                }
+                for row in rows if row['u_user_id'] is not None
+            ]
+        return view
+    
     async def get_user_registrations(self, user_id: int) -> List[Dict[str, Any]]:
         """Get all hackathon registrations for a user"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                rows = await conn.fetch(
-                    'SELECT * FROM registrations WHERE user_id = $1', user_id
-                )
+                rows = await self.statements.fetch(conn, 'get_user_registrations', user_id)
                 return [dict(row) for row in rows]
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                db.row_factory = aiosqlite.Row
+            async with self.sqlite.read() as db:
                 async with db.execute(
                     'SELECT * FROM registrations WHERE user_id = ?', (user_id,)
                 ) as cursor:
                     rows = await cursor.fetchall()
                     return [dict(row) for row in rows]
     
+    async def get_user_registrations_detailed(self, user_id: int) -> List[Dict[str, Any]]:
+        """Get user's registrations with hackathon name, dates and team name"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                rows = await self.statements.fetch(conn, 'get_user_registrations_detailed', user_id)
+                return [dict(row) for row in rows]
+        else:
+            async with self.sqlite.read() as db:
+                async with db.execute('''
+                    SELECT r.*, h.name AS hackathon_name, h.start_date, h.end_date,
+                           t.name AS team_name
+                    FROM registrations r
+                    JOIN hackathons h ON h.id = r.hackathon_id
+                    LEFT JOIN teams t ON t.id = r.team_id
+                    WHERE r.user_id = ?
+                    ORDER BY h.start_date
+                ''', (user_id,)) as cursor:
+                    rows = await cursor.fetchall()
+                    return [dict(row) for row in rows]
+    
     async def get_hackathon_participants(self, hackathon_id: int) -> List[Dict[str, Any]]:
         """Get all participants of a hackathon"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                rows = await conn.fetch('''
-                    SELECT u.* FROM users u
-                    JOIN registrations r ON u.user_id = r.user_id
-                    WHERE r.hackathon_id = $1
-                ''', hackathon_id)
+                rows = await self.statements.fetch(conn, 'get_hackathon_participants', hackathon_id)
                 return [dict(row) for row in rows]
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                db.row_factory = aiosqlite.Row
+            async with self.sqlite.read() as db:
                 async with db.execute('''
                     SELECT u.* FROM users u
                     JOIN registrations r ON u.user_id = r.user_id
@@ -734,147 +964,233 @@ class Database:
                     rows = await cursor.fetchall()
                     return [dict(row) for row in rows]
     
-    # ============== STAGE METHODS ==============
-    
-    async def get_stage(self, stage_id: int) -> Optional[Dict[str, Any]]:
-        """Get stage by ID"""
-        await self._ensure_initialized()
-        
+    async def get_participants_without_submission(self, hackathon_id: int,
+                                                  stage_id: int) -> List[Dict[str, Any]]:
+        """Get participants of a hackathon who have not submitted for a stage"""
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                row = await conn.fetchrow('SELECT * FROM stages WHERE id = $1', stage_id)
-                return dict(row) if row else None
+                rows = await self.statements.fetch(conn, 'get_participants_without_submission', hackathon_id, stage_id)
+                return [dict(row) for row in rows]
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                db.row_factory = aiosqlite.Row
-                async with db.execute('SELECT * FROM stages WHERE id = ?', (stage_id,)) as cursor:
-                    row = await cursor.fetchone()
-                    return dict(row) if row else None
+            async with self.sqlite.read() as db:
+                async with db.execute('''
+                    SELECT u.* FROM users u
+                    JOIN registrations r ON u.user_id = r.user_id
+                    WHERE r.hackathon_id = ?
+                      AND NOT EXISTS (
+                          SELECT 1 FROM submissions s
+                          WHERE s.user_id = u.user_id AND s.stage_id = ?
+                      )
+                ''', (hackathon_id, stage_id)) as cursor:
+                    rows = await cursor.fetchall()
+                    return [dict(row) for row in rows]
     
-    async def get_hackathon_stages(self, hackathon_id: int) -> List[Dict[str, Any]]:
-        """Get all stages for a hackathon"""
-        await self._ensure_initialized()
-        
+    async def get_hackathon_recipients(self, hackathon_id: int) -> List[Dict[str, Any]]:
+        """Get (user_id, team_id, language) of every participant of a hackathon in one query"""
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                rows = await conn.fetch(
-                    'SELECT * FROM stages WHERE hackathon_id = $1 ORDER BY number', hackathon_id
-                )
+                rows = await self.statements.fetch(conn, 'get_hackathon_recipients', hackathon_id)
                 return [dict(row) for row in rows]
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                db.row_factory = aiosqlite.Row
-                async with db.execute(
-                    'SELECT * FROM stages WHERE hackathon_id = ? ORDER BY number', (hackathon_id,)
-                ) as cursor:
+            async with self.sqlite.read() as db:
+                async with db.execute('''
+                    SELECT r.user_id, r.team_id, u.language FROM registrations r
+                    JOIN users u ON u.user_id = r.user_id
+                    WHERE r.hackathon_id = ?
+                ''', (hackathon_id,)) as cursor:
                     rows = await cursor.fetchall()
                     return [dict(row) for row in rows]
     
+    # ============== STAGE METHODS ==============
+    
+    async def get_stage(self, stage_id: int) -> Optional[Dict[str, Any]]:
+        """Get stage by ID"""
+        catalog = await self._get_catalog()
+        row = catalog.stages.get(stage_id)
+        return dict(row) if row else None
+    
+    async def get_hackathon_stages(self, hackathon_id: int) -> List[Dict[str, Any]]:
+        """Get all stages for a hackathon"""
+        catalog = await self._get_catalog()
+        rows = [row for row in catalog.stages.values() if row['hackathon_id'] == hackathon_id]
+        rows.sort(key=lambda row: row['number'])
+        return [dict(row) for row in rows]
+    
     async def create_stage(self, hackathon_id: int, number: int, name: str,
                           task_description: str, start_date: str, end_date: str) -> Dict[str, Any]:
         """Create a new stage"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                row = await conn.fetchrow('''
-                    INSERT INTO stages (hackathon_id, number, name, task_description, start_date, end_date)
-                    VALUES ($1, $2, $3, $4, $5, $6)
-                    RETURNING *
-                ''', hackathon_id, number, name, task_description, start_date, end_date)
-                return dict(row)
+                row = await self.statements.fetchrow(conn, 'create_stage', hackathon_id, number, name,
+                                                     task_description, to_date(start_date), to_date(end_date))
+                await self._catalog_changed(conn)
+                stage = dict(row)
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
+            async with self.sqlite.write() as db:
                 cursor = await db.execute('''
                     INSERT INTO stages (hackathon_id, number, name, task_description, start_date, end_date)
                     VALUES (?, ?, ?, ?, ?, ?)
                 ''', (hackathon_id, number, name, task_description, start_date, end_date))
                 await db.commit()
-                return await self.get_stage(cursor.lastrowid)
+                await self._catalog_changed()
+            stage = await self.get_stage(cursor.lastrowid)
+        
+        await self._stage_changed(stage['id'])
+        return stage
     
     async def update_stage_active(self, stage_id: int, is_active: bool) -> None:
         """Update stage active status"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                await conn.execute(
-                    'UPDATE stages SET is_active = $1 WHERE id = $2',
-                    is_active, stage_id
-                )
+                await self.statements.execute(conn, 'update_stage_active', is_active, stage_id)
+                await self._catalog_changed(conn)
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
+            async with self.sqlite.write() as db:
                 await db.execute(
                     'UPDATE stages SET is_active = ? WHERE id = ?',
                     (1 if is_active else 0, stage_id)
                 )
                 await db.commit()
+            await self._catalog_changed()
+        
+        await self._stage_changed(stage_id)
+    
+    async def record_stage_results(self, stage_id: int, hackathon_id: int, advanced_teams: Set[int]) -> None:
+        """Record which of the hackathon's teams advanced past a stage (and which didn't)"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                await self.statements.execute(conn, 'record_stage_results', stage_id, hackathon_id,
+                                              list(advanced_teams))
+        else:
+            async with self.sqlite.write() as db:
+                await db.execute('''
+                    INSERT INTO stage_results (stage_id, team_id, advanced)
+                    SELECT ?, t.id, t.id IN (SELECT value FROM json_each(?)) FROM teams t
+                    WHERE t.hackathon_id = ?
+                    ON CONFLICT (stage_id, team_id) DO UPDATE SET
+                        advanced = excluded.advanced, decided_at = CURRENT_TIMESTAMP
+                ''', (stage_id, json.dumps(sorted(advanced_teams)), hackathon_id))
+                await db.commit()
     
     # ============== SUBMISSION METHODS ==============
     
     async def get_submission(self, user_id: int, stage_id: int) -> Optional[Dict[str, Any]]:
         """Get user's submission for a stage"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                row = await conn.fetchrow('''
-                    SELECT * FROM submissions 
-                    WHERE user_id = $1 AND stage_id = $2
-                ''', user_id, stage_id)
+                row = await self.statements.fetchrow(conn, 'get_submission', user_id, stage_id)
                 return dict(row) if row else None
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                db.row_factory = aiosqlite.Row
-                async with db.execute('''
-                    SELECT * FROM submissions 
-                    WHERE user_id = ? AND stage_id = ?
-                ''', (user_id, stage_id)) as cursor:
+            async with self.sqlite.read() as db:
+                async with db.execute(
+                    'SELECT * FROM submissions WHERE user_id = ? AND stage_id = ?',
+                    (user_id, stage_id)
+                ) as cursor:
                     row = await cursor.fetchone()
                     return dict(row) if row else None
     
     async def create_submission(self, user_id: int, stage_id: int, link: str, 
                                notes: str = None, submission_type: str = 'link',
-                               file_name: str = None) -> Dict[str, Any]:
-        """Create a new submission"""
-        await self._ensure_initialized()
+                               file_name: str = None, file_id: str = None) -> Dict[str, Any]:
+        """Create a new submission, or replace the user's submission for the stage
         
+        A Telegram file_id marks the file as 'pending' until the ingestion
+        queue has stored it (see set_submission_file). A replaced submission
+        keeps its id but loses its score, since the score was for the old
+        content; the team's stage score is recomputed and score listeners
+        are told, as set_submission_score does.
+        """
         # Get user's team
         stage = await self.get_stage(stage_id)
         registration = await self.get_user_hackathon_registration(user_id, stage['hackathon_id'])
         team_id = registration['team_id'] if registration else None
+        file_status = 'pending' if file_id else None
         
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                row = await conn.fetchrow('''
-                    INSERT INTO submissions (user_id, stage_id, team_id, link, notes, submission_type, file_name)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7)
-                    ON CONFLICT (user_id, stage_id) DO UPDATE SET 
-                        link = $4, notes = $5, submission_type = $6, file_name = $7
-                    RETURNING *
-                ''', user_id, stage_id, team_id, link, notes, submission_type, file_name)
-                return dict(row)
+                async with conn.transaction():
+                    old = await self.statements.fetchrow(conn, 'lock_submission_score', user_id, stage_id)
+                    row = await self.statements.fetchrow(conn, 'create_submission', user_id, stage_id, team_id,
+                                                         link, notes, submission_type, file_name,
+                                                         file_id, file_status)
+                    change = None
+                    if old and old['score'] is not None and old['team_id'] is not None:
+                        change = {'submission_id': old['id'], 'stage_id': stage_id, 'team_id': old['team_id']}
+                        change.update(await self._save_team_score_pg(conn, stage_id, old['team_id']))
+            if change:
+                await self._scores_changed(change)
+            return dict(row)
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
+            async with self.sqlite.write() as db:
+                async with db.execute(
+                    'SELECT id, team_id, score FROM submissions WHERE user_id = ? AND stage_id = ?',
+                    (user_id, stage_id)
+                ) as cursor:
+                    old = await cursor.fetchone()
                 await db.execute('''
-                    INSERT OR REPLACE INTO submissions (user_id, stage_id, team_id, link, notes, submission_type, file_name)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (user_id, stage_id, team_id, link, notes, submission_type, file_name))
+                    INSERT INTO submissions (user_id, stage_id, team_id, link, notes, submission_type,
+                                             file_name, file_id, file_status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id, stage_id) DO UPDATE SET
+                        team_id = excluded.team_id, link = excluded.link, notes = excluded.notes,
+                        submission_type = excluded.submission_type, file_name = excluded.file_name,
+                        file_id = excluded.file_id, file_status = excluded.file_status,
+                        file_digest = NULL, file_size = NULL,
+                        score = NULL, submitted_at = CURRENT_TIMESTAMP
+                ''', (user_id, stage_id, team_id, link, notes, submission_type, file_name, file_id, file_status))
+                change = None
+                if old and old['score'] is not None and old['team_id'] is not None:
+                    change = {'submission_id': old['id'], 'stage_id': stage_id, 'team_id': old['team_id']}
+                    change.update(await self._save_team_score_sqlite(db, stage_id, old['team_id']))
                 await db.commit()
-                return await self.get_submission(user_id, stage_id)
+            if change:
+                await self._scores_changed(change)
+            return await self.get_submission(user_id, stage_id)
+    
+    async def set_submission_file(self, user_id: int, stage_id: int, file_id: str, status: str,
+                                  digest: str = None, size: int = None) -> bool:
+        """Record the outcome of storing a submission's file
+        
+        Matches on file_id, so a file that finishes after the user already
+        submitted something else doesn't overwrite the newer submission.
+        Returns whether a submission was updated.
+        """
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                result = await self.statements.execute(conn, 'set_submission_file', user_id, stage_id,
+                                                       file_id, status, digest, size)
+                return result != 'UPDATE 0'
+        else:
+            async with self.sqlite.write() as db:
+                cursor = await db.execute('''
+                    UPDATE submissions SET file_status = ?, file_digest = ?, file_size = ?
+                    WHERE user_id = ? AND stage_id = ? AND file_id = ?
+                ''', (status, digest, size, user_id, stage_id, file_id))
+                await db.commit()
+                return cursor.rowcount > 0
+    
+    async def get_pending_submission_files(self) -> List[Dict[str, Any]]:
+        """Get submissions whose file has not been stored yet (to resume after a restart)"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                rows = await self.statements.fetch(conn, 'get_pending_submission_files')
+                return [dict(row) for row in rows]
+        else:
+            async with self.sqlite.read() as db:
+                async with db.execute('''
+                    SELECT user_id, stage_id, file_id, file_name FROM submissions
+                    WHERE file_status = 'pending' ORDER BY id
+                ''') as cursor:
+                    rows = await cursor.fetchall()
+                    return [dict(row) for row in rows]
     
     async def remove_registration(self, user_id: int, hackathon_id: int) -> None:
         """Remove user's hackathon registration"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                await conn.execute(
-                    'DELETE FROM registrations WHERE user_id = $1 AND hackathon_id = $2',
-                    user_id, hackathon_id
-                )
+                await self.statements.execute(conn, 'remove_registration', user_id, hackathon_id)
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
+            async with self.sqlite.write() as db:
                 await db.execute(
                     'DELETE FROM registrations WHERE user_id = ? AND hackathon_id = ?',
                     (user_id, hackathon_id)
@@ -883,19 +1199,356 @@ class Database:
     
     async def get_stage_submissions(self, stage_id: int) -> List[Dict[str, Any]]:
         """Get all submissions for a stage"""
-        await self._ensure_initialized()
-        
         if USE_POSTGRES:
             async with self.pool.acquire() as conn:
-                rows = await conn.fetch(
-                    'SELECT * FROM submissions WHERE stage_id = $1', stage_id
-                )
+                rows = await self.statements.fetch(conn, 'get_stage_submissions', stage_id)
                 return [dict(row) for row in rows]
         else:
-            async with aiosqlite.connect(self.sqlite_path) as db:
-                db.row_factory = aiosqlite.Row
+            async with self.sqlite.read() as db:
                 async with db.execute(
                     'SELECT * FROM submissions WHERE stage_id = ?', (stage_id,)
                 ) as cursor:
                     rows = await cursor.fetchall()
                     return [dict(row) for row in rows]
+    
+    async def iter_hackathon_submissions(self, hackathon_id: int,
+                                         chunk_size: int = 1000) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Stream a hackathon's submissions joined with stage, team and user
+        
+        Yields lists of at most chunk_size rows, read through a server-side
+        cursor (PostgreSQL) or fetchmany (SQLite), so memory stays flat
+        whatever the table size.
+        """
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    chunk = []
+                    async for row in self.statements.cursor(conn, 'export_submissions',
+                                                            hackathon_id, prefetch=chunk_size):
+                        chunk.append(dict(row))
+                        if len(chunk) >= chunk_size:
+                            yield chunk
+                            chunk = []
+                    if chunk:
+                        yield chunk
+        else:
+            async with self.sqlite.read() as db:
+                async with db.execute(EXPORT_SUBMISSIONS_SQL.format(p='?'), (hackathon_id,)) as cursor:
+                    while True:
+                        rows = await cursor.fetchmany(chunk_size)
+                        if not rows:
+                            break
+                        yield [dict(row) for row in rows]
+    
+    # ============== LEADERBOARD ==============
+    
+    async def set_submission_score(self, submission_id: int, score: Optional[float]) -> Optional[Dict[str, Any]]:
+        """Score a submission (None clears it) and update its team's stage score
+        
+        A team's stage score is the best score among its members'
+        submissions, kept in team_scores in the same transaction. Returns
+        the change passed to score listeners, or None if there is no such
+        submission.
+        """
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    row = await self.statements.fetchrow(conn, 'set_submission_score', score, submission_id)
+                    if not row:
+                        return None
+                    stage_id, team_id = row['stage_id'], row['team_id']
+                    change = {'submission_id': submission_id, 'stage_id': stage_id, 'team_id': team_id}
+                    if team_id is None:
+                        return change
+                    change.update(await self._save_team_score_pg(conn, stage_id, team_id))
+        else:
+            async with self.sqlite.write() as db:
+                async with db.execute(
+                    'SELECT stage_id, team_id FROM submissions WHERE id = ?', (submission_id,)
+                ) as cursor:
+                    row = await cursor.fetchone()
+                if not row:
+                    return None
+                stage_id, team_id = row['stage_id'], row['team_id']
+                change = {'submission_id': submission_id, 'stage_id': stage_id, 'team_id': team_id}
+                await db.execute('UPDATE submissions SET score = ? WHERE id = ?', (score, submission_id))
+                if team_id is None:
+                    await db.commit()
+                    return change
+                change.update(await self._save_team_score_sqlite(db, stage_id, team_id))
+                await db.commit()
+        
+        await self._scores_changed(change)
+        return change
+    
+    async def _save_team_score_pg(self, conn, stage_id: int, team_id: int) -> Dict[str, Any]:
+        """Recompute a team's best stage score in team_scores, inside the caller's
+        transaction, and tell other replicas; returns the change's hackathon_id,
+        previous and score"""
+        hackathon_id = (await self.get_stage(stage_id))['hackathon_id']
+        # Not a row lock on team_scores: there is no row before a team's first
+        # score, and two concurrent scorings would each miss the other's score
+        await self.statements.execute(conn, 'lock_team_stage_score', stage_id, team_id)
+        previous = await self.statements.fetchval(conn, 'get_team_stage_score', stage_id, team_id)
+        best = await self.statements.fetchval(conn, 'best_team_stage_score', stage_id, team_id)
+        if best is None:
+            await self.statements.execute(conn, 'delete_team_stage_score', stage_id, team_id)
+        else:
+            await self.statements.execute(conn, 'save_team_stage_score', stage_id, team_id, hackathon_id, best)
+        await self.statements.execute(conn, 'notify', SCORES_CHANNEL,
+                                      f'{self.instance_id}:{stage_id}:{hackathon_id}:{team_id}')
+        return {'hackathon_id': hackathon_id,
+                'previous': float(previous) if previous is not None else None,
+                'score': float(best) if best is not None else None}
+    
+    async def _save_team_score_sqlite(self, db, stage_id: int, team_id: int) -> Dict[str, Any]:
+        """SQLite version of _save_team_score_pg (one process, so nobody to notify)"""
+        hackathon_id = (await self.get_stage(stage_id))['hackathon_id']
+        async with db.execute(
+            'SELECT score FROM team_scores WHERE stage_id = ? AND team_id = ?', (stage_id, team_id)
+        ) as cursor:
+            row = await cursor.fetchone()
+            previous = row[0] if row else None
+        async with db.execute(
+            'SELECT MAX(score) FROM submissions WHERE stage_id = ? AND team_id = ?', (stage_id, team_id)
+        ) as cursor:
+            best = (await cursor.fetchone())[0]
+        if best is None:
+            await db.execute('DELETE FROM team_scores WHERE stage_id = ? AND team_id = ?', (stage_id, team_id))
+        else:
+            await db.execute('''
+                INSERT OR REPLACE INTO team_scores (stage_id, team_id, hackathon_id, score)
+                VALUES (?, ?, ?, ?)
+            ''', (stage_id, team_id, hackathon_id, best))
+        return {'hackathon_id': hackathon_id,
+                'previous': float(previous) if previous is not None else None,
+                'score': float(best) if best is not None else None}
+    
+    async def get_stage_team_scores(self, stage_id: int) -> List[Dict[str, Any]]:
+        """Get each team's best score for a stage (team_id, score)"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                rows = await self.statements.fetch(conn, 'get_stage_team_scores', stage_id)
+                return [dict(row) for row in rows]
+        else:
+            async with self.sqlite.read() as db:
+                async with db.execute(
+                    'SELECT team_id, score FROM team_scores WHERE stage_id = ?', (stage_id,)
+                ) as cursor:
+                    rows = await cursor.fetchall()
+                    return [dict(row) for row in rows]
+    
+    async def get_hackathon_team_scores(self, hackathon_id: int) -> List[Dict[str, Any]]:
+        """Get each team's total over a hackathon's stages (team_id, score)"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                rows = await self.statements.fetch(conn, 'get_hackathon_team_scores', hackathon_id)
+                return [dict(row) for row in rows]
+        else:
+            async with self.sqlite.read() as db:
+                async with db.execute('''
+                    SELECT team_id, SUM(score) AS score FROM team_scores
+                    WHERE hackathon_id = ? GROUP BY team_id
+                ''', (hackathon_id,)) as cursor:
+                    rows = await cursor.fetchall()
+                    return [dict(row) for row in rows]
+    
+    async def get_team_names(self, team_ids: List[int]) -> Dict[int, str]:
+        """Get team names by ID in one query"""
+        if not team_ids:
+            return {}
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                rows = await self.statements.fetch(conn, 'get_team_names', list(team_ids))
+        else:
+            placeholders = ', '.join('?' for _ in team_ids)
+            async with self.sqlite.read() as db:
+                async with db.execute(
+                    f'SELECT id, name FROM teams WHERE id IN ({placeholders})', list(team_ids)
+                ) as cursor:
+                    rows = await cursor.fetchall()
+        return {row['id']: row['name'] for row in rows}
+    
+    # ============== BACKGROUND JOBS ==============
+    
+    async def create_job(self, kind: str, title: str, created_by: int, chat_id: int) -> int:
+        """Record a queued background job, return its id"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                return await self.statements.fetchval(conn, 'create_job', kind, title, created_by, chat_id)
+        else:
+            async with self.sqlite.write() as db:
+                cursor = await db.execute(
+                    'INSERT INTO jobs (kind, title, created_by, chat_id) VALUES (?, ?, ?, ?)',
+                    (kind, title, created_by, chat_id)
+                )
+                await db.commit()
+                return cursor.lastrowid
+    
+    async def set_job_message(self, job_id: int, message_id: int) -> None:
+        """Record the message a job shows its progress in"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                await self.statements.execute(conn, 'set_job_message', job_id, message_id)
+        else:
+            async with self.sqlite.write() as db:
+                await db.execute(
+                    'UPDATE jobs SET message_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                    (message_id, job_id)
+                )
+                await db.commit()
+    
+    async def start_job(self, job_id: int) -> None:
+        """Mark a queued job as running"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                await self.statements.execute(conn, 'start_job', job_id)
+        else:
+            async with self.sqlite.write() as db:
+                await db.execute(
+                    "UPDATE jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (job_id,)
+                )
+                await db.commit()
+    
+    async def update_job_progress(self, job_id: int, processed: int, total: Optional[int]) -> None:
+        """Save a running job's progress"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                await self.statements.execute(conn, 'update_job_progress', job_id, processed, total)
+        else:
+            async with self.sqlite.write() as db:
+                await db.execute(
+                    'UPDATE jobs SET processed = ?, total = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                    (processed, total, job_id)
+                )
+                await db.commit()
+    
+    async def finish_job(self, job_id: int, status: str, processed: int, total: Optional[int],
+                         result: str) -> None:
+        """Record how a job ended"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                await self.statements.execute(conn, 'finish_job', job_id, status, processed, total, result)
+        else:
+            async with self.sqlite.write() as db:
+                await db.execute('''
+                    UPDATE jobs SET status = ?, processed = ?, total = ?, result = ?,
+                                    updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (status, processed, total, result, job_id))
+                await db.commit()
+    
+    async def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Get a background job by id"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                row = await self.statements.fetchrow(conn, 'get_job', job_id)
+                return dict(row) if row else None
+        else:
+            async with self.sqlite.read() as db:
+                async with db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)) as cursor:
+                    row = await cursor.fetchone()
+                    return dict(row) if row else None
+    
+    async def get_recent_jobs(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the latest background jobs, newest first"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                rows = await self.statements.fetch(conn, 'get_recent_jobs', limit)
+                return [dict(row) for row in rows]
+        else:
+            async with self.sqlite.read() as db:
+                async with db.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,)) as cursor:
+                    rows = await cursor.fetchall()
+                    return [dict(row) for row in rows]
+    
+    async def interrupt_unfinished_jobs(self) -> List[Dict[str, Any]]:
+        """Mark jobs left queued or running by a previous process as interrupted, return them"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                rows = await self.statements.fetch(conn, 'interrupt_unfinished_jobs')
+                return [dict(row) for row in rows]
+        else:
+            async with self.sqlite.write() as db:
+                async with db.execute("SELECT * FROM jobs WHERE status IN ('queued', 'running')") as cursor:
+                    rows = [dict(row) for row in await cursor.fetchall()]
+                await db.executemany('''
+                    UPDATE jobs SET status = 'interrupted', updated_at = CURRENT_TIMESTAMP,
+                                    finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', [(row['id'],) for row in rows])
+                await db.commit()
+                for row in rows:
+                    row['status'] = 'interrupted'
+                return rows
+    
+    # ============== CONVERSATION PERSISTENCE ==============
+    
+    async def load_conversation_states(self) -> List[Dict[str, Any]]:
+        """Get every stored conversation state (name, conv_key, state as JSON text)"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                rows = await self.statements.fetch(conn, 'load_conversation_states')
+                return [dict(row) for row in rows]
+        else:
+            async with self.sqlite.read() as db:
+                async with db.execute('SELECT name, conv_key, state FROM conversation_states') as cursor:
+                    rows = await cursor.fetchall()
+                    return [dict(row) for row in rows]
+    
+    async def load_user_data(self) -> List[Dict[str, Any]]:
+        """Get every stored user_data entry (user_id, data as JSON text)"""
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                rows = await self.statements.fetch(conn, 'load_user_data')
+                return [dict(row) for row in rows]
+        else:
+            async with self.sqlite.read() as db:
+                async with db.execute('SELECT user_id, data FROM user_data') as cursor:
+                    rows = await cursor.fetchall()
+                    return [dict(row) for row in rows]
+    
+    async def save_persistence_batch(self, states: List[tuple], dropped_states: List[tuple],
+                                     user_data: List[tuple], dropped_users: List[int]) -> None:
+        """Write a batch of persistence changes in one transaction
+        
+        states: (name, conv_key, state) rows to upsert
+        dropped_states: (name, conv_key) rows to delete
+        user_data: (user_id, data) rows to upsert
+        dropped_users: user ids whose user_data is deleted
+        """
+        if USE_POSTGRES:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    if states:
+                        await self.statements.executemany(conn, 'save_conversation_states', states)
+                    if dropped_states:
+                        await self.statements.executemany(conn, 'delete_conversation_states', dropped_states)
+                    if user_data:
+                        await self.statements.executemany(conn, 'save_user_data', user_data)
+                    if dropped_users:
+                        await self.statements.execute(conn, 'delete_user_data', dropped_users)
+        else:
+            async with self.sqlite.write() as db:
+                if states:
+                    await db.executemany(
+                        'INSERT OR REPLACE INTO conversation_states (name, conv_key, state) VALUES (?, ?, ?)',
+                        states
+                    )
+                if dropped_states:
+                    await db.executemany(
+                        'DELETE FROM conversation_states WHERE name = ? AND conv_key = ?',
+                        dropped_states
+                    )
+                if user_data:
+                    await db.executemany(
+                        'INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)',
+                        user_data
+                    )
+                if dropped_users:
+                    await db.executemany(
+                        'DELETE FROM user_data WHERE user_id = ?',
+                        [(user_id,) for user_id in dropped_users]
+                    )
+                await db.commit()
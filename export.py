@@ -0,0 +1,47 @@
+"""
+Submission export for ITCom Hackathons Bot
+Streams submissions from the database into a CSV file
+"""
+
+import asyncio
+import csv
+import os
+import tempfile
+from typing import Callable, Optional, Tuple
+
+from database import Database
+
+EXPORT_COLUMNS = [
+    'submission_id', 'stage_number', 'stage_name', 'team_name', 'team_code',
+    'user_id', 'username', 'first_name', 'last_name', 'phone',
+    'submission_type', 'link', 'file_name', 'file_digest', 'file_size',
+    'notes', 'score', 'submitted_at',
+]
+
+
+async def export_submissions_csv(db: Database, hackathon_id: int, chunk_size: int = 1000,
+                                 progress: Optional[Callable[[int], None]] = None) -> Tuple[str, int]:
+    """Write a hackathon's submissions to a temporary CSV file
+    
+    Rows are written chunk by chunk as they arrive from the database, so
+    only one chunk is ever held in memory; ``progress`` is called with the
+    rows written so far after each chunk. Returns the file path and the
+    number of rows; the caller deletes the file.
+    """
+    fd, path = tempfile.mkstemp(prefix=f'submissions_{hackathon_id}_', suffix='.csv')
+    rows = 0
+    try:
+        # utf-8-sig so Excel detects the encoding of Uzbek/Russian names
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.DictWriter(f, fieldnames=EXPORT_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            async for chunk in db.iter_hackathon_submissions(hackathon_id, chunk_size):
+                await asyncio.to_thread(writer.writerows, chunk)
+                rows += len(chunk)
+                if progress:
+                    progress(rows)
+    except BaseException:
+        os.unlink(path)
+        raise
+    
+    return path, rows
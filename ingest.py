@@ -0,0 +1,256 @@
+"""
+Submission file ingestion for ITCom Hackathons Bot
+Streams uploaded files from Telegram into content-addressed local storage
+in the background, so handlers only queue the work
+"""
+
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+from typing import AsyncIterator, List, Optional, Tuple
+
+import aiohttp
+from telegram import Message
+from telegram.error import TelegramError
+
+from config import (
+    ALLOWED_EXTENSIONS, MAX_FILE_SIZE_MB, SUBMISSIONS_DIR,
+    INGEST_WORKERS, INGEST_QUEUE_SIZE, INGEST_CHUNK_SIZE,
+    INGEST_DOWNLOAD_TIMEOUT, INGEST_READ_TIMEOUT,
+)
+from database import Database
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_FILE_SIZE = MAX_FILE_SIZE_MB * 1024 * 1024
+
+# getFile on the public Bot API only serves files up to 20 MB; a local Bot API
+# server (bot.local_mode) has no such limit
+CLOUD_DOWNLOAD_LIMIT = 20 * 1024 * 1024
+
+
+class FileRejected(Exception):
+    """A file over the size limit or with an extension that isn't allowed"""
+
+
+def attachment_of(message: Message) -> Optional[Tuple[object, str]]:
+    """The file of a document/photo/video/audio message and a name for it"""
+    if message.photo:
+        # Telegram re-encodes photos as JPEG; the last size is the largest
+        photo = message.photo[-1]
+        return photo, f"photo_{photo.file_unique_id}.jpg"
+
+    attachment = message.document or message.video or message.audio
+    if attachment is None:
+        return None
+    name = attachment.file_name
+    if not name:
+        extension = mimetypes.guess_extension(attachment.mime_type or '') or ''
+        name = f"file_{attachment.file_unique_id}{extension}"
+    return attachment, name
+
+
+def upload_limit(bot) -> int:
+    """Largest file, in bytes, the bot can accept and download"""
+    return MAX_FILE_SIZE if bot.local_mode else min(MAX_FILE_SIZE, CLOUD_DOWNLOAD_LIMIT)
+
+
+def check_file(file_name: str, file_size: Optional[int], max_size: int = MAX_FILE_SIZE) -> None:
+    """Raise FileRejected unless the file is within the upload limits"""
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        raise FileRejected(f"{extension or 'files without an extension'} is not an allowed file type")
+    if file_size and file_size > max_size:
+        raise FileRejected(f"the file is larger than {max_size // (1024 * 1024)} MB")
+
+
+class FileStore:
+    """Files named by their SHA-256, so identical uploads are stored once.
+
+    A file is written to tmp/ while it is hashed and then renamed to
+    objects/<first two hex digits>/<digest>; an interrupted download never
+    leaves a partial file under a digest.
+    """
+
+    def __init__(self, root: str = SUBMISSIONS_DIR):
+        self.root = root
+        self.objects = os.path.join(root, 'objects')
+        self.tmp = os.path.join(root, 'tmp')
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.tmp, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.objects, digest[:2], digest)
+
+    async def store(self, chunks: AsyncIterator[bytes],
+                    max_size: int = MAX_FILE_SIZE) -> Tuple[str, int, bool]:
+        """Write a stream of chunks; returns (digest, size, already stored)"""
+        sha256 = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_size:
+                        raise FileRejected(f"the file is larger than {max_size // (1024 * 1024)} MB")
+                    sha256.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+
+            digest = sha256.hexdigest()
+            final_path = self.path(digest)
+            if os.path.exists(final_path):
+                os.unlink(tmp_path)
+                return digest, size, True
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+            return digest, size, False
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+def _failure_reason(error: Exception) -> str:
+    """What went wrong, without the download URL (it contains the bot token)"""
+    if isinstance(error, (FileRejected, TelegramError)):
+        return str(error)
+    if isinstance(error, asyncio.TimeoutError):
+        # The session's total timeout, or a read stalling (ServerTimeoutError)
+        return "download timed out"
+    if isinstance(error, aiohttp.ClientResponseError):
+        return f"download failed (HTTP {error.status})"
+    if isinstance(error, aiohttp.ClientError):
+        return "download failed"
+    if isinstance(error, OSError):
+        return "storage error"
+    return "unexpected error"
+
+
+class IngestJob:
+    """One uploaded file waiting to be stored"""
+
+    def __init__(self, user_id: int, stage_id: int, file_id: str, file_name: str):
+        self.user_id = user_id
+        self.stage_id = stage_id
+        self.file_id = file_id
+        self.file_name = file_name
+
+
+class IngestQueue:
+    """Bounded queue of uploads drained by a few background workers.
+
+    Each worker streams the file from Telegram in INGEST_CHUNK_SIZE pieces
+    (or reads it from disk when the bot talks to a local Bot API server),
+    hashes it into the FileStore and records digest and size on the
+    submission. Submissions still 'pending' at startup are queued again.
+    """
+
+    def __init__(self, bot, db: Database, store: FileStore,
+                 workers: int = INGEST_WORKERS, max_pending: int = INGEST_QUEUE_SIZE,
+                 chunk_size: int = INGEST_CHUNK_SIZE):
+        self.bot = bot
+        self.db = db
+        self.store = store
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.stored = 0
+        self.deduplicated = 0
+        self.failed = 0
+        self._tasks: List[asyncio.Task] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self) -> None:
+        self._session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=INGEST_DOWNLOAD_TIMEOUT, sock_read=INGEST_READ_TIMEOUT)
+        )
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+        pending = await self.db.get_pending_submission_files()
+        for row in pending:
+            if not self.submit(IngestJob(row['user_id'], row['stage_id'], row['file_id'], row['file_name'])):
+                break
+        if pending:
+            logger.info(f"Resumed {min(len(pending), self.queue.maxsize)} pending submission files")
+
+    async def stop(self, timeout: float = 30) -> None:
+        """Give queued files a little time to finish, then stop the workers"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping with {self.queue.qsize()} submission files queued; "
+                           "they are resumed on the next start")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    def full(self) -> bool:
+        return self.queue.full()
+
+    def submit(self, job: IngestJob) -> bool:
+        """Queue a file without waiting; False when the queue is full"""
+        try:
+            self.queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            try:
+                async with metrics.track('ingest_file'):
+                    await self._ingest(job)
+            except Exception as e:
+                logger.error(f"Ingesting file for user {job.user_id}, stage {job.stage_id} failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _ingest(self, job: IngestJob) -> None:
+        try:
+            telegram_file = await self.bot.get_file(job.file_id)
+            digest, size, existed = await self.store.store(self._chunks(telegram_file.file_path),
+                                                           upload_limit(self.bot))
+        except Exception as e:
+            # Whatever went wrong, the submission must not stay 'pending'
+            reason = _failure_reason(e)
+            logger.warning(f"File of user {job.user_id} for stage {job.stage_id} not stored: "
+                           f"{reason} ({type(e).__name__})")
+            self.failed += 1
+            await self.db.set_submission_file(job.user_id, job.stage_id, job.file_id, 'failed')
+            await self._notify(job.user_id, f"❌ We couldn't save {job.file_name}: {reason}.\n\n"
+                                            "Please open the stage and submit again.")
+            return
+
+        self.stored += 1
+        if existed:
+            self.deduplicated += 1
+        if await self.db.set_submission_file(job.user_id, job.stage_id, job.file_id, 'stored', digest, size):
+            await self._notify(job.user_id, f"📎 {job.file_name} saved ({size / 1024 / 1024:.1f} MB).")
+
+    async def _chunks(self, file_path: str) -> AsyncIterator[bytes]:
+        if self.bot.local_mode and not file_path.startswith(('http://', 'https://')):
+            with open(file_path, 'rb') as f:
+                while chunk := await asyncio.to_thread(f.read, self.chunk_size):
+                    yield chunk
+            return
+
+        # The URL carries the bot token, so it is never logged
+        async with self._session.get(file_path, raise_for_status=True) as response:
+            async for chunk in response.content.iter_chunked(self.chunk_size):
+                yield chunk
+
+    async def _notify(self, user_id: int, text: str) -> None:
+        try:
+            await self.bot.send_message(user_id, text)
+        except TelegramError as e:
+            logger.warning(f"Could not notify user {user_id} about their file: {e}")
@@ -0,0 +1,219 @@
+"""
+Background jobs for ITCom Hackathons Bot
+Long admin tasks (broadcasts, exports, stage results) run off the update
+path with an id, a persisted status and a progress message edited in place
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, TelegramError
+
+from broadcast import BroadcastResult, ProgressCallback
+from config import JOB_CONCURRENCY, JOB_PROGRESS_INTERVAL
+from database import Database
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+INTERRUPTED = 'interrupted'
+
+STATUS_ICONS = {
+    QUEUED: '⏳',
+    RUNNING: '🔄',
+    DONE: '✅',
+    FAILED: '❌',
+    CANCELLED: '🚫',
+    INTERRUPTED: '⚠️',
+}
+
+
+class Job:
+    """A background job and its latest progress"""
+
+    def __init__(self, job_id: int, kind: str, title: str, chat_id: int):
+        self.id = job_id
+        self.kind = kind
+        self.title = title
+        self.chat_id = chat_id
+        self.message_id: Optional[int] = None
+        self.status = QUEUED
+        self.processed = 0
+        self.total: Optional[int] = None
+        self.detail = ''
+        self.result = ''
+        self.task: Optional[asyncio.Task] = None
+
+    def report(self, processed: int, total: Optional[int] = None, detail: str = '') -> None:
+        """Record progress; the runner shows it on its next tick"""
+        self.processed = processed
+        if total is not None:
+            self.total = total
+        self.detail = detail
+
+    def render(self) -> str:
+        lines = [f"{STATUS_ICONS[self.status]} Job #{self.id}: {self.title}"]
+        if self.status == QUEUED:
+            lines.append("Queued, waiting for a free slot")
+        elif self.status == RUNNING:
+            if self.total:
+                lines.append(f"Progress: {self.processed}/{self.total} "
+                             f"({self.processed * 100 // self.total}%)")
+            else:
+                lines.append(f"Progress: {self.processed}")
+        elif self.status in (CANCELLED, INTERRUPTED):
+            reason = "Cancelled" if self.status == CANCELLED else "Interrupted by a restart"
+            lines.append(f"{reason} after {self.processed}" + (f"/{self.total}" if self.total else ''))
+        if self.result:
+            lines.append(self.result)
+        elif self.detail:
+            lines.append(self.detail)
+        return "\n".join(lines)
+
+
+JobFunction = Callable[[Job], Awaitable[str]]
+
+
+def delivery_progress(job: Job) -> ProgressCallback:
+    """Broadcast progress callback that reports delivery counters on the job"""
+    async def report(result: BroadcastResult) -> None:
+        job.report(result.processed, result.total, f"Sent: {result.sent}\nFailed: {result.failed}")
+    return report
+
+
+def cancel_keyboard(job_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[InlineKeyboardButton("🚫 Cancel", callback_data=f"job_cancel_{job_id}")]])
+
+
+class JobRunner:
+    """Runs submitted jobs in the background, JOB_CONCURRENCY at a time.
+
+    submit() records the job, posts its progress message and returns at
+    once; the job function reports progress on the Job it is given and
+    returns a summary line. Every JOB_PROGRESS_INTERVAL seconds a changed
+    progress is edited into the message and saved to the jobs table, so
+    Telegram's edit limits are respected however often a job reports.
+    Jobs can't be resumed after a restart: start() marks the ones a
+    previous process left unfinished as interrupted.
+    """
+
+    def __init__(self, bot, db: Database, concurrency: int = JOB_CONCURRENCY,
+                 progress_interval: float = JOB_PROGRESS_INTERVAL):
+        self.bot = bot
+        self.db = db
+        self.progress_interval = progress_interval
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._jobs: Dict[int, Job] = {}
+        self._stopping = False
+
+    async def start(self) -> None:
+        for row in await self.db.interrupt_unfinished_jobs():
+            job = Job(row['id'], row['kind'], row['title'], row['chat_id'])
+            job.message_id = row['message_id']
+            job.status = INTERRUPTED
+            job.processed, job.total = row['processed'], row['total']
+            await self._show(job, final=True)
+            logger.warning(f"Job #{job.id} ({job.kind}) was interrupted by a restart")
+
+    async def stop(self, timeout: float = 10) -> None:
+        """Cancel running jobs; they are recorded as interrupted"""
+        self._stopping = True
+        tasks = [job.task for job in self._jobs.values() if job.task]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+    async def submit(self, kind: str, title: str, chat_id: int, created_by: int,
+                     function: JobFunction) -> Job:
+        """Queue a job and post its progress message; returns without waiting for it"""
+        job = Job(await self.db.create_job(kind, title, created_by, chat_id), kind, title, chat_id)
+        try:
+            message = await self.bot.send_message(chat_id, job.render(), reply_markup=cancel_keyboard(job.id))
+            job.message_id = message.message_id
+            await self.db.set_job_message(job.id, job.message_id)
+        except TelegramError as e:
+            logger.warning(f"Could not post the progress message of job #{job.id}: {e}")
+
+        self._jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, function))
+        logger.info(f"Job #{job.id} ({kind}) submitted by {created_by}: {title}")
+        return job
+
+    def get(self, job_id: int) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def active(self) -> List[Job]:
+        return sorted(self._jobs.values(), key=lambda job: job.id)
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a queued or running job; False if it isn't running here"""
+        job = self._jobs.get(job_id)
+        if job is None or job.task is None or job.task.done():
+            return False
+        job.task.cancel()
+        return True
+
+    async def _run(self, job: Job, function: JobFunction) -> None:
+        ticker = None
+        try:
+            async with self._slots:
+                job.status = RUNNING
+                await self.db.start_job(job.id)
+                ticker = asyncio.create_task(self._tick(job))
+                async with metrics.track(f'job_{job.kind}'):
+                    job.result = await function(job) or ''
+            job.status = DONE
+        except asyncio.CancelledError:
+            job.status = INTERRUPTED if self._stopping else CANCELLED
+        except Exception as e:
+            logger.error(f"Job #{job.id} ({job.kind}) failed: {e}")
+            job.status = FAILED
+            job.result = f"Failed: {e}"
+        finally:
+            if ticker:
+                ticker.cancel()
+            self._jobs.pop(job.id, None)
+
+        try:
+            await self.db.finish_job(job.id, job.status, job.processed, job.total, job.result or job.detail)
+        except Exception as e:
+            logger.error(f"Could not record the outcome of job #{job.id}: {e}")
+        await self._show(job, final=True)
+        logger.info(f"Job #{job.id} ({job.kind}) {job.status}")
+
+    async def _tick(self, job: Job) -> None:
+        shown = job.render()
+        await self._show(job)
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            text = job.render()
+            if text == shown:
+                continue
+            shown = text
+            await self._show(job)
+            try:
+                await self.db.update_job_progress(job.id, job.processed, job.total)
+            except Exception as e:
+                logger.warning(f"Could not save the progress of job #{job.id}: {e}")
+
+    async def _show(self, job: Job, final: bool = False) -> None:
+        if job.message_id is None:
+            return
+        try:
+            await self.bot.edit_message_text(
+                job.render(), chat_id=job.chat_id, message_id=job.message_id,
+                reply_markup=None if final else cancel_keyboard(job.id),
+            )
+        except BadRequest as e:
+            # "Message is not modified" and deleted messages are harmless
+            logger.debug(f"Progress of job #{job.id} not shown: {e}")
+        except TelegramError as e:
+            logger.warning(f"Progress of job #{job.id} not shown: {e}")
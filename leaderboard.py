@@ -0,0 +1,147 @@
+"""
+Team leaderboards for ITCom Hackathons Bot
+Per-stage and per-hackathon rankings kept in memory and updated as scores
+are written
+"""
+
+import bisect
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+STAGE = 'stage'
+HACKATHON = 'hackathon'
+
+Scope = Tuple[str, int]
+
+
+class Ranking:
+    """Team scores of one stage or hackathon, kept sorted best first.
+
+    Ranks are found by binary search over the sorted (-score, team_id)
+    keys; teams with equal scores share a rank (1, 2, 2, 4).
+    """
+
+    def __init__(self, scores: Dict[int, float]):
+        self.scores = dict(scores)
+        self._keys = sorted((-score, team_id) for team_id, score in self.scores.items())
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def set(self, team_id: int, score: Optional[float]) -> None:
+        """Set a team's score; None takes the team off the ranking"""
+        old = self.scores.pop(team_id, None)
+        if old is not None:
+            del self._keys[bisect.bisect_left(self._keys, (-old, team_id))]
+        if score is not None:
+            self.scores[team_id] = score
+            bisect.insort(self._keys, (-score, team_id))
+
+    def rank(self, team_id: int) -> Optional[int]:
+        score = self.scores.get(team_id)
+        if score is None:
+            return None
+        return bisect.bisect_left(self._keys, (-score,)) + 1
+
+    def top(self, n: int) -> List[Tuple[int, int, float]]:
+        """(rank, team_id, score) of the n best teams"""
+        entries = []
+        for index, (negative, team_id) in enumerate(self._keys[:n]):
+            rank = entries[-1][0] if entries and -negative == entries[-1][2] else index + 1
+            entries.append((rank, team_id, -negative))
+        return entries
+
+
+class Leaderboard:
+    """Rankings loaded from team_scores on first use, then kept up to date.
+
+    Score changes made through this process are applied in place; a change
+    reported by another replica drops the affected rankings so they are
+    reloaded. A ranking being loaded while a change arrives is used for
+    that one request but not kept, as the catalog cache does.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._rankings: Dict[Scope, Ranking] = {}
+        self._versions: Dict[Scope, int] = defaultdict(int)
+        # Bumped when every ranking is dropped, so loads in flight aren't kept either
+        self._epoch = 0
+        db.add_score_listener(self._on_score_changed)
+
+    async def ranking(self, kind: str, scope_id: int) -> Ranking:
+        scope = (kind, scope_id)
+        ranking = self._rankings.get(scope)
+        if ranking is not None:
+            return ranking
+
+        version = (self._epoch, self._versions[scope])
+        if kind == STAGE:
+            rows = await self.db.get_stage_team_scores(scope_id)
+        else:
+            rows = await self.db.get_hackathon_team_scores(scope_id)
+        ranking = Ranking({row['team_id']: float(row['score']) for row in rows})
+        if version == (self._epoch, self._versions[scope]):
+            self._rankings[scope] = ranking
+        return ranking
+
+    async def top(self, kind: str, scope_id: int, n: int = 10) -> List[Dict[str, Any]]:
+        """The n best teams with their names"""
+        entries = (await self.ranking(kind, scope_id)).top(n)
+        names = await self.db.get_team_names([team_id for _, team_id, _ in entries])
+        return [
+            {'rank': rank, 'team_id': team_id, 'name': names.get(team_id, f'Team {team_id}'), 'score': score}
+            for rank, team_id, score in entries
+        ]
+
+    async def team_rank(self, kind: str, scope_id: int, team_id: int) -> Optional[Dict[str, Any]]:
+        """A team's rank and score, None if it has no score yet"""
+        ranking = await self.ranking(kind, scope_id)
+        rank = ranking.rank(team_id)
+        if rank is None:
+            return None
+        return {'rank': rank, 'score': ranking.scores[team_id], 'teams': len(ranking)}
+
+    def invalidate(self, kind: Optional[str] = None, scope_id: Optional[int] = None) -> None:
+        """Drop one ranking, or all of them"""
+        if kind is None:
+            self._epoch += 1
+            self._rankings.clear()
+            return
+        self._versions[(kind, scope_id)] += 1
+        self._rankings.pop((kind, scope_id), None)
+
+    async def _on_score_changed(self, change: Dict[str, Any]) -> None:
+        if change.get('stage_id') is None:
+            self.invalidate()
+            return
+        team_id = change.get('team_id')
+        if team_id is None:
+            return
+        stage_scope = (STAGE, change['stage_id'])
+        hackathon_scope = (HACKATHON, change['hackathon_id'])
+        self._versions[stage_scope] += 1
+        self._versions[hackathon_scope] += 1
+
+        if change.get('remote'):
+            self._rankings.pop(stage_scope, None)
+            self._rankings.pop(hackathon_scope, None)
+            return
+
+        stage = self._rankings.get(stage_scope)
+        if stage is not None:
+            stage.set(team_id, change['score'])
+
+        hackathon = self._rankings.get(hackathon_scope)
+        if hackathon is not None:
+            if change['score'] is None:
+                # The team may have no scored stage left; recount it from team_scores
+                self._rankings.pop(hackathon_scope)
+            else:
+                total = hackathon.scores.get(team_id, 0.0) + change['score'] - (change['previous'] or 0.0)
+                hackathon.set(team_id, round(total, 2))
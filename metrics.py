@@ -0,0 +1,244 @@
+"""
+Handler metrics for ITCom Hackathons Bot
+Latency histograms, error counts and in-flight gauges per handler and
+conversation state, plus update queue depth, served in the Prometheus text
+format on /metrics
+"""
+
+import bisect
+import functools
+import logging
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from telegram.ext import Application, ConversationHandler
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds (seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, str]
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram"""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i else 0.0
+                if i == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+# Where an update can be: waiting for the same user's earlier updates, queued
+# for a free processing slot, or running
+UPDATE_STAGES = ('waiting', 'queued', 'running')
+
+
+class HandlerMetrics:
+    """Per (handler, state) latency, errors and requests in flight, and
+    how many updates are at each stage of processing"""
+
+    def __init__(self):
+        self.latency: Dict[Labels, Histogram] = defaultdict(Histogram)
+        self.errors: Dict[Labels, int] = defaultdict(int)
+        self.in_flight: Dict[Labels, int] = defaultdict(int)
+        self.updates: Dict[str, int] = dict.fromkeys(UPDATE_STAGES, 0)
+        self.update_wait = Histogram()
+
+    @asynccontextmanager
+    async def track(self, handler: str, state: str = ''):
+        """Time the block and count it as failed if it raises"""
+        labels = (handler, state)
+        self.in_flight[labels] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors[labels] += 1
+            raise
+        finally:
+            self.latency[labels].observe(time.perf_counter() - started)
+            self.in_flight[labels] -= 1
+
+    @contextmanager
+    def update_stage(self, stage: str):
+        """Count an update at a stage of processing for the duration of the block"""
+        self.updates[stage] += 1
+        try:
+            yield
+        finally:
+            self.updates[stage] -= 1
+
+    def summary(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Busiest handlers first, with average and estimated p95 latency"""
+        rows = [
+            {
+                'handler': handler,
+                'state': state,
+                'calls': hist.count,
+                'errors': self.errors.get((handler, state), 0),
+                'avg_ms': hist.sum / hist.count * 1000,
+                'p95_ms': hist.quantile(0.95) * 1000,
+            }
+            for (handler, state), hist in self.latency.items() if hist.count
+        ]
+        rows.sort(key=lambda row: row['calls'] * row['avg_ms'], reverse=True)
+        return rows[:limit]
+
+    def render(self) -> str:
+        """Prometheus text exposition of every metric"""
+        lines = [
+            '# HELP bot_handler_duration_seconds Time spent in a handler',
+            '# TYPE bot_handler_duration_seconds histogram',
+        ]
+        for (handler, state), hist in sorted(self.latency.items()):
+            labels = _labels(handler, state)
+            bounds = [str(bound) for bound in hist.buckets] + ['+Inf']
+            cumulative = 0
+            for bound, count in zip(bounds, hist.counts):
+                cumulative += count
+                lines.append(f'bot_handler_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'bot_handler_duration_seconds_sum{{{labels}}} {hist.sum}')
+            lines.append(f'bot_handler_duration_seconds_count{{{labels}}} {hist.count}')
+
+        lines += [
+            '# HELP bot_handler_errors_total Handler calls that raised',
+            '# TYPE bot_handler_errors_total counter',
+        ]
+        for (handler, state), count in sorted(self.errors.items()):
+            lines.append(f'bot_handler_errors_total{{{_labels(handler, state)}}} {count}')
+
+        lines += [
+            '# HELP bot_handler_in_flight Handler calls currently running',
+            '# TYPE bot_handler_in_flight gauge',
+        ]
+        for (handler, state), count in sorted(self.in_flight.items()):
+            lines.append(f'bot_handler_in_flight{{{_labels(handler, state)}}} {count}')
+
+        lines += [
+            '# HELP bot_updates Updates waiting for the same user, queued for a slot, or running',
+            '# TYPE bot_updates gauge',
+        ]
+        for stage in UPDATE_STAGES:
+            lines.append(f'bot_updates{{stage="{stage}"}} {self.updates[stage]}')
+
+        lines += [
+            '# HELP bot_update_wait_seconds Time from an update arriving to its handling starting',
+            '# TYPE bot_update_wait_seconds histogram',
+        ]
+        hist = self.update_wait
+        cumulative = 0
+        for bound, count in zip([str(bound) for bound in hist.buckets] + ['+Inf'], hist.counts):
+            cumulative += count
+            lines.append(f'bot_update_wait_seconds_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'bot_update_wait_seconds_sum {hist.sum}')
+        lines.append(f'bot_update_wait_seconds_count {hist.count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(handler: str, state: str) -> str:
+    def escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'handler="{escape(handler)}",state="{escape(state)}"'
+
+
+# Shared by the handlers, the scheduler and the /metrics endpoint
+metrics = HandlerMetrics()
+
+
+def instrument(callback: Callable, handler: str, state: str = '') -> Callable:
+    """Wrap a handler callback so every call is tracked"""
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        async with metrics.track(handler, state):
+            return await callback(*args, **kwargs)
+    wrapper.instrumented = True
+    return wrapper
+
+
+def instrument_handlers(application: Application, state_names: Optional[Dict[Any, str]] = None) -> int:
+    """Instrument every handler registered on the application.
+
+    Conversation handlers are unpacked so each callback is labelled with
+    the state it serves ('entry' and 'fallback' for entry points and
+    fallbacks); state_names maps state values to readable names.
+    """
+    state_names = state_names or {}
+    count = 0
+
+    def wrap(handler, state: str) -> None:
+        nonlocal count
+        if getattr(handler.callback, 'instrumented', False):
+            return
+        handler.callback = instrument(handler.callback, handler.callback.__name__, state)
+        count += 1
+
+    for group in application.handlers.values():
+        for handler in group:
+            if isinstance(handler, ConversationHandler):
+                for entry in handler.entry_points:
+                    wrap(entry, 'entry')
+                for state, handlers in handler.states.items():
+                    for state_handler in handlers:
+                        wrap(state_handler, state_names.get(state, str(state)))
+                for fallback in handler.fallbacks:
+                    wrap(fallback, 'fallback')
+            else:
+                wrap(handler, '')
+
+    return count
+
+
+class MetricsServer:
+    """Serves /metrics on a local port"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError:
+            await self.stop()
+            raise
+        logger.info(f"Metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
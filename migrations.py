@@ -0,0 +1,457 @@
+"""
+Schema migrations for ITCom Hackathons Bot
+Versioned, forward-only changes applied at startup for both backends
+"""
+
+import logging
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for the advisory lock that serializes migrations across replicas
+MIGRATION_LOCK_ID = 7250431
+
+SCHEMA_VERSION_TABLE = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# (version, description, PostgreSQL statements, SQLite statements)
+# Append new migrations at the end; never edit one that has shipped.
+MIGRATIONS: List[Tuple[int, str, List[str], List[str]]] = [
+    (1, 'base schema', [
+        '''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id BIGINT PRIMARY KEY,
+                username VARCHAR(255),
+                first_name VARCHAR(255),
+                last_name VARCHAR(255),
+                birth_date DATE,
+                phone VARCHAR(50),
+                pinfl VARCHAR(20),
+                gender VARCHAR(20),
+                location VARCHAR(255),
+                language VARCHAR(5) DEFAULT 'en',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS hackathons (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                description TEXT,
+                start_date DATE,
+                end_date DATE,
+                prize_pool VARCHAR(100),
+                image_url TEXT,
+                is_active BOOLEAN DEFAULT TRUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS teams (
+                id SERIAL PRIMARY KEY,
+                hackathon_id INTEGER REFERENCES hackathons(id),
+                name VARCHAR(255) NOT NULL,
+                code VARCHAR(10) UNIQUE NOT NULL,
+                leader_id BIGINT REFERENCES users(user_id),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS team_members (
+                id SERIAL PRIMARY KEY,
+                team_id INTEGER REFERENCES teams(id),
+                user_id BIGINT REFERENCES users(user_id),
+                role VARCHAR(100) DEFAULT 'Member',
+                joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(team_id, user_id)
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS registrations (
+                id SERIAL PRIMARY KEY,
+                user_id BIGINT REFERENCES users(user_id),
+                hackathon_id INTEGER REFERENCES hackathons(id),
+                team_id INTEGER REFERENCES teams(id),
+                registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(user_id, hackathon_id)
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS stages (
+                id SERIAL PRIMARY KEY,
+                hackathon_id INTEGER REFERENCES hackathons(id),
+                number INTEGER NOT NULL,
+                name VARCHAR(255) NOT NULL,
+                task_description TEXT,
+                start_date DATE,
+                end_date DATE,
+                is_active BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS submissions (
+                id SERIAL PRIMARY KEY,
+                user_id BIGINT REFERENCES users(user_id),
+                stage_id INTEGER REFERENCES stages(id),
+                team_id INTEGER REFERENCES teams(id),
+                link TEXT,
+                notes TEXT,
+                submission_type VARCHAR(50) DEFAULT 'link',
+                file_name VARCHAR(255),
+                submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                score DECIMAL(5,2),
+                UNIQUE(user_id, stage_id)
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS announcements (
+                id SERIAL PRIMARY KEY,
+                hackathon_id INTEGER REFERENCES hackathons(id),
+                title VARCHAR(255),
+                content TEXT NOT NULL,
+                sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+    ], [
+        '''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                birth_date TEXT,
+                phone TEXT,
+                pinfl TEXT,
+                gender TEXT,
+                location TEXT,
+                language TEXT DEFAULT 'en',
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS hackathons (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                description TEXT,
+                start_date TEXT,
+                end_date TEXT,
+                prize_pool TEXT,
+                image_url TEXT,
+                is_active INTEGER DEFAULT 1,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS teams (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hackathon_id INTEGER,
+                name TEXT NOT NULL,
+                code TEXT UNIQUE NOT NULL,
+                leader_id INTEGER,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (hackathon_id) REFERENCES hackathons(id),
+                FOREIGN KEY (leader_id) REFERENCES users(user_id)
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS team_members (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                team_id INTEGER,
+                user_id INTEGER,
+                role TEXT DEFAULT 'Member',
+                joined_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (team_id) REFERENCES teams(id),
+                FOREIGN KEY (user_id) REFERENCES users(user_id),
+                UNIQUE(team_id, user_id)
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS registrations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                hackathon_id INTEGER,
+                team_id INTEGER,
+                registered_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id),
+                FOREIGN KEY (hackathon_id) REFERENCES hackathons(id),
+                FOREIGN KEY (team_id) REFERENCES teams(id),
+                UNIQUE(user_id, hackathon_id)
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS stages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hackathon_id INTEGER,
+                number INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                task_description TEXT,
+                start_date TEXT,
+                end_date TEXT,
+                is_active INTEGER DEFAULT 0,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (hackathon_id) REFERENCES hackathons(id)
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS submissions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                stage_id INTEGER,
+                team_id INTEGER,
+                link TEXT,
+                notes TEXT,
+                submission_type TEXT DEFAULT 'link',
+                file_name TEXT,
+                submitted_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                score REAL,
+                FOREIGN KEY (user_id) REFERENCES users(user_id),
+                FOREIGN KEY (stage_id) REFERENCES stages(id),
+                FOREIGN KEY (team_id) REFERENCES teams(id),
+                UNIQUE(user_id, stage_id)
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS announcements (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hackathon_id INTEGER,
+                title TEXT,
+                content TEXT NOT NULL,
+                sent_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (hackathon_id) REFERENCES hackathons(id)
+            )
+        ''',
+    ]),
+    (2, 'secondary indexes', [
+        'CREATE INDEX IF NOT EXISTS idx_registrations_hackathon ON registrations (hackathon_id)',
+        'CREATE INDEX IF NOT EXISTS idx_teams_hackathon ON teams (hackathon_id)',
+        'CREATE INDEX IF NOT EXISTS idx_stages_hackathon ON stages (hackathon_id, number)',
+        'CREATE INDEX IF NOT EXISTS idx_submissions_stage ON submissions (stage_id)',
+        'CREATE INDEX IF NOT EXISTS idx_hackathons_active ON hackathons (start_date) WHERE is_active',
+    ], [
+        'CREATE INDEX IF NOT EXISTS idx_registrations_hackathon ON registrations (hackathon_id)',
+        'CREATE INDEX IF NOT EXISTS idx_teams_hackathon ON teams (hackathon_id)',
+        'CREATE INDEX IF NOT EXISTS idx_stages_hackathon ON stages (hackathon_id, number)',
+        'CREATE INDEX IF NOT EXISTS idx_submissions_stage ON submissions (stage_id)',
+        'CREATE INDEX IF NOT EXISTS idx_hackathons_active ON hackathons (start_date) WHERE is_active = 1',
+    ]),
+    (3, 'conversation persistence', [
+        '''
+            CREATE TABLE IF NOT EXISTS conversation_states (
+                name VARCHAR(100) NOT NULL,
+                conv_key VARCHAR(100) NOT NULL,
+                state TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (name, conv_key)
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS user_data (
+                user_id BIGINT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+    ], [
+        '''
+            CREATE TABLE IF NOT EXISTS conversation_states (
+                name TEXT NOT NULL,
+                conv_key TEXT NOT NULL,
+                state TEXT NOT NULL,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (name, conv_key)
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS user_data (
+                user_id INTEGER PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+    ]),
+    (4, 'submission file storage', [
+        'ALTER TABLE submissions ADD COLUMN IF NOT EXISTS file_id TEXT',
+        'ALTER TABLE submissions ADD COLUMN IF NOT EXISTS file_status VARCHAR(20)',
+        'ALTER TABLE submissions ADD COLUMN IF NOT EXISTS file_digest CHAR(64)',
+        'ALTER TABLE submissions ADD COLUMN IF NOT EXISTS file_size BIGINT',
+        "CREATE INDEX IF NOT EXISTS idx_submissions_file_pending ON submissions (id) WHERE file_status = 'pending'",
+    ], [
+        'ALTER TABLE submissions ADD COLUMN file_id TEXT',
+        'ALTER TABLE submissions ADD COLUMN file_status TEXT',
+        'ALTER TABLE submissions ADD COLUMN file_digest TEXT',
+        'ALTER TABLE submissions ADD COLUMN file_size INTEGER',
+        "CREATE INDEX IF NOT EXISTS idx_submissions_file_pending ON submissions (id) WHERE file_status = 'pending'",
+    ]),
+    (5, 'team leaderboard', [
+        '''
+            CREATE TABLE IF NOT EXISTS team_scores (
+                stage_id INTEGER NOT NULL REFERENCES stages(id),
+                team_id INTEGER NOT NULL REFERENCES teams(id),
+                hackathon_id INTEGER NOT NULL REFERENCES hackathons(id),
+                score DECIMAL(5,2) NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (stage_id, team_id)
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_team_scores_stage_rank ON team_scores (stage_id, score DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_team_scores_hackathon ON team_scores (hackathon_id, team_id)',
+        'CREATE INDEX IF NOT EXISTS idx_submissions_stage_team ON submissions (stage_id, team_id)',
+        '''
+            INSERT INTO team_scores (stage_id, team_id, hackathon_id, score)
+            SELECT s.stage_id, s.team_id, st.hackathon_id, MAX(s.score)
+            FROM submissions s JOIN stages st ON st.id = s.stage_id
+            WHERE s.score IS NOT NULL AND s.team_id IS NOT NULL
+            GROUP BY s.stage_id, s.team_id, st.hackathon_id
+            ON CONFLICT DO NOTHING
+        ''',
+    ], [
+        '''
+            CREATE TABLE IF NOT EXISTS team_scores (
+                stage_id INTEGER NOT NULL,
+                team_id INTEGER NOT NULL,
+                hackathon_id INTEGER NOT NULL,
+                score REAL NOT NULL,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (stage_id, team_id),
+                FOREIGN KEY (stage_id) REFERENCES stages(id),
+                FOREIGN KEY (team_id) REFERENCES teams(id),
+                FOREIGN KEY (hackathon_id) REFERENCES hackathons(id)
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_team_scores_stage_rank ON team_scores (stage_id, score DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_team_scores_hackathon ON team_scores (hackathon_id, team_id)',
+        'CREATE INDEX IF NOT EXISTS idx_submissions_stage_team ON submissions (stage_id, team_id)',
+        '''
+            INSERT OR IGNORE INTO team_scores (stage_id, team_id, hackathon_id, score)
+            SELECT s.stage_id, s.team_id, st.hackathon_id, MAX(s.score)
+            FROM submissions s JOIN stages st ON st.id = s.stage_id
+            WHERE s.score IS NOT NULL AND s.team_id IS NOT NULL
+            GROUP BY s.stage_id, s.team_id, st.hackathon_id
+        ''',
+    ]),
+    (6, 'stage results', [
+        '''
+            CREATE TABLE IF NOT EXISTS stage_results (
+                stage_id INTEGER NOT NULL REFERENCES stages(id),
+                team_id INTEGER NOT NULL REFERENCES teams(id),
+                advanced BOOLEAN NOT NULL,
+                decided_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (stage_id, team_id)
+            )
+        ''',
+    ], [
+        '''
+            CREATE TABLE IF NOT EXISTS stage_results (
+                stage_id INTEGER NOT NULL,
+                team_id INTEGER NOT NULL,
+                advanced INTEGER NOT NULL,
+                decided_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (stage_id, team_id),
+                FOREIGN KEY (stage_id) REFERENCES stages(id),
+                FOREIGN KEY (team_id) REFERENCES teams(id)
+            )
+        ''',
+    ]),
+    (7, 'background jobs', [
+        '''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id SERIAL PRIMARY KEY,
+                kind VARCHAR(50) NOT NULL,
+                title TEXT NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                created_by BIGINT NOT NULL,
+                chat_id BIGINT NOT NULL,
+                message_id BIGINT,
+                processed INTEGER NOT NULL DEFAULT 0,
+                total INTEGER,
+                result TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_jobs_unfinished ON jobs (id) WHERE status IN ('queued', 'running')",
+    ], [
+        '''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                title TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                created_by INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER,
+                processed INTEGER NOT NULL DEFAULT 0,
+                total INTEGER,
+                result TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                finished_at TEXT
+            )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_jobs_unfinished ON jobs (id) WHERE status IN ('queued', 'running')",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def migrate_postgres(conn) -> int:
+    """Apply pending migrations on an asyncpg connection, return the schema version"""
+    await conn.execute(SCHEMA_VERSION_TABLE)
+    
+    async with conn.transaction():
+        # Replicas starting together wait here instead of racing the DDL
+        await conn.execute('SELECT pg_advisory_xact_lock($1)', MIGRATION_LOCK_ID)
+        current = await conn.fetchval('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+        
+        for version, description, statements, _ in MIGRATIONS:
+            if version <= current:
+                continue
+            for statement in statements:
+                await conn.execute(statement)
+            await conn.execute(
+                'INSERT INTO schema_version (version, description) VALUES ($1, $2)',
+                version, description
+            )
+            logger.info(f"Applied migration {version}: {description}")
+            current = version
+    
+    return current
+
+
+async def migrate_sqlite(db) -> int:
+    """Apply pending migrations on an aiosqlite connection, return the schema version"""
+    await db.execute(SCHEMA_VERSION_TABLE)
+    
+    async with db.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version') as cursor:
+        current = (await cursor.fetchone())[0]
+    
+    for version, description, _, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        # SQLite DDL is transactional too: a version is applied whole or not at all
+        await db.execute('BEGIN')
+        try:
+            for statement in statements:
+                await db.execute(statement)
+            await db.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (version, description)
+            )
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+        logger.info(f"Applied migration {version}: {description}")
+        current = version
+    
+    return current
@@ -0,0 +1,152 @@
+"""
+Conversation persistence for ITCom Hackathons Bot
+Keeps ConversationHandler states and user_data in the bot's own database
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config import PERSISTENCE_INTERVAL
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# How long to wait for the rest of an update_persistence() round before writing
+BATCH_WINDOW = 0.05
+
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, default=str)
+
+
+class DatabasePersistence(BasePersistence):
+    """Write-behind persistence backed by the ``conversation_states`` and
+    ``user_data`` tables.
+
+    The application hands over changed states every ``update_interval``
+    seconds; they are buffered here and written in a single transaction,
+    so handlers never wait for a persistence write. Only conversations and
+    user_data are stored — the bot keeps nothing in chat_data or bot_data.
+    The database must be connected before the application initializes,
+    since that is when states and user_data are loaded.
+    """
+
+    def __init__(self, db: Database, update_interval: float = PERSISTENCE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False,
+                                        user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db = db
+        self._conversations: Optional[Dict[str, Dict[Tuple, object]]] = None
+        # Pending writes; None means "delete"
+        self._dirty_states: Dict[Tuple[str, str], Optional[str]] = {}
+        self._dirty_users: Dict[int, Optional[str]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._write_lock = asyncio.Lock()
+
+    # ---- loading (called once while the application initializes) ----
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        rows = await self.db.load_user_data()
+        return {row['user_id']: json.loads(row['data']) for row in rows}
+
+    async def get_conversations(self, name: str) -> Dict[Tuple, object]:
+        if self._conversations is None:
+            conversations: Dict[str, Dict[Tuple, object]] = {}
+            for row in await self.db.load_conversation_states():
+                key = tuple(json.loads(row['conv_key']))
+                conversations.setdefault(row['name'], {})[key] = json.loads(row['state'])
+            self._conversations = conversations
+        return self._conversations.get(name, {})
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    # ---- buffering ----
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]) -> None:
+        state = None if new_state is None else _encode(new_state)
+        self._dirty_states[(name, _encode(list(key)))] = state
+        self._schedule_write()
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        self._dirty_users[user_id] = _encode(data) if data else None
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._dirty_users[user_id] = None
+        self._schedule_write()
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
+
+    # ---- writing ----
+
+    def _schedule_write(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._write_soon())
+
+    async def _write_soon(self) -> None:
+        # Let the rest of this round's update_* calls land in the same batch
+        await asyncio.sleep(BATCH_WINDOW)
+        await self._write()
+
+    async def _write(self) -> None:
+        async with self._write_lock:
+            states, self._dirty_states = self._dirty_states, {}
+            users, self._dirty_users = self._dirty_users, {}
+            if not states and not users:
+                return
+
+            try:
+                await self.db.save_persistence_batch(
+                    states=[(name, key, state) for (name, key), state in states.items() if state is not None],
+                    dropped_states=[(name, key) for (name, key), state in states.items() if state is None],
+                    user_data=[(user_id, data) for user_id, data in users.items() if data is not None],
+                    dropped_users=[user_id for user_id, data in users.items() if data is None],
+                )
+            except Exception as e:
+                logger.error(f"Failed to write persistence batch, keeping it for the next one: {e}")
+                # Newer changes buffered in the meantime win over the failed ones
+                for key, state in states.items():
+                    self._dirty_states.setdefault(key, state)
+                for user_id, data in users.items():
+                    self._dirty_users.setdefault(user_id, data)
+                return
+
+            logger.debug(f"Persisted {len(states)} conversation states, {len(users)} user_data entries")
+
+    async def flush(self) -> None:
+        """Write everything still buffered (called on shutdown)"""
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        await self._write()
@@ -0,0 +1,236 @@
+"""
+Query profiler for ITCom Hackathons Bot
+Opt-in per-method timing of Database calls with a redacted slow-query log
+"""
+
+import functools
+import inspect
+import logging
+import re
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+slow_log = logging.getLogger('slow_queries')
+
+# Parameters never written to the slow-query log
+SENSITIVE_PARAMS = {'pinfl', 'phone'}
+
+# PINFL (14 digits) and phone numbers inside any other string parameter
+SENSITIVE_VALUE = re.compile(r'\+?\d[\d\s()-]{6,}\d')
+
+# Database methods that are lifecycle or cache plumbing rather than queries
+NOT_PROFILED = {'connect', 'close', 'invalidate_catalog', 'add_stage_listener',
+                'remove_stage_listener', 'add_score_listener', 'remove_score_listener',
+                'statement_stats', 'user_cache_stats', 'profile_dump'}
+
+# Method being profiled in the current task, so pool waits can be charged to it
+_current: ContextVar[Optional['MethodStats']] = ContextVar('profiled_method', default=None)
+
+
+def redact(name: str, value: Any) -> str:
+    """Loggable form of a parameter with PINFL/phone values masked"""
+    if name in SENSITIVE_PARAMS and value is not None:
+        return '***'
+    if isinstance(value, str):
+        return repr(SENSITIVE_VALUE.sub('***', value[:80]))
+    if isinstance(value, (list, tuple, dict, set)):
+        # Batches can carry user_data and other free-form payloads
+        return f'<{type(value).__name__} len={len(value)}>'
+    return repr(value)
+
+
+def _row_count(result: Any) -> int:
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return len(result)
+    return 1
+
+
+class MethodStats:
+    """Counters of one Database method"""
+
+    def __init__(self, samples: int):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total = 0.0
+        self.wait = 0.0
+        self.latencies: Deque[float] = deque(maxlen=samples)
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class QueryProfiler:
+    """Times every query method of a Database instance.
+
+    attach() wraps the instance's methods in place, so the Database code
+    itself is untouched and nothing is wrapped unless profiling is turned
+    on. Nested calls (create_user reading the user back, for example) are
+    counted under both methods. Pool waits are measured where connections
+    are handed out and charged to the method that asked for them.
+    """
+
+    def __init__(self, slow_ms: float = 200, samples: int = 2048, slow_entries: int = 50):
+        self.slow_ms = slow_ms
+        self.samples = samples
+        self.started_at = time.time()
+        self.methods: Dict[str, MethodStats] = defaultdict(lambda: MethodStats(self.samples))
+        self.slow: Deque[str] = deque(maxlen=slow_entries)
+
+    # ---- attaching ----
+
+    def attach(self, db) -> int:
+        """Wrap every public async method of db; returns how many were wrapped"""
+        count = 0
+        for name, method in inspect.getmembers(db, inspect.ismethod):
+            if name.startswith('_') or name in NOT_PROFILED:
+                continue
+            if inspect.isasyncgenfunction(method):
+                setattr(db, name, self._wrap_generator(name, method))
+            elif inspect.iscoroutinefunction(method):
+                setattr(db, name, self._wrap(name, method))
+            else:
+                continue
+            count += 1
+        return count
+
+    def _wrap(self, name: str, method: Callable) -> Callable:
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            stats = self.methods[name]
+            token = _current.set(stats)
+            started = time.perf_counter()
+            result = None
+            try:
+                result = await method(*args, **kwargs)
+                return result
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                _current.reset(token)
+                self._record(name, stats, time.perf_counter() - started,
+                             _row_count(result), signature, args, kwargs)
+        return wrapper
+
+    def _wrap_generator(self, name: str, method: Callable) -> Callable:
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            stats = self.methods[name]
+            iterator = method(*args, **kwargs)
+            elapsed = 0.0
+            rows = 0
+            try:
+                while True:
+                    # Time each step of the generator as a call: the first one
+                    # acquires the connection, so its wait is timed and charged
+                    # here; the consumer's work between chunks is not
+                    token = _current.set(stats)
+                    started = time.perf_counter()
+                    try:
+                        chunk = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        elapsed += time.perf_counter() - started
+                        _current.reset(token)
+                    rows += _row_count(chunk)
+                    yield chunk
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                await iterator.aclose()
+                self._record(name, stats, elapsed, rows, signature, args, kwargs)
+        return wrapper
+
+    def _record(self, name: str, stats: MethodStats, elapsed: float, rows: int,
+                signature: inspect.Signature, args: tuple, kwargs: dict) -> None:
+        stats.calls += 1
+        stats.rows += rows
+        stats.total += elapsed
+        stats.latencies.append(elapsed)
+
+        if elapsed * 1000 >= self.slow_ms:
+            try:
+                bound = signature.bind(*args, **kwargs).arguments
+            except TypeError:
+                bound = {}
+            params = ', '.join(f'{key}={redact(key, value)}' for key, value in bound.items())
+            entry = f"{name}({params}) took {elapsed * 1000:.1f} ms, {rows} rows"
+            self.slow.append(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {entry}")
+            slow_log.warning(entry)
+
+    # ---- pool waits ----
+
+    @staticmethod
+    def record_wait(seconds: float) -> None:
+        stats = _current.get()
+        if stats is not None:
+            stats.wait += seconds
+
+    # ---- reporting ----
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Per-method counters, most total time first"""
+        rows = [
+            {
+                'method': name,
+                'calls': stats.calls,
+                'errors': stats.errors,
+                'rows': stats.rows,
+                'total_ms': stats.total * 1000,
+                'p50_ms': stats.percentile(0.50) * 1000,
+                'p95_ms': stats.percentile(0.95) * 1000,
+                'p99_ms': stats.percentile(0.99) * 1000,
+                'wait_ms': stats.wait * 1000,
+            }
+            for name, stats in self.methods.items() if stats.calls
+        ]
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows
+
+    def dump(self, limit: int = 15) -> str:
+        """Plain-text report of the busiest methods and the latest slow queries"""
+        lines = [f"Database profile since {time.strftime('%Y-%m-%d %H:%M', time.localtime(self.started_at))}"]
+        for row in self.report()[:limit]:
+            lines.append(
+                f"{row['method']}: {row['calls']} calls, {row['total_ms']:.0f} ms total, "
+                f"p50 {row['p50_ms']:.1f} / p95 {row['p95_ms']:.1f} / p99 {row['p99_ms']:.1f} ms, "
+                f"{row['rows']} rows, {row['wait_ms']:.0f} ms pool wait, {row['errors']} errors"
+            )
+        if self.slow:
+            lines.append(f"\nSlow queries (>= {self.slow_ms:.0f} ms):")
+            lines.extend(list(self.slow)[-10:])
+        return '\n'.join(lines)
+
+
+class TimedPool:
+    """asyncpg pool wrapper that reports how long acquire() waited"""
+
+    def __init__(self, pool, on_wait: Callable[[float], None]):
+        self._pool = pool
+        self._on_wait = on_wait
+
+    @asynccontextmanager
+    async def acquire(self):
+        started = time.perf_counter()
+        async with self._pool.acquire() as conn:
+            self._on_wait(time.perf_counter() - started)
+            yield conn
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
@@ -3,16 +3,18 @@ Scheduler module for ITCom Hackathons Bot
 Handles automatic notifications and deadline reminders
 """
 
-import asyncio
 import logging
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Iterable, Optional
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
 import pytz
 
+from broadcast import BroadcastResult, ProgressCallback, get_broadcaster
 from database import Database
+from metrics import metrics
 from translations import get_text
 from config import TIMEZONE
 
@@ -22,7 +24,51 @@ logger = logging.getLogger(__name__)
 tz = pytz.timezone(TIMEZONE)
 
 
+# When each stage notification fires: (stage date field, days from that date, hour)
+STAGE_NOTIFICATIONS = {
+    'reminder_3d': ('start_date', -3, 10),
+    'reminder_2d': ('start_date', -2, 10),
+    'stage_started': ('start_date', 0, 9),
+    'deadline_today': ('end_date', 0, 9),
+    'deadline_last_hours': ('end_date', 0, 21),
+}
+
+# Notifications that only go out while the stage itself is active
+ACTIVE_STAGE_ONLY = {'stage_started', 'deadline_today', 'deadline_last_hours'}
+
+# How late a job may still run after a restart or a busy event loop (seconds)
+MISFIRE_GRACE_TIME = 3600
+
+
+def _as_date(value) -> Optional[date]:
+    """Stage dates are DATE on PostgreSQL and ISO strings on SQLite"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(value).date()
+
+
+def fire_time(stage: dict, kind: str) -> Optional[datetime]:
+    """Moment a stage notification is due, or None if the stage has no such date"""
+    field, days, hour = STAGE_NOTIFICATIONS[kind]
+    day = _as_date(stage.get(field))
+    if day is None:
+        return None
+    return tz.localize(datetime.combine(day + timedelta(days=days), dt_time(hour)))
+
+
 class NotificationScheduler:
+    """Sends stage reminders and deadline notifications.
+    
+    Every notification is a one-shot job at the exact time computed from
+    the stage dates. Jobs are re-planned whenever the database reports a
+    stage change, and once a day as a safety net for changes made outside
+    this process, so nothing runs between notifications.
+    """
+    
     def __init__(self, bot, db: Database):
         self.bot = bot
         self.db = db
@@ -30,27 +76,14 @@ class NotificationScheduler:
     
     def start(self):
         """Start the scheduler"""
-        # Check deadlines every hour
-        self.scheduler.add_job(
-            self.check_deadlines,
-            CronTrigger(hour='*'),  # Every hour
-            id='check_deadlines',
-            replace_existing=True
-        )
-        
-        # Send daily reminders at 10:00 AM
-        self.scheduler.add_job(
-            self.send_daily_reminders,
-            CronTrigger(hour=10, minute=0),
-            id='daily_reminders',
-            replace_existing=True
-        )
+        self.db.add_stage_listener(self.plan_stage)
         
-        # Check for new stages at 9:00 AM
+        # Plan every stage now, then re-plan daily
+        self.scheduler.add_job(self.plan_all, id='plan_all', replace_existing=True)
         self.scheduler.add_job(
-            self.notify_new_stages,
-            CronTrigger(hour=9, minute=0),
-            id='new_stages',
+            self.plan_all,
+            CronTrigger(hour=0, minute=5),
+            id='replan_daily',
             replace_existing=True
         )
         
@@ -59,223 +92,241 @@ class NotificationScheduler:
     
     def stop(self):
         """Stop the scheduler"""
+        self.db.remove_stage_listener(self.plan_stage)
         self.scheduler.shutdown()
         logger.info("Notification scheduler stopped")
     
-    async def check_deadlines(self):
-        """Check for approaching deadlines and send notifications"""
-        try:
-            now = datetime.now(tz)
-            today = now.date()
-            
-            # Get all active stages
-            hackathons = await self.db.get_active_hackathons()
-            
-            for hackathon in hackathons:
-                stages = await self.db.get_hackathon_stages(hackathon['id'])
-                
-                for stage in stages:
-                    if not stage.get('is_active'):
-                        continue
-                    
-                    end_date = datetime.fromisoformat(stage['end_date']).date() if stage.get('end_date') else None
-                    if not end_date:
-                        continue
-                    
-                    days_left = (end_date - today).days
-                    
-                    # Notify based on days left
-                    if days_left == 0 and now.hour == 9:
-                        await self.send_deadline_notification(
-                            hackathon['id'],
-                            f"⏳ Deadline approaching!\n\n"
-                            f"Today until 23:59 — the final chance to submit your Stage {stage['number']} answers.\n"
-                            f"The Selection Team will review submissions tomorrow.\n\n"
-                            f"Good luck! ✨"
-                        )
-                    elif days_left == 0 and now.hour == 21:
-                        await self.send_deadline_notification(
-                            hackathon['id'],
-                            f"⚠️ LAST 3 HOURS!\n\n"
-                            f"Stage {stage['number']} deadline is at 23:59 tonight.\n"
-                            f"Don't forget to submit your work!"
-                        )
+    # ============== PLANNING ==============
+    
+    @staticmethod
+    def _job_id(stage_id: int, kind: str) -> str:
+        return f"stage:{stage_id}:{kind}"
+    
+    def _unplan(self, stage_id: int) -> None:
+        for kind in STAGE_NOTIFICATIONS:
+            job = self.scheduler.get_job(self._job_id(stage_id, kind))
+            if job:
+                job.remove()
+    
+    def _plan(self, stage: dict) -> int:
+        """Register the stage's future notifications, replacing any planned before"""
+        self._unplan(stage['id'])
+        now = datetime.now(tz)
+        planned = 0
         
-        except Exception as e:
-            logger.error(f"Error checking deadlines: {e}")
+        for kind in STAGE_NOTIFICATIONS:
+            when = fire_time(stage, kind)
+            if when is None or when <= now:
+                continue
+            self.scheduler.add_job(
+                self.fire,
+                DateTrigger(run_date=when),
+                args=[stage['id'], kind],
+                id=self._job_id(stage['id'], kind),
+                replace_existing=True,
+                misfire_grace_time=MISFIRE_GRACE_TIME
+            )
+            planned += 1
+        
+        return planned
+    
+    async def plan_stage(self, stage_id: int):
+        """Re-plan one stage (called by the database when a stage changes)"""
+        stage = await self.db.get_stage(stage_id)
+        if not stage:
+            self._unplan(stage_id)
+            return
+        
+        planned = self._plan(stage)
+        logger.info(f"Planned {planned} notifications for stage {stage_id}")
     
-    async def send_daily_reminders(self):
-        """Send daily reminders about upcoming tasks"""
+    async def plan_all(self):
+        """Plan the notifications of every stage of the active hackathons"""
         try:
-            now = datetime.now(tz)
-            today = now.date()
-            
-            hackathons = await self.db.get_active_hackathons()
-            
-            for hackathon in hackathons:
-                stages = await self.db.get_hackathon_stages(hackathon['id'])
+            async with metrics.track('plan_notifications'):
+                planned = 0
+                hackathons = await self.db.get_active_hackathons()
                 
-                for stage in stages:
-                    start_date = datetime.fromisoformat(stage['start_date']).date() if stage.get('start_date') else None
-                    if not start_date:
-                        continue
-                    
-                    days_until_start = (start_date - today).days
-                    
-                    # 3 days before first task
-                    if days_until_start == 3:
-                        await self.send_hackathon_notification(
-                            hackathon['id'],
-                            f"⏳ 3 days left until the first task!\n\n"
-                            f"Your first task is coming up soon, so now is a good time to settle on your project idea.\n\n"
-                            f"If you don't yet have a clear direction, you may consider exploring agriculture 🌱 — "
-                            f"our partners have a special interest in this area.\n\n"
-                            f"If you already have your idea, just keep going.\n\n"
-                            f"🏆 At {hackathon['name']}, the strongest project wins — regardless of the track.\n\n"
-                            f"Questions? Contact support at ai500@itcommunity.uz 📧"
-                        )
-                    
-                    # 2 days before
-                    elif days_until_start == 2:
-                        await self.send_hackathon_notification(
-                            hackathon['id'],
-                            f"🕐 In just two days you will receive your first task!\n\n"
-                            f"To help you prepare, we've put together an FAQ with all the key information about the hackathon.\n\n"
-                            f"📋 Check the FAQ if you have any questions.\n\n"
-                            f"If you still have questions, feel free to contact us at ai500@itcommunity.uz 📧"
-                        )
+                for hackathon in hackathons:
+                    for stage in await self.db.get_hackathon_stages(hackathon['id']):
+                        planned += self._plan(stage)
+                
+                logger.info(f"Planned {planned} stage notifications")
         
         except Exception as e:
-            logger.error(f"Error sending daily reminders: {e}")
+            logger.error(f"Error planning stage notifications: {e}")
+    
+    # ============== FIRING ==============
     
-    async def notify_new_stages(self):
-        """Notify participants about new active stages"""
+    async def fire(self, stage_id: int, kind: str):
+        """Send a planned notification if it still applies to the stage"""
         try:
-            now = datetime.now(tz)
-            today = now.date()
-            
-            hackathons = await self.db.get_active_hackathons()
-            
-            for hackathon in hackathons:
-                stages = await self.db.get_hackathon_stages(hackathon['id'])
+            async with metrics.track('send_notification', kind):
+                stage = await self.db.get_stage(stage_id)
+                if not stage:
+                    return
                 
-                for stage in stages:
-                    if not stage.get('is_active'):
-                        continue
-                    
-                    start_date = datetime.fromisoformat(stage['start_date']).date() if stage.get('start_date') else None
-                    
-                    # If stage starts today, send notification
-                    if start_date == today:
-                        await self.send_hackathon_notification(
-                            hackathon['id'],
-                            f"🎉 {hackathon['name']} — Stage {stage['number']}\n"
-                            f"📅 {stage['start_date']} — {stage['end_date']}\n\n"
-                            f"🎊 Congratulations on making it to Stage {stage['number']}!\n\n"
-                            f"Your task: {stage.get('task_description', 'Check the bot for details')}\n\n"
-                            f"❗ Deadline: {stage['end_date']} 23:59 (GMT +5)\n"
-                            f"❗ Submission: Send the link to your live demo website in this bot\n\n"
-                            f"💡 Tip: Make your content clear and complete, don't miss any section, "
-                            f"and highlight AI tools or technologies you plan to use."
-                        )
+                hackathon = await self.db.get_hackathon(stage['hackathon_id'])
+                if not hackathon or not hackathon.get('is_active'):
+                    return
+                if kind in ACTIVE_STAGE_ONLY and not stage.get('is_active'):
+                    return
+                
+                # Stage dates may have moved since this job was planned
+                when = fire_time(stage, kind)
+                if when is None or when.date() != datetime.now(tz).date():
+                    return
+                
+                if kind == 'reminder_3d':
+                    await self.send_hackathon_notification(
+                        hackathon['id'],
+                        f"⏳ 3 days left until the first task!\n\n"
+                        f"Your first task is coming up soon, so now is a good time to settle on your project idea.\n\n"
+                        f"If you don't yet have a clear direction, you may consider exploring agriculture 🌱 — "
+                        f"our partners have a special interest in this area.\n\n"
+                        f"If you already have your idea, just keep going.\n\n"
+                        f"🏆 At {hackathon['name']}, the strongest project wins — regardless of the track.\n\n"
+                        f"Questions? Contact support at ai500@itcommunity.uz 📧"
+                    )
+                
+                elif kind == 'reminder_2d':
+                    await self.send_hackathon_notification(
+                        hackathon['id'],
+                        f"🕐 In just two days you will receive your first task!\n\n"
+                        f"To help you prepare, we've put together an FAQ with all the key information about the hackathon.\n\n"
+                        f"📋 Check the FAQ if you have any questions.\n\n"
+                        f"If you still have questions, feel free to contact us at ai500@itcommunity.uz 📧"
+                    )
+                
+                elif kind == 'stage_started':
+                    await self.send_hackathon_notification(
+                        hackathon['id'],
+                        f"🎉 {hackathon['name']} — Stage {stage['number']}\n"
+                        f"📅 {stage['start_date']} — {stage['end_date']}\n\n"
+                        f"🎊 Congratulations on making it to Stage {stage['number']}!\n\n"
+                        f"Your task: {stage.get('task_description', 'Check the bot for details')}\n\n"
+                        f"❗ Deadline: {stage['end_date']} 23:59 (GMT +5)\n"
+                        f"❗ Submission: Send the link to your live demo website in this bot\n\n"
+                        f"💡 Tip: Make your content clear and complete, don't miss any section, "
+                        f"and highlight AI tools or technologies you plan to use."
+                    )
+                
+                elif kind == 'deadline_today':
+                    await self.send_deadline_notification(
+                        hackathon['id'],
+                        f"⏳ Deadline approaching!\n\n"
+                        f"Today until 23:59 — the final chance to submit your Stage {stage['number']} answers.\n"
+                        f"The Selection Team will review submissions tomorrow.\n\n"
+                        f"Good luck! ✨",
+                        stage_id=stage['id']
+                    )
+                
+                elif kind == 'deadline_last_hours':
+                    await self.send_deadline_notification(
+                        hackathon['id'],
+                        f"⚠️ LAST 3 HOURS!\n\n"
+                        f"Stage {stage['number']} deadline is at 23:59 tonight.\n"
+                        f"Don't forget to submit your work!",
+                        stage_id=stage['id']
+                    )
         
         except Exception as e:
-            logger.error(f"Error notifying new stages: {e}")
+            logger.error(f"Error sending {kind} notification for stage {stage_id}: {e}")
     
     async def send_hackathon_notification(self, hackathon_id: int, message: str):
         """Send notification to all participants of a hackathon"""
         try:
             participants = await self.db.get_hackathon_participants(hackathon_id)
             
-            sent = 0
-            failed = 0
-            
-            for participant in participants:
-                try:
-                    await self.bot.send_message(
-                        chat_id=participant['user_id'],
-                        text=message
-                    )
-                    sent += 1
-                except Exception as e:
-                    logger.warning(f"Failed to send to {participant['user_id']}: {e}")
-                    failed += 1
-                
-                # Rate limiting
-                await asyncio.sleep(0.05)
+            result = await get_broadcaster(self.bot).send(
+                [participant['user_id'] for participant in participants], message
+            )
             
-            logger.info(f"Notification sent to hackathon {hackathon_id}: {sent} sent, {failed} failed")
+            logger.info(f"Notification sent to hackathon {hackathon_id}: {result.sent} sent, {result.failed} failed")
         
         except Exception as e:
             logger.error(f"Error sending hackathon notification: {e}")
     
-    async def send_deadline_notification(self, hackathon_id: int, message: str):
-        """Send deadline notification to participants without submissions"""
+    async def send_deadline_notification(self, hackathon_id: int, message: str,
+                                         stage_id: Optional[int] = None):
+        """Send deadline notification to participants without submissions
+        
+        Reminds about stage_id, or the hackathon's first active stage if not given.
+        """
         try:
-            participants = await self.db.get_hackathon_participants(hackathon_id)
-            hackathon = await self.db.get_hackathon(hackathon_id)
-            stages = await self.db.get_hackathon_stages(hackathon_id)
-            
-            # Find active stage
-            active_stage = None
-            for stage in stages:
-                if stage.get('is_active'):
-                    active_stage = stage
-                    break
-            
-            if not active_stage:
-                return
-            
-            sent = 0
-            for participant in participants:
-                # Check if they have submitted
-                submission = await self.db.get_submission(participant['user_id'], active_stage['id'])
+            if stage_id is None:
+                stages = await self.db.get_hackathon_stages(hackathon_id)
                 
-                if not submission:
-                    try:
-                        await self.bot.send_message(
-                            chat_id=participant['user_id'],
-                            text=message
-                        )
-                        sent += 1
-                    except Exception as e:
-                        logger.warning(f"Failed to send to {participant['user_id']}: {e}")
+                # Find active stage
+                active_stage = None
+                for stage in stages:
+                    if stage.get('is_active'):
+                        active_stage = stage
+                        break
                 
-                await asyncio.sleep(0.05)
+                if not active_stage:
+                    return
+                stage_id = active_stage['id']
+            
+            # Only participants who have not submitted yet
+            participants = await self.db.get_participants_without_submission(
+                hackathon_id, stage_id
+            )
+            
+            result = await get_broadcaster(self.bot).send(
+                [participant['user_id'] for participant in participants], message
+            )
             
-            logger.info(f"Deadline notification sent: {sent} participants")
+            logger.info(f"Deadline notification sent: {result.sent} participants")
         
         except Exception as e:
             logger.error(f"Error sending deadline notification: {e}")
     
     async def send_stage_results(self, hackathon_id: int, stage_number: int, 
-                                  advanced_teams: list, message: str = None):
-        """Send stage results and advancement notifications"""
+                                  advanced_teams: Iterable[int], message: str = None,
+                                  progress: Optional[ProgressCallback] = None) -> Optional[BroadcastResult]:
+        """Send stage results and advancement notifications
+        
+        One query returns every participant's team and language; with the
+        advanced teams in a set, participants are split into the advanced
+        and not-advanced cohorts in a single pass, each cohort's text is
+        rendered once per language, and the broadcaster sends them all
+        concurrently. The outcome for every team is stored in stage_results.
+        Returns the delivery counters, None if sending failed.
+        """
         try:
             hackathon = await self.db.get_hackathon(hackathon_id)
-            participants = await self.db.get_hackathon_participants(hackathon_id)
+            advanced = set(advanced_teams)
             
-            for participant in participants:
-                # Check if participant's team advanced
-                registration = await self.db.get_user_hackathon_registration(
-                    participant['user_id'], hackathon_id
-                )
-                
-                if registration and registration.get('team_id') in advanced_teams:
-                    text = f"🎉 Congratulations!\n\n" \
-                           f"Your team has advanced to Stage {stage_number + 1} of {hackathon['name']}!\n\n" \
-                           f"Stay tuned for the next task. ✨"
-                else:
-                    text = f"Thank you for participating in {hackathon['name']}!\n\n" \
-                           f"Unfortunately, your team didn't advance to the next stage this time.\n\n" \
-                           f"Keep building and improving — we hope to see you in future hackathons! 💪"
-                
-                try:
-                    await self.bot.send_message(chat_id=participant['user_id'], text=text)
-                except Exception as e:
-                    logger.warning(f"Failed to send results to {participant['user_id']}: {e}")
-                
-                await asyncio.sleep(0.05)
+            stage = next((stage for stage in await self.db.get_hackathon_stages(hackathon_id)
+                          if stage['number'] == stage_number), None)
+            if stage:
+                await self.db.record_stage_results(stage['id'], hackathon_id, advanced)
+            else:
+                logger.warning(f"Hackathon {hackathon_id} has no stage {stage_number}; results not recorded")
+            
+            cohorts = {'stage_advanced': [], 'stage_not_advanced': []}
+            for recipient in await self.db.get_hackathon_recipients(hackathon_id):
+                key = 'stage_advanced' if recipient['team_id'] in advanced else 'stage_not_advanced'
+                cohorts[key].append(recipient)
+            
+            messages = []
+            for key, recipients in cohorts.items():
+                texts = {}
+                for recipient in recipients:
+                    lang = recipient['language'] or 'en'
+                    if lang not in texts:
+                        text = get_text(key, lang, hackathon=hackathon['name'], stage=stage_number + 1)
+                        texts[lang] = f"{text}\n\n{message}" if message else text
+                    messages.append((recipient['user_id'], texts[lang]))
+            
+            result = await get_broadcaster(self.bot).broadcast(messages, progress, progress_interval=1.0)
+            logger.info(f"Stage results sent for hackathon {hackathon_id} "
+                        f"({len(cohorts['stage_advanced'])} advanced, "
+                        f"{len(cohorts['stage_not_advanced'])} not): "
+                        f"{result.sent} sent, {result.failed} failed")
+            return result
         
         except Exception as e:
             logger.error(f"Error sending stage results: {e}")
+            return None
@@ -0,0 +1,360 @@
+"""
+Named PostgreSQL statements for ITCom Hackathons Bot
+Every static query of the asyncpg backend, prepared once per pooled connection
+"""
+
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+
+# Submission export rows; {p} is the hackathon id placeholder
+EXPORT_SUBMISSIONS_SQL = '''
+    SELECT s.id AS submission_id, st.number AS stage_number, st.name AS stage_name,
+           t.name AS team_name, t.code AS team_code,
+           u.user_id, u.username, u.first_name, u.last_name, u.phone,
+           s.submission_type, s.link, s.file_name, s.file_digest, s.file_size,
+           s.notes, s.score, s.submitted_at
+    FROM submissions s
+    JOIN stages st ON st.id = s.stage_id
+    LEFT JOIN teams t ON t.id = s.team_id
+    LEFT JOIN users u ON u.user_id = s.user_id
+    WHERE st.hackathon_id = {p}
+    ORDER BY st.number, s.id
+'''
+
+
+# Hackathon + registration + team + roster, one row per team member.
+# {p1} is the hackathon id, {p2} the user id.
+MY_HACKATHON_VIEW_SQL = '''
+    SELECT h.id AS h_id, h.name AS h_name, h.description AS h_description,
+           h.start_date AS h_start_date, h.end_date AS h_end_date,
+           h.prize_pool AS h_prize_pool, h.is_active AS h_is_active,
+           r.id AS r_id, r.team_id AS r_team_id, r.registered_at AS r_registered_at,
+           t.id AS t_id, t.name AS t_name, t.code AS t_code, t.leader_id AS t_leader_id,
+           tm.user_id AS m_user_id, tm.role AS m_role,
+           u.user_id AS u_user_id, u.username AS u_username, u.first_name AS u_first_name, u.last_name AS u_last_name
+    FROM hackathons h
+    LEFT JOIN registrations r ON r.hackathon_id = h.id AND r.user_id = {p2}
+    LEFT JOIN teams t ON t.id = r.team_id
+    LEFT JOIN team_members tm ON tm.team_id = t.id
+    LEFT JOIN users u ON u.user_id = tm.user_id
+    WHERE h.id = {p1}
+    ORDER BY tm.id
+'''
+
+
+STATEMENTS: Dict[str, str] = {
+    # Catalog
+    'catalog_hackathons': 'SELECT * FROM hackathons',
+    'catalog_stages': 'SELECT * FROM stages',
+
+    # Cross-replica notifications (catalog and score changes); pg_notify is
+    # NOTIFY with the channel as a parameter, so one statement serves both
+    'notify': 'SELECT pg_notify($1, $2)',
+
+    # Users
+    'get_user': 'SELECT * FROM users WHERE user_id = $1',
+    'create_user': '''
+        INSERT INTO users (user_id, username, first_name, last_name, birth_date, phone, pinfl)
+        VALUES ($1, $2, $3, $4, $5, $6, $7)
+        ON CONFLICT (user_id) DO UPDATE SET
+            username = $2, first_name = $3, last_name = $4,
+            birth_date = $5, phone = $6, pinfl = $7, updated_at = CURRENT_TIMESTAMP
+    ''',
+    'update_user_language': 'UPDATE users SET language = $1, updated_at = CURRENT_TIMESTAMP WHERE user_id = $2',
+    'get_all_users': 'SELECT * FROM users',
+    'count_users': 'SELECT COUNT(*) FROM users',
+
+    # Hackathons
+    'create_hackathon': '''
+        INSERT INTO hackathons (name, description, start_date, end_date, prize_pool, image_url)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        RETURNING *
+    ''',
+
+    # Teams
+    'get_team': 'SELECT * FROM teams WHERE id = $1',
+    'get_team_by_code': 'SELECT * FROM teams WHERE code = $1',
+    'create_team': '''
+        INSERT INTO teams (hackathon_id, name, code, leader_id)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (code) DO NOTHING
+        RETURNING *
+    ''',
+    'add_team_leader': '''
+        INSERT INTO team_members (team_id, user_id, role)
+        VALUES ($1, $2, $3)
+    ''',
+    'add_team_member': '''
+        INSERT INTO team_members (team_id, user_id, role)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (team_id, user_id) DO NOTHING
+    ''',
+    'remove_team_member': 'DELETE FROM team_members WHERE team_id = $1 AND user_id = $2',
+    'get_team_members': 'SELECT * FROM team_members WHERE team_id = $1',
+    'get_team_roster': '''
+        SELECT tm.*, u.username, u.first_name, u.last_name, u.language
+        FROM team_members tm
+        JOIN users u ON u.user_id = tm.user_id
+        WHERE tm.team_id = $1
+        ORDER BY tm.id
+    ''',
+    'count_teams': 'SELECT COUNT(*) FROM teams WHERE hackathon_id = $1',
+    'count_all_teams': 'SELECT COUNT(*) FROM teams',
+
+    # Registrations
+    'register_user_for_hackathon': '''
+        INSERT INTO registrations (user_id, hackathon_id, team_id)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (user_id, hackathon_id) DO UPDATE SET team_id = $3
+    ''',
+    'get_user_hackathon_registration': 'SELECT * FROM registrations WHERE user_id = $1 AND hackathon_id = $2',
+    'get_user_registrations': 'SELECT * FROM registrations WHERE user_id = $1',
+    'get_user_registrations_detailed': '''
+        SELECT r.*, h.name AS hackathon_name, h.start_date, h.end_date,
+               t.name AS team_name
+        FROM registrations r
+        JOIN hackathons h ON h.id = r.hackathon_id
+        LEFT JOIN teams t ON t.id = r.team_id
+        WHERE r.user_id = $1
+        ORDER BY h.start_date
+    ''',
+    'get_hackathon_participants': '''
+        SELECT u.* FROM users u
+        JOIN registrations r ON u.user_id = r.user_id
+        WHERE r.hackathon_id = $1
+    ''',
+    'get_participants_without_submission': '''
+        SELECT u.* FROM users u
+        JOIN registrations r ON u.user_id = r.user_id
+        WHERE r.hackathon_id = $1
+          AND NOT EXISTS (
+              SELECT 1 FROM submissions s
+              WHERE s.user_id = u.user_id AND s.stage_id = $2
+          )
+    ''',
+    'get_hackathon_recipients': '''
+        SELECT r.user_id, r.team_id, u.language FROM registrations r
+        JOIN users u ON u.user_id = r.user_id
+        WHERE r.hackathon_id = $1
+    ''',
+
+    # Stages
+    'create_stage': '''
+        INSERT INTO stages (hackathon_id, number, name, task_description, start_date, end_date)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        RETURNING *
+    ''',
+    'update_stage_active': 'UPDATE stages SET is_active = $1 WHERE id = $2',
+
+    # Submissions
+    'get_submission': 'SELECT * FROM submissions WHERE user_id = $1 AND stage_id = $2',
+    'lock_submission_score': '''
+        SELECT id, team_id, score FROM submissions WHERE user_id = $1 AND stage_id = $2 FOR UPDATE
+    ''',
+    # A resubmission keeps its id; new content clears the old score
+    'create_submission': '''
+        INSERT INTO submissions (user_id, stage_id, team_id, link, notes, submission_type, file_name,
+                                 file_id, file_status)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+        ON CONFLICT (user_id, stage_id) DO UPDATE SET
+            team_id = $3, link = $4, notes = $5, submission_type = $6, file_name = $7,
+            file_id = $8, file_status = $9, file_digest = NULL, file_size = NULL,
+            score = NULL, submitted_at = CURRENT_TIMESTAMP
+        RETURNING *
+    ''',
+    'set_submission_file': '''
+        UPDATE submissions SET file_status = $4, file_digest = $5, file_size = $6
+        WHERE user_id = $1 AND stage_id = $2 AND file_id = $3
+    ''',
+    'get_pending_submission_files': '''
+        SELECT user_id, stage_id, file_id, file_name FROM submissions
+        WHERE file_status = 'pending' ORDER BY id
+    ''',
+    'remove_registration': 'DELETE FROM registrations WHERE user_id = $1 AND hackathon_id = $2',
+    'get_stage_submissions': 'SELECT * FROM submissions WHERE stage_id = $1',
+
+    # Leaderboard: team_scores holds each team's best score per stage
+    'set_submission_score': 'UPDATE submissions SET score = $1 WHERE id = $2 RETURNING stage_id, team_id',
+    # Serializes score updates of one team and stage, whether or not its team_scores row exists yet
+    'lock_team_stage_score': 'SELECT pg_advisory_xact_lock($1, $2)',
+    'get_team_stage_score': 'SELECT score FROM team_scores WHERE stage_id = $1 AND team_id = $2',
+    'best_team_stage_score': 'SELECT MAX(score) FROM submissions WHERE stage_id = $1 AND team_id = $2',
+    'save_team_stage_score': '''
+        INSERT INTO team_scores (stage_id, team_id, hackathon_id, score)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (stage_id, team_id) DO UPDATE SET
+            score = EXCLUDED.score, updated_at = CURRENT_TIMESTAMP
+    ''',
+    'delete_team_stage_score': 'DELETE FROM team_scores WHERE stage_id = $1 AND team_id = $2',
+    'get_stage_team_scores': 'SELECT team_id, score FROM team_scores WHERE stage_id = $1',
+    'get_hackathon_team_scores': '''
+        SELECT team_id, SUM(score) AS score FROM team_scores
+        WHERE hackathon_id = $1 GROUP BY team_id
+    ''',
+    'get_team_names': 'SELECT id, name FROM teams WHERE id = ANY($1::INT[])',
+
+    # Stage results: every team of the hackathon, advanced or not
+    'record_stage_results': '''
+        INSERT INTO stage_results (stage_id, team_id, advanced)
+        SELECT $1, t.id, t.id = ANY($3::INT[]) FROM teams t WHERE t.hackathon_id = $2
+        ON CONFLICT (stage_id, team_id) DO UPDATE SET
+            advanced = EXCLUDED.advanced, decided_at = CURRENT_TIMESTAMP
+    ''',
+
+    # Background jobs
+    'create_job': '''
+        INSERT INTO jobs (kind, title, created_by, chat_id)
+        VALUES ($1, $2, $3, $4)
+        RETURNING id
+    ''',
+    'set_job_message': 'UPDATE jobs SET message_id = $2, updated_at = CURRENT_TIMESTAMP WHERE id = $1',
+    'start_job': "UPDATE jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP WHERE id = $1",
+    'update_job_progress': '''
+        UPDATE jobs SET processed = $2, total = $3, updated_at = CURRENT_TIMESTAMP WHERE id = $1
+    ''',
+    'finish_job': '''
+        UPDATE jobs SET status = $2, processed = $3, total = $4, result = $5,
+                        updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+        WHERE id = $1
+    ''',
+    'get_job': 'SELECT * FROM jobs WHERE id = $1',
+    'get_recent_jobs': 'SELECT * FROM jobs ORDER BY id DESC LIMIT $1',
+    'interrupt_unfinished_jobs': '''
+        UPDATE jobs SET status = 'interrupted', updated_at = CURRENT_TIMESTAMP,
+                        finished_at = CURRENT_TIMESTAMP
+        WHERE status IN ('queued', 'running')
+        RETURNING *
+    ''',
+
+    # Conversation persistence
+    'load_conversation_states': 'SELECT name, conv_key, state FROM conversation_states',
+    'load_user_data': 'SELECT user_id, data FROM user_data',
+    'save_conversation_states': '''
+        INSERT INTO conversation_states (name, conv_key, state)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (name, conv_key) DO UPDATE SET
+            state = EXCLUDED.state, updated_at = CURRENT_TIMESTAMP
+    ''',
+    'delete_conversation_states': 'DELETE FROM conversation_states WHERE name = $1 AND conv_key = $2',
+    'save_user_data': '''
+        INSERT INTO user_data (user_id, data)
+        VALUES ($1, $2)
+        ON CONFLICT (user_id) DO UPDATE SET
+            data = EXCLUDED.data, updated_at = CURRENT_TIMESTAMP
+    ''',
+    'delete_user_data': 'DELETE FROM user_data WHERE user_id = ANY($1::BIGINT[])',
+
+    # Views
+    'get_my_hackathon_view': MY_HACKATHON_VIEW_SQL.format(p1='$1', p2='$2'),
+    'export_submissions': EXPORT_SUBMISSIONS_SQL.format(p='$1'),
+}
+
+# update_user_field: one statement per editable column
+USER_FIELDS = ['first_name', 'last_name', 'birth_date', 'gender', 'location']
+for _field in USER_FIELDS:
+    STATEMENTS[f'update_user_{_field}'] = (
+        f'UPDATE users SET {_field} = $1, updated_at = CURRENT_TIMESTAMP WHERE user_id = $2'
+    )
+
+# update_hackathon: one statement per editable column
+HACKATHON_FIELDS = ['name', 'description', 'start_date', 'end_date', 'prize_pool', 'image_url', 'is_active']
+for _field in HACKATHON_FIELDS:
+    STATEMENTS[f'update_hackathon_{_field}'] = f'UPDATE hackathons SET {_field} = $1 WHERE id = $2'
+
+
+class PreparedConnection(asyncpg.Connection):
+    """Pool connection that loads statements into its statement cache up front
+
+    asyncpg has no public way to put a statement into the cache that
+    conn.fetch(sql) and friends look up: Connection.prepare() returns an
+    uncached PreparedStatement, and those can't be shared through the pool
+    (they are bound to the raw connection, while handlers get a pool
+    proxy). preload therefore calls Connection._get_statement, the private
+    method fetch() itself uses, which is why requirements.txt pins asyncpg
+    to 0.29. If a later asyncpg drops or changes it, preloading is skipped
+    with a warning and statements are prepared on first use instead.
+    """
+
+    async def preload(self, sql: str) -> bool:
+        """Prepare the same named, cached statement conn.fetch(sql) would
+        create on first use, without executing it; False if unsupported"""
+        try:
+            await self._get_statement(sql, None)
+        except (AttributeError, TypeError) as e:
+            logger.warning(f"Statement preloading unavailable with asyncpg {asyncpg.__version__}: {e}")
+            return False
+        return True
+
+
+class StatementRegistry:
+    """Runs registered statements by name and counts their executions.
+
+    Every statement is prepared on each new connection by the pool's
+    ``init`` hook (prepare_all) and kept in asyncpg's per-connection
+    statement cache, so calls only bind parameters and execute: no parse
+    and no plan, even on connections the pool has just opened.
+    """
+
+    def __init__(self, statements: Dict[str, str] = STATEMENTS):
+        self.statements = statements
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.seconds: Dict[str, float] = defaultdict(float)
+
+    @property
+    def cache_size(self) -> int:
+        """Statement cache size that holds every registered statement with room to spare"""
+        return max(100, 2 * len(self.statements))
+
+    async def prepare_all(self, conn: PreparedConnection) -> None:
+        for sql in self.statements.values():
+            if not await conn.preload(sql):
+                return
+
+    async def _run(self, conn, name: str, method: str, *args) -> Any:
+        started = time.perf_counter()
+        try:
+            return await getattr(conn, method)(self.statements[name], *args)
+        finally:
+            self.calls[name] += 1
+            self.seconds[name] += time.perf_counter() - started
+
+    async def fetch(self, conn, name: str, *args) -> List[asyncpg.Record]:
+        return await self._run(conn, name, 'fetch', *args)
+
+    async def fetchrow(self, conn, name: str, *args) -> Optional[asyncpg.Record]:
+        return await self._run(conn, name, 'fetchrow', *args)
+
+    async def fetchval(self, conn, name: str, *args) -> Any:
+        return await self._run(conn, name, 'fetchval', *args)
+
+    async def execute(self, conn, name: str, *args) -> str:
+        return await self._run(conn, name, 'execute', *args)
+
+    async def executemany(self, conn, name: str, args: List[tuple]) -> None:
+        await self._run(conn, name, 'executemany', args)
+
+    def cursor(self, conn, name: str, *args, prefetch: Optional[int] = None):
+        """Server-side cursor over a statement (must run inside a transaction)"""
+        self.calls[name] += 1
+        return conn.cursor(self.statements[name], *args, prefetch=prefetch)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-statement execution counters, most executed first"""
+        rows = [
+            {
+                'name': name,
+                'calls': calls,
+                'total_ms': self.seconds[name] * 1000,
+                'avg_ms': self.seconds[name] * 1000 / calls,
+            }
+            for name, calls in self.calls.items() if calls
+        ]
+        rows.sort(key=lambda row: row['calls'], reverse=True)
+        return rows
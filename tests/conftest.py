@@ -0,0 +1,67 @@
+"""
+Shared fixtures for the ITCom Hackathons Bot tests
+Tests run against a fresh SQLite file, or against PostgreSQL when
+TEST_DATABASE_URL points at a scratch database (its public schema is
+dropped before every test)
+"""
+
+import asyncio
+import os
+import sys
+from datetime import date
+
+import pytest
+
+# The database backend is chosen at import time
+os.environ['DATABASE_URL'] = os.getenv('TEST_DATABASE_URL', '')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncpg  # noqa: E402
+
+import database  # noqa: E402
+
+
+def day(value: str):
+    """A date argument in the form the backend expects"""
+    return date.fromisoformat(value) if database.USE_POSTGRES else value
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine to completion on a fresh event loop"""
+    return asyncio.run
+
+
+@pytest.fixture
+def connect(tmp_path):
+    """Connect a Database to an empty database; the caller closes it"""
+    async def connect() -> database.Database:
+        if database.USE_POSTGRES:
+            conn = await asyncpg.connect(database.DATABASE_URL)
+            try:
+                await conn.execute('DROP SCHEMA public CASCADE; CREATE SCHEMA public')
+            finally:
+                await conn.close()
+        db = database.Database()
+        db.sqlite_path = str(tmp_path / 'bot.db')
+        await db.connect()
+        return db
+    return connect
+
+
+async def create_team(db: database.Database, members: int = 2):
+    """A hackathon with an active first stage and one team of `members` users;
+    returns (hackathon, stage, team, user ids)"""
+    user_ids = list(range(1, members + 1))
+    for user_id in user_ids:
+        await db.create_user(user_id, f'user{user_id}', 'Test', 'User', day('2000-01-01'),
+                             '+998900000000', f'{user_id:014d}')
+    hackathon = await db.create_hackathon('Hackathon', 'Test', day('2026-01-01'), day('2026-02-01'))
+    team = await db.create_team(hackathon['id'], 'Team', user_ids[0])
+    await db.register_user_for_hackathon(user_ids[0], hackathon['id'], team['id'])
+    for user_id in user_ids[1:]:
+        await db.add_team_member(team['id'], user_id)
+        await db.register_user_for_hackathon(user_id, hackathon['id'], team['id'])
+    stage = await db.create_stage(hackathon['id'], 1, 'Stage 1', 'Task', day('2026-01-01'), day('2026-01-10'))
+    await db.update_stage_active(stage['id'], True)
+    return hackathon, stage, team, user_ids
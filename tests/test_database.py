@@ -0,0 +1,113 @@
+"""
+Tests for the data layer (database.py)
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+import database
+from conftest import create_team, day
+
+
+def test_concurrent_scores_keep_the_team_best(run, connect):
+    async def scenario():
+        db = await connect()
+        try:
+            _, stage, team, user_ids = await create_team(db)
+            first, second = [(await db.create_submission(user_id, stage['id'], 'https://example.com'))['id']
+                             for user_id in user_ids]
+            for attempt in range(20):
+                await db.set_submission_score(first, None)
+                await db.set_submission_score(second, None)
+                high, low = (first, second) if attempt % 2 else (second, first)
+                await asyncio.gather(db.set_submission_score(high, 90), db.set_submission_score(low, 50))
+                assert await db.get_stage_team_scores(stage['id']) == [{'team_id': team['id'], 'score': 90}]
+        finally:
+            await db.close()
+    run(scenario())
+
+
+def test_user_cache_drops_a_read_made_stale_by_a_write(run, connect, monkeypatch):
+    async def scenario():
+        db = await connect()
+        try:
+            await create_team(db, members=1)
+            await db.update_user_language(1, 'uz')
+            db.user_cache.clear()
+
+            # Hold the cache miss between its read and its put
+            read_done, resume = asyncio.Event(), asyncio.Event()
+            if database.USE_POSTGRES:
+                fetchrow = db.statements.fetchrow
+
+                async def paused_fetchrow(*args, **kwargs):
+                    row = await fetchrow(*args, **kwargs)
+                    read_done.set()
+                    await resume.wait()
+                    return row
+
+                monkeypatch.setattr(db.statements, 'fetchrow', paused_fetchrow)
+            else:
+                read = db.sqlite.read
+
+                @asynccontextmanager
+                async def paused_read(*args, **kwargs):
+                    async with read(*args, **kwargs) as conn:
+                        yield conn
+                    read_done.set()
+                    await resume.wait()
+
+                monkeypatch.setattr(db.sqlite, 'read', paused_read)
+            miss = asyncio.create_task(db.get_user(1))
+            await read_done.wait()
+            monkeypatch.undo()
+
+            await db.update_user_language(1, 'en')
+            resume.set()
+            assert (await miss)['language'] == 'uz'
+            assert (await db.get_user(1))['language'] == 'en'
+        finally:
+            await db.close()
+    run(scenario())
+
+
+async def eventually(condition, timeout: float = 5) -> bool:
+    for _ in range(int(timeout / 0.05)):
+        if condition():
+            return True
+        await asyncio.sleep(0.05)
+    return condition()
+
+
+@pytest.mark.skipif(not database.USE_POSTGRES, reason='LISTEN/NOTIFY needs PostgreSQL')
+def test_listener_reconnects_and_invalidates(run, connect, monkeypatch):
+    monkeypatch.setattr(database, 'LISTENER_RETRY_MIN', 0.05)
+
+    async def scenario():
+        db = await connect()
+        replica = database.Database()
+        await replica.connect()
+        try:
+            changes = []
+
+            async def on_score(change):
+                changes.append(change)
+
+            db.add_score_listener(on_score)
+            pid = db._listener.get_server_pid()
+            async with replica.pool.acquire() as conn:
+                await conn.execute('SELECT pg_terminate_backend($1)', pid)
+            assert await eventually(lambda: db._listener is not None and db._listener.get_server_pid() != pid)
+            assert await eventually(lambda: changes and changes[-1]['stage_id'] is None)
+
+            # Changes on the other replica reach this one again
+            await db._get_catalog()
+            assert db.catalog is not None
+            await replica.create_hackathon('Other', 'Test', day('2026-03-01'), day('2026-04-01'))
+            assert await eventually(lambda: db.catalog is None)
+        finally:
+            await replica.close()
+            await db.close()
+    run(scenario())
@@ -0,0 +1,30 @@
+"""
+Tests for the schema migrations (migrations.py)
+"""
+
+import aiosqlite
+import pytest
+
+import migrations
+
+
+def test_sqlite_migration_is_applied_whole_or_not_at_all(run, tmp_path, monkeypatch):
+    broken = (migrations.LATEST_VERSION + 1, 'Broken', [], [
+        'CREATE TABLE half_applied (id INTEGER PRIMARY KEY)',
+        'CREATE TABLE half_applied (id INTEGER PRIMARY KEY)',
+    ])
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [broken])
+
+    async def scenario():
+        async with aiosqlite.connect(str(tmp_path / 'bot.db')) as db:
+            with pytest.raises(Exception):
+                await migrations.migrate_sqlite(db)
+            async with db.execute("SELECT name FROM sqlite_master WHERE name = 'half_applied'") as cursor:
+                assert await cursor.fetchone() is None
+            async with db.execute('SELECT MAX(version) FROM schema_version') as cursor:
+                assert (await cursor.fetchone())[0] == migrations.LATEST_VERSION
+
+            # Once fixed, the version applies cleanly on the next start
+            broken[3].pop()
+            assert await migrations.migrate_sqlite(db) == broken[0]
+    run(scenario())
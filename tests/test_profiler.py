@@ -0,0 +1,46 @@
+"""
+Tests for the query profiler (profiler.py)
+"""
+
+import asyncio
+from contextlib import AsyncExitStack
+
+import database
+from conftest import create_team
+
+
+def test_streamed_query_is_charged_its_connection_wait(run, connect, monkeypatch):
+    monkeypatch.setattr(database, 'DB_PROFILE', True)
+
+    async def scenario():
+        db = await connect()
+        try:
+            hackathon, stage, _, _ = await create_team(db, members=1)
+            await db.create_submission(1, stage['id'], 'https://example.com')
+
+            async def export():
+                rows = 0
+                async for chunk in db.iter_hackathon_submissions(hackathon['id']):
+                    rows += len(chunk)
+                    await asyncio.sleep(0.3)  # the consumer's time is not the query's
+                return rows
+
+            # Hold every connection so the export has to wait for one
+            if database.USE_POSTGRES:
+                hold, connections = db.pool.acquire, database.DB_POOL_MAX_SIZE
+            else:
+                hold, connections = db.sqlite.read, database.SQLITE_READERS
+            async with AsyncExitStack() as stack:
+                for _ in range(connections):
+                    await stack.enter_async_context(hold())
+                exporting = asyncio.create_task(export())
+                await asyncio.sleep(0.2)
+            assert await exporting == 1
+
+            stats = db.profiler.methods['iter_hackathon_submissions']
+            assert stats.calls == 1 and stats.rows == 1
+            assert stats.wait >= 0.15
+            assert stats.wait <= stats.total < 0.3
+        finally:
+            await db.close()
+    run(scenario())
@@ -3,6 +3,9 @@ Multi-language translations for ITCom Hackathons Bot
 Supports: Uzbek (uz), Russian (ru), English (en)
 """
 
+import string
+from typing import Dict, Optional, Tuple
+
 LANGUAGES = ['uz', 'ru', 'en']
 
 TRANSLATIONS = {
@@ -517,19 +520,88 @@ Send the link to your live demo website or upload a file (PDF, image, video, etc
         'ru': '🔗 Ссылка получена',
         'en': '🔗 Link received'
     },
+    
+    # Stage results
+    'stage_advanced': {
+        'uz': '🎉 Tabriklaymiz!\n\nJamoangiz {hackathon} xakatonining {stage}-bosqichiga o\'tdi!\n\n'
+              'Keyingi topshiriqni kuting. ✨',
+        'ru': '🎉 Поздравляем!\n\nВаша команда прошла в этап {stage} хакатона {hackathon}!\n\n'
+              'Следите за следующим заданием. ✨',
+        'en': '🎉 Congratulations!\n\nYour team has advanced to Stage {stage} of {hackathon}!\n\n'
+              'Stay tuned for the next task. ✨'
+    },
+    'stage_not_advanced': {
+        'uz': '{hackathon} xakatonida ishtirok etganingiz uchun rahmat!\n\n'
+              'Afsuski, bu safar jamoangiz keyingi bosqichga o\'ta olmadi.\n\n'
+              'Rivojlanishda davom eting — sizni keyingi xakatonlarda kutib qolamiz! 💪',
+        'ru': 'Спасибо за участие в хакатоне {hackathon}!\n\n'
+              'К сожалению, в этот раз ваша команда не прошла в следующий этап.\n\n'
+              'Продолжайте развиваться — надеемся увидеть вас на следующих хакатонах! 💪',
+        'en': 'Thank you for participating in {hackathon}!\n\n'
+              'Unfortunately, your team didn\'t advance to the next stage this time.\n\n'
+              'Keep building and improving — we hope to see you in future hackathons! 💪'
+    },
 }
 
 
+_formatter = string.Formatter()
+
+# (literal text, field name, format spec, conversion) as string.Formatter.parse
+# yields them; the field name is None for trailing text
+Segment = Tuple[str, Optional[str], str, Optional[str]]
+
+
+def _parse_template(text: str) -> Optional[Tuple[Segment, ...]]:
+    """Split text into segments once; None if it has no fields or isn't a valid template"""
+    try:
+        segments = tuple(_formatter.parse(text))
+    except ValueError:
+        return None
+    if all(name is None for _, name, _, _ in segments):
+        return None
+    return segments
+
+
+def _render(segments: Tuple[Segment, ...], kwargs: Dict[str, object]) -> str:
+    """Fill pre-parsed segments; raises KeyError for a missing field like str.format"""
+    parts = []
+    for literal, name, spec, conversion in segments:
+        parts.append(literal)
+        if name is not None:
+            value = kwargs[name]
+            if conversion:
+                value = _formatter.convert_field(value, conversion)
+            parts.append(format(value, spec or ''))
+    return ''.join(parts)
+
+
+def _compile(translations: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, Tuple[str, Optional[Tuple[Segment, ...]]]]]:
+    """Flatten TRANSLATIONS into one {key: (text, segments)} table per language,
+    with the English fallback already applied and every template parsed"""
+    catalog = {}
+    for lang in LANGUAGES:
+        table = {}
+        for key, texts in translations.items():
+            text = texts.get(lang, texts.get('en', key))
+            table[key] = (text, _parse_template(text))
+        catalog[lang] = table
+    return catalog
+
+
+_CATALOG = _compile(TRANSLATIONS)
+
+
 def get_text(key: str, lang: str = 'en', **kwargs) -> str:
     """Get translated text by key and language"""
-    if key not in TRANSLATIONS:
+    entry = _CATALOG.get(lang, _CATALOG['en']).get(key)
+    if entry is None:
         return key
     
-    text = TRANSLATIONS[key].get(lang, TRANSLATIONS[key].get('en', key))
+    text, segments = entry
     
-    if kwargs:
+    if kwargs and segments:
         try:
-            text = text.format(**kwargs)
+            text = _render(segments, kwargs)
         except KeyError:
             pass
     
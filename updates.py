@@ -0,0 +1,103 @@
+"""
+Concurrent update processing for ITCom Hackathons Bot
+Updates from different users are handled in parallel; updates from the
+same user run one at a time, in the order they arrived
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def ordering_key(update: object) -> Optional[int]:
+    """The user (or, without one, the chat) whose updates must stay in order"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+
+class _Lane:
+    """The lock serializing one user's updates and how many are using it"""
+
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Run up to max_concurrent_updates updates at once, one per user at a time.
+
+    Conversation states, user_data and the "one question at a time" flow of
+    the bot all assume a user's updates are handled sequentially, so each
+    update first waits for the user's earlier updates (asyncio.Lock wakes
+    waiters in FIFO order, and the Application starts an update's task in
+    arrival order), then for a free slot. Waiting for the user's turn
+    happens before taking a slot, so a user sending a burst of updates
+    while one of them is slow never holds slots other users could run in.
+    Updates without a user or chat (polls, for instance) only take a slot.
+    """
+
+    __slots__ = ('_lanes',)
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._lanes: Dict[int, _Lane] = {}
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Replaces the base class version, which takes a slot before
+        # do_process_update could wait for the user's turn
+        arrived = time.perf_counter()
+        key = ordering_key(update)
+        if key is None:
+            await self._run(update, coroutine, arrived)
+            return
+
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+        lane.users += 1
+        try:
+            with metrics.update_stage('waiting'):
+                await lane.lock.acquire()
+            try:
+                await self._run(update, coroutine, arrived)
+            finally:
+                lane.lock.release()
+        finally:
+            lane.users -= 1
+            if not lane.users:
+                del self._lanes[key]
+
+    async def _run(self, update: object, coroutine: Awaitable[Any], arrived: float) -> None:
+        with metrics.update_stage('queued'):
+            await self._semaphore.acquire()
+        try:
+            metrics.update_wait.observe(time.perf_counter() - arrived)
+            with metrics.update_stage('running'):
+                await self.do_process_update(update, coroutine)
+        finally:
+            self._semaphore.release()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        logger.info(f"Processing up to {self.max_concurrent_updates} updates concurrently, "
+                    "in order per user")
+
+    async def shutdown(self) -> None:
+        pass
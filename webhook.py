@@ -0,0 +1,215 @@
+"""
+Webhook server for ITCom Hackathons Bot
+Receives updates from Telegram over HTTPS instead of long polling
+
+Run ``python webhook.py feed <url> --count 100`` to push fake updates at a
+locally running webhook.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import logging
+import signal
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+from aiohttp import ClientSession, web
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import Application
+
+from config import BOT_TOKEN, WEBHOOK_SECRET
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookUnavailable(Exception):
+    """Raised when Telegram refuses the webhook, so the caller can fall back to polling"""
+
+
+def get_secret_token() -> str:
+    """Secret Telegram echoes back on every webhook request"""
+    if WEBHOOK_SECRET:
+        return WEBHOOK_SECRET
+    return hashlib.sha256(f"webhook:{BOT_TOKEN}".encode()).hexdigest()
+
+
+class WebhookServer:
+    """aiohttp receiver that validates and enqueues Telegram updates.
+
+    Each request is acknowledged as soon as its update is on the
+    application's update queue, so slow handlers never hold up Telegram's
+    delivery and requests are accepted concurrently.
+    """
+
+    def __init__(self, application: Application, secret_token: str,
+                 path: str = '/', host: str = '0.0.0.0', port: int = 8443):
+        self.application = application
+        self.secret_token = secret_token
+        self.path = path
+        self.host = host
+        self.port = port
+        self.received = 0
+        self.rejected = 0
+        self._runner: Optional[web.AppRunner] = None
+
+        self.app = web.Application()
+        self.app.router.add_post(path, self.handle_update)
+        self.app.router.add_get('/healthz', self.handle_health)
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(token, self.secret_token):
+            self.rejected += 1
+            return web.Response(status=403)
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except Exception as e:
+            logger.warning(f"Malformed webhook payload: {e}")
+            self.rejected += 1
+            return web.Response(status=400)
+
+        self.received += 1
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'received': self.received,
+            'rejected': self.rejected,
+            'queued': self.application.update_queue.qsize(),
+        })
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Webhook listening on {self.host}:{self.port}{self.path}")
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve(application: Application, url: str, port: int) -> None:
+    """Run the application on a webhook until SIGINT/SIGTERM.
+
+    Raises WebhookUnavailable before anything is started if Telegram
+    rejects the webhook URL.
+    """
+    secret_token = get_secret_token()
+
+    # Only the bot is needed to set the webhook. The application (and with it
+    # the database, which holds loop-bound pools and locks) is initialized
+    # after that, so falling back to polling on a new loop starts clean
+    await application.bot.initialize()
+    try:
+        await application.bot.set_webhook(
+            url=url,
+            secret_token=secret_token,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    except TelegramError as e:
+        await application.bot.shutdown()
+        raise WebhookUnavailable(str(e)) from e
+
+    await application.initialize()
+
+    server = WebhookServer(application, secret_token, urlparse(url).path or '/', port=port)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    await server.start()
+    try:
+        await stop.wait()
+    finally:
+        await server.stop()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run(application: Application, url: str, port: int) -> None:
+    """Serve on the webhook, falling back to long polling if it can't be set"""
+    try:
+        asyncio.run(serve(application, url, port))
+    except WebhookUnavailable as e:
+        logger.error(f"Webhook unavailable ({e}), falling back to polling")
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+
+
+# ============== FAKE UPDATE FEEDER ==============
+
+def fake_message_update(update_id: int, user_id: int, text: str) -> dict:
+    """Minimal Bot API payload of a private text message"""
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': user['first_name']},
+            'from': user,
+            'text': text,
+        },
+    }
+
+
+async def feed(url: str, secret_token: str, count: int, users: int = 100,
+               text: str = '/start', concurrency: int = 50) -> None:
+    """POST ``count`` fake updates to a webhook and print the outcome"""
+    counter = itertools.count(1)
+    statuses = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def post(session: ClientSession) -> None:
+        update_id = next(counter)
+        payload = fake_message_update(update_id, 100000 + update_id % users, text)
+        async with semaphore:
+            async with session.post(url, json=payload, headers={SECRET_HEADER: secret_token}) as resp:
+                statuses[resp.status] = statuses.get(resp.status, 0) + 1
+
+    started = time.monotonic()
+    async with ClientSession() as session:
+        await asyncio.gather(*(post(session) for _ in range(count)))
+    elapsed = time.monotonic() - started
+
+    print(f"{count} updates in {elapsed:.2f}s ({count / elapsed:.0f}/s), statuses: {statuses}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Webhook utilities')
+    sub = parser.add_subparsers(dest='command', required=True)
+    feeder = sub.add_parser('feed', help='send fake updates to a webhook')
+    feeder.add_argument('url')
+    feeder.add_argument('--count', type=int, default=100)
+    feeder.add_argument('--users', type=int, default=100)
+    feeder.add_argument('--text', default='/start')
+    feeder.add_argument('--concurrency', type=int, default=50)
+    feeder.add_argument('--secret', default=None)
+    args = parser.parse_args()
+
+    asyncio.run(feed(args.url, args.secret or get_secret_token(), args.count,
+                     args.users, args.text, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()